@@ -0,0 +1,187 @@
+'''
+Asyncio server mode: the same Socket.IO events and pages as main.py, served by
+python-socketio's AsyncServer under uvicorn instead of Flask-SocketIO on gunicorn + eventlet.
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT [--workers N]
+
+What the Socket.IO events do is in services.py, shared with main.py; the handlers here
+run on the event loop and hand anything that blocks to a thread pool (ASGI_THREADS
+threads): BB84 run inline on connect (in this process, or waiting for the QKD worker
+processes) and, with REDIS_URL set, room store round trips; the in-memory store answers
+inline. The pages are the Flask app of pages.py, run on the threads of
+uvicorn's WSGI adapter. Background components (key pool, reaper, coalescing, rotation)
+run on OS threads and send through LoopEmitter, which emits on the loop in order.
+
+The connection's session is the Flask session cookie of the page that opened the
+socket, decoded on connect and kept with the Socket.IO session (as Flask-SocketIO does).
+'''
+
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import socketio
+from itsdangerous import BadSignature
+from uvicorn.middleware.wsgi import WSGIMiddleware
+from werkzeug.http import parse_cookie
+
+import logs
+from metrics import count_emits
+from pages import create_app, register_pages
+from services import Services
+
+# Category loggers (see logs.py); levels, sampling and the async writer come from LOG_* variables:
+logs.configure()
+server_log = logging.getLogger("server")
+
+class LoopEmitter:
+    ''' emit(event, data, to=...) callable from the loop and from any thread. Emits are queued
+        and sent one after the other by a task on the loop, so events reach clients in the
+        order they were emitted, whichever thread they came from (as under eventlet).
+    '''
+
+    def __init__(self, server):
+        self.server = server
+        self.loop = None
+        self.thread = None
+        self._queue = None
+
+    def start(self):
+        # On the loop (the ASGI startup): binds to it and starts the sending task
+        self.loop = asyncio.get_running_loop()
+        self.thread = threading.get_ident()
+        self._queue = asyncio.Queue()
+        self._sender = self.loop.create_task(self._send()) # Referenced, the loop only keeps weak references to tasks
+
+    def __call__(self, event, data=None, **kwargs):
+        if threading.get_ident() == self.thread:
+            self._queue.put_nowait((event, data, kwargs))
+        else:
+            self.loop.call_soon_threadsafe(self._queue.put_nowait, (event, data, kwargs))
+
+    async def _send(self):
+        while True:
+            event, data, kwargs = await self._queue.get()
+            try:
+                await self.server.emit(event, data, **kwargs)
+            except Exception as error: # e.g. Redis unavailable; the next emits still go out
+                server_log.warning("emit failed event=%s error=%s", event, type(error).__name__)
+
+# Create an instance of the app (pages.py):
+flask_app = create_app()
+
+# With REDIS_URL set, emits go through Redis pub/sub, on the channel Flask-SocketIO uses, so
+# workers of either mode can serve the same rooms:
+redis_url = os.environ.get('REDIS_URL') or None
+# A client's events are handled one after the other (its messages stay in order, and a "rekeyAck" can't
+# overtake a message still waiting for Redis, see keyrotation.py); other clients' handlers run meanwhile:
+sio = socketio.AsyncServer(async_mode="asgi", async_handlers=False,
+                           client_manager=socketio.AsyncRedisManager(redis_url, channel="flask-socketio") if redis_url else None)
+emit = LoopEmitter(sio)
+
+# Room store, broadcaster, QKD and metrics components (services.py), running on OS threads:
+services = Services(emit=emit)
+count_emits(sio, services.socketio_emits)
+services.outbound.install(sio) # Bounded outbound queues (OUTBOUND_QUEUE_MAX)
+register_pages(flask_app, services)
+
+# Threads for the blocking work of the Socket.IO handlers:
+executor = ThreadPoolExecutor(max_workers=int(os.environ.get('ASGI_THREADS', 32)), thread_name_prefix="asgi")
+
+async def blocking(function, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(executor, partial(function, *args, **kwargs))
+
+async def store(method, *args):
+    # A call that waits on the room store at most: with Redis (round trips) it goes to the thread pool,
+    # the in-memory store answers inline
+    if redis_url:
+        return await blocking(method, *args)
+    return method(*args)
+
+def flask_session(environ):
+    # The Flask session of the page that opened the socket ({} without a valid cookie)
+    cookie = parse_cookie(environ).get(flask_app.config["SESSION_COOKIE_NAME"])
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if not cookie or serializer is None:
+        return {}
+    try:
+        return dict(serializer.loads(cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds())))
+    except BadSignature:
+        return {}
+
+# Socket.IO events (what they do is in services.py; see main.py for the flow). The services
+# calls block on the room store and QKD: they run through store() or blocking().
+
+@sio.on("connect")
+async def connect(sid, environ, auth=None):
+    session = flask_session(environ)
+    room = session.get("room")
+    name = session.get("name")
+
+    if not await store(services.admit, sid, room, name, session.get("is_new_room", False), services.client_address(environ)):
+        return False
+    session.pop("is_new_room", None)
+
+    # A pre-generated key from the pool, else BB84 on the thread pool (the loop keeps serving other connections)
+    key = await blocking(services.connect_key, sid, room, auth)
+    if key is None:
+        return False
+
+    # The room may have been terminated or reaped while the key was made: join only if it still exists
+    info = await store(services.join, sid, room, name, key)
+    if info is None:
+        raise socketio.exceptions.ConnectionRefusedError(*services.room_gone(room))
+
+    session["key"] = key
+    await sio.save_session(sid, session)
+
+    await sio.enter_room(sid, room)
+
+    services.joined(sid, room, name, key, info)
+    return True
+
+@sio.on("disconnect")
+async def disconnect(sid):
+    session = await sio.get_session(sid)
+    room = session.get("room")
+    name = session.get("name")
+    if room and name:
+        await sio.leave_room(sid, room)
+
+    await store(services.leave, sid, room, name)
+
+@sio.on("requestUserList")
+async def request_user_list(sid, data=None):
+    room = (await sio.get_session(sid)).get("room")
+    await store(services.user_list, sid, room)
+
+@sio.on("message")
+async def message(sid, data):
+    session = await sio.get_session(sid)
+    await store(services.message, sid, session.get("room"), session.get("name"), data)
+
+@sio.on("rekeyAck")
+async def rekey_ack(sid, data):
+    services.rekey_ack(sid, data)
+
+@sio.on("requestHistory")
+async def request_history(sid, data):
+    room = (await sio.get_session(sid)).get("room")
+    await store(services.history_page, sid, room, data)
+
+@sio.on("terminateRoom")
+async def terminate_room(sid, data=None):
+    session = await sio.get_session(sid)
+    await store(services.terminate, sid, session.get("room"), session.get("name"))
+
+loop_tasks = []
+
+async def startup():
+    emit.start()
+    services.start()
+    loop_tasks.append(asyncio.get_running_loop().create_task(services.loop_lag.run_async()))
+
+app = socketio.ASGIApp(sio, other_asgi_app=WSGIMiddleware(flask_app), on_startup=startup)
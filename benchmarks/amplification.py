@@ -0,0 +1,46 @@
+'''
+Benchmarks privacy amplification (qkd/amplification.py) on long keys: time to compress
+n reconciled bits (fed in chunks, as generate_key does) into an output key, and Mbit/sec
+of input, for each mode.
+
+Usage: python benchmarks/amplification.py [--lengths 10000 100000 1000000] [--ratio 0.5] [--chunk-bits 1000] [--modes toeplitz hash]
+'''
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qkd.amplification import AMPLIFIERS
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10000, 100000, 1000000], help="reconciled bits per key")
+    parser.add_argument("--ratio", type=float, default=0.5, help="output key length / reconciled bits")
+    parser.add_argument("--chunk-bits", type=int, default=1000, help="reconciled bits per update() call")
+    parser.add_argument("--modes", nargs="+", default=list(AMPLIFIERS), choices=list(AMPLIFIERS))
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"ratio={args.ratio} chunk_bits={args.chunk_bits} runs={args.runs}")
+    print(f"{'bits in':>9} {'bits out':>9} {'mode':>9} {'ms/key':>9} {'Mbit/s':>8}")
+    for length in args.lengths:
+        chunks = [chunk.tolist() for chunk in np.array_split(rng.integers(0, 2, length), max(1, length // args.chunk_bits))]
+        output = max(1, int(length * args.ratio))
+        for mode in args.modes:
+            started = time.perf_counter()
+            for _ in range(args.runs):
+                amplifier = AMPLIFIERS[mode]()
+                for chunk in chunks:
+                    amplifier.update(chunk)
+                assert len(amplifier.bits(output)) == output
+            elapsed = (time.perf_counter() - started) / args.runs
+            print(f"{length:>9} {output:>9} {mode:>9} {elapsed * 1000:>9.2f} {length / elapsed / 1e6:>8.2f}")
+
+if __name__ == "__main__":
+    main()
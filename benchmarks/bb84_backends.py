@@ -0,0 +1,81 @@
+'''
+Compares the "qiskit" and "numpy" BB84 distribution backends (qkd/backends.py):
+
+1) Statistical equivalence - over many runs, the fraction of matching bases, the
+   error rate on matching bases (what QBER estimates) and the fraction of 1s Bob
+   receives must agree between backends (two-proportion z-test).
+2) Throughput - distributions/sec and full keys/sec for each backend.
+
+Usage: python benchmarks/bb84_backends.py [--runs 2000] [--keys 200]
+Exits with status 1 if the backends are not statistically equivalent.
+'''
+
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qkd import BACKENDS, generate_key
+
+QUBITS = 24 # Per distribution run; the statistics are pooled over the runs
+Z_LIMIT = 4.0 # |z| above this is treated as a real difference between backends
+
+def collect(distribute, runs):
+    # Counts pooled over all runs:
+    matched = errors = ones = 0
+    for _ in range(runs):
+        send_list, alice_basis, bob_basis, received = distribute(QUBITS)
+        for bit, a, b, r in zip(send_list, alice_basis, bob_basis, received):
+            ones += r
+            if a == b:
+                matched += 1
+                errors += bit != r
+    total = runs * QUBITS
+    return {
+        "matched": (matched, total),
+        "error_rate": (errors, matched),
+        "ones": (ones, total),
+    }
+
+def z_score(a, b):
+    (x1, n1), (x2, n2) = a, b
+    pooled = (x1 + x2) / (n1 + n2)
+    spread = math.sqrt(pooled * (1 - pooled) * (1/n1 + 1/n2))
+    return 0.0 if spread == 0 else (x1/n1 - x2/n2) / spread
+
+def keys_per_second(backend, keys):
+    started = time.perf_counter()
+    for _ in range(keys):
+        generate_key(backend=backend)
+    return keys / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=2000, help="distributions per backend for the equivalence check")
+    parser.add_argument("--keys", type=int, default=200, help="full keys per backend for keys/sec")
+    args = parser.parse_args()
+
+    stats = {}
+    print(f"{'backend':<8} {'dist/s':>10} {'keys/s':>10} {'matched':>9} {'error rate':>11} {'ones':>7}")
+    for name, distribute in BACKENDS.items():
+        started = time.perf_counter()
+        stats[name] = collect(distribute, args.runs)
+        dist_rate = args.runs / (time.perf_counter() - started)
+        key_rate = keys_per_second(name, args.keys)
+        ratio = {stat: x / n for stat, (x, n) in stats[name].items()}
+        print(f"{name:<8} {dist_rate:>10.1f} {key_rate:>10.1f} {ratio['matched']:>9.4f} {ratio['error_rate']:>11.4f} {ratio['ones']:>7.4f}")
+
+    equivalent = True
+    for stat in stats["qiskit"]:
+        z = z_score(stats["qiskit"][stat], stats["numpy"][stat])
+        ok = abs(z) < Z_LIMIT
+        equivalent &= ok
+        print(f"{stat:<11} z = {z:+.2f} {'ok' if ok else 'MISMATCH'}")
+
+    sys.exit(0 if equivalent else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+'''
+Benchmarks BICONF (qkd/biconf.py) on large keys: rounds/sec and key Mbit/sec for each
+key length, next to the previous list-based implementation (kept below as a reference
+for keys up to --legacy-max bits). Both report the average number of errors found per
+run, which should agree.
+
+Usage: python benchmarks/biconf.py [--lengths 10000 100000 1000000] [--qber 0.02] [--rounds 8] [--subset-size N] [--runs 20]
+'''
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qkd.biconf import DEFAULT_ROUNDS, biconf, default_subset_size
+
+def legacy_biconf(kFinalA, kFinalB, rounds, biconfBlockSize):
+    # The list-based BICONF this module replaced (bisection on (index, (bitA, bitB)) tuples)
+    error = 0
+    for _ in range(rounds):
+        randomBlock = random.sample(list(enumerate(zip(kFinalA, kFinalB))), biconfBlockSize)
+        if sum(pair[1][0] for pair in randomBlock) % 2 != sum(pair[1][1] for pair in randomBlock) % 2:
+            while len(randomBlock) > 1:
+                half = len(randomBlock) // 2 + len(randomBlock) % 2
+                for block in (randomBlock[:half], randomBlock[half:]):
+                    if sum(pair[1][0] for pair in block) % 2 != sum(pair[1][1] for pair in block) % 2:
+                        randomBlock = block
+            errorIndex = randomBlock[0][0]
+            kFinalB[errorIndex] = 1 - kFinalB[errorIndex]
+            error += 1
+    return error
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10000, 100000, 1000000], help="key lengths in bits")
+    parser.add_argument("--qber", type=float, default=0.02, help="error rate left in the key (and used to size subsets)")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS)
+    parser.add_argument("--subset-size", type=int, default=None, help="bits per subset (default: from --qber)")
+    parser.add_argument("--runs", type=int, default=20, help="runs per key length")
+    parser.add_argument("--legacy-max", type=int, default=100000, help="longest key to run the list-based version on")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    random.seed(args.seed)
+    print(f"qber={args.qber} rounds={args.rounds} runs={args.runs}")
+    print(f"{'bits':>8} {'subset':>7} {'impl':>7} {'ms/run':>9} {'rounds/s':>10} {'Mbit/s':>8} {'errors found':>13}")
+    for length in args.lengths:
+        size = args.subset_size or default_subset_size(args.qber, length)
+        keys = []
+        for _ in range(args.runs):
+            alice = rng.integers(0, 2, length, dtype=np.uint8)
+            keys.append((alice, alice ^ (rng.random(length) < args.qber).astype(np.uint8)))
+
+        results = {}
+        started = time.perf_counter()
+        found = sum(len(biconf(alice, bob, args.qber, args.rounds, size, rng)[1]["corrections"]) for alice, bob in keys)
+        results["arrays"] = (time.perf_counter() - started, found)
+
+        if length <= args.legacy_max:
+            lists = [(alice.tolist(), bob.tolist()) for alice, bob in keys]
+            started = time.perf_counter()
+            found = sum(legacy_biconf(alice, bob, args.rounds, size) for alice, bob in lists)
+            results["lists"] = (time.perf_counter() - started, found)
+
+        for name, (elapsed, found) in results.items():
+            print(f"{length:>8} {size:>7} {name:>7} {elapsed / args.runs * 1000:>9.3f} {args.rounds * args.runs / elapsed:>10.0f} "
+                  f"{length * args.runs / elapsed / 1e6:>8.1f} {found / args.runs:>13.2f}")
+
+if __name__ == "__main__":
+    main()
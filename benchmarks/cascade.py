@@ -0,0 +1,49 @@
+'''
+Benchmarks the Cascade reconciliation engine (qkd/cascade.py) across key lengths and
+error rates: time per run, bits corrected, parity bits leaked and errors left over.
+
+Usage: python benchmarks/cascade.py [--lengths 1000 10000 100000] [--qber 0.01 0.05 0.1] [--passes 4] [--runs 5]
+'''
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qkd.cascade import DEFAULT_PASSES, cascade
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[1000, 10000, 100000], help="key lengths in bits")
+    parser.add_argument("--qber", type=float, nargs="+", default=[0.01, 0.05, 0.1], help="channel error rates")
+    parser.add_argument("--passes", type=int, default=DEFAULT_PASSES)
+    parser.add_argument("--runs", type=int, default=5, help="runs per combination")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"passes={args.passes} runs={args.runs}")
+    print(f"{'bits':>7} {'qber':>5} {'ms/run':>8} {'Mbit/s':>7} {'corrected':>10} {'leaked/bit':>10} {'residual':>9} {'failed runs':>11}")
+    for length in args.lengths:
+        for qber in args.qber:
+            totals = {"corrections": 0, "leaked_bits": 0, "residual_errors": 0}
+            failed = elapsed = 0
+            for _ in range(args.runs):
+                alice = rng.integers(0, 2, length, dtype=np.uint8)
+                bob = alice ^ (rng.random(length) < qber).astype(np.uint8)
+                started = time.perf_counter()
+                _, info = cascade(alice, bob, qber, passes=args.passes, rng=rng)
+                elapsed += time.perf_counter() - started
+                for name in totals:
+                    totals[name] += info[name]
+                failed += info["residual_errors"] > 0
+            print(f"{length:>7} {qber:>5} {elapsed / args.runs * 1000:>8.2f} {length * args.runs / elapsed / 1e6:>7.2f} "
+                  f"{totals['corrections'] / args.runs:>10.1f} {totals['leaked_bits'] / (length * args.runs):>10.3f} "
+                  f"{totals['residual_errors'] / args.runs:>9.2f} {failed:>11}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+'''
+Helpers shared by the load benchmarks: start the server the way the Procfile does
+(gunicorn + eventlet workers), or the asyncio mode under uvicorn (asgi.py), and drive it
+like the browser in room.html does.
+'''
+
+import base64
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class Server:
+    ''' Runs main:app under gunicorn with eventlet workers (one, as deployed, unless REDIS_URL is set),
+        or asgi:app under uvicorn with mode="asgi".
+    '''
+
+    COMMANDS = {
+        "eventlet": lambda port, workers: ["gunicorn", "--worker-class", "eventlet", "-w", str(workers),
+                                           "--bind", f"127.0.0.1:{port}", "main:app"],
+        "asgi": lambda port, workers: ["uvicorn", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+                                       "--log-level", "warning", "asgi:app"],
+    }
+
+    def __init__(self, env=None, port=None, workers=1, mode="eventlet"):
+        self.port = port or free_port()
+        self.workers = workers
+        self.mode = mode
+        self.url = f"http://127.0.0.1:{self.port}"
+        # Rate limits off unless a benchmark sets them: load tests send faster than one person types
+        self.env = {**os.environ, "RATE_LIMITS": "0", **(env or {})}
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", *self.COMMANDS[self.mode](self.port, self.workers)],
+            cwd=ROOT, env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 120
+        while time.monotonic() < deadline:
+            try:
+                requests.get(self.url + "/", timeout=1)
+                return self
+            except (requests.ConnectionError, requests.Timeout): # Workers may accept before they finish booting
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError("Server did not start")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+def xor_encrypt(message, binary_key):
+    # Mirrors binaryToAscii + xorEncrypt in room.html
+    key = [int(binary_key[i:i+8], 2) for i in range(0, len(binary_key), 8)]
+    return base64.b64encode(bytes((ord(ch) ^ key[i % len(key)]) & 0xFF for i, ch in enumerate(message))).decode()
+
+class ChatClient:
+    ''' One browser tab: home POST -> /room -> socket connect -> key -> encrypted messages. '''
+
+    def __init__(self, url, name):
+        self.url = url
+        self.name = name
+        self.http = requests.Session()
+        self.sio = socketio.Client(reconnection=False)
+        self.room = None
+        self.key = None
+        self.epoch = 0 # Key rotation epoch (KEY_ROTATE_*), swapped together with the key
+        self.rekeys = 0
+        self.key_event = threading.Event()
+        self.connect_latency = None # Seconds from socket connect to receiving the key
+        self.on_message = None
+        self.sio.on("key", self._on_key)
+        self.sio.on("rekey", self._on_rekey)
+        self.sio.on("message", self._on_message)
+        self.sio.on("messages", self._on_messages) # Coalesced (ROOM_COALESCE_MS), unpacked as room.html does
+        self.frames = 0 # "message"/"messages" events received
+
+    def create_room(self):
+        self.http.post(self.url + "/", data={"name": self.name, "create": ""}, allow_redirects=False)
+        return self._enter()
+
+    def join_room(self, code):
+        self.http.post(self.url + "/", data={"name": self.name, "code": code, "join": ""}, allow_redirects=False)
+        return self._enter()
+
+    def _enter(self):
+        page = self.http.get(self.url + "/room")
+        marker = "Chat Room: "
+        start = page.text.index(marker) + len(marker)
+        self.room = page.text[start:page.text.index("<", start)].strip()
+        return self.room
+
+    def connect(self, timeout=120):
+        cookie = "; ".join(f"{k}={v}" for k, v in self.http.cookies.items())
+        started = time.perf_counter()
+        self.sio.connect(self.url, headers={"Cookie": cookie}, transports=["websocket"], wait_timeout=timeout)
+        if not self.key_event.wait(timeout):
+            raise TimeoutError(f"{self.name} received no key")
+        self.connect_latency = time.perf_counter() - started
+
+    def send(self, text):
+        key, epoch = self._keying
+        self.sio.emit("message", {"message": xor_encrypt(text, key), "epoch": epoch})
+
+    def disconnect(self):
+        self.sio.disconnect()
+
+    def _on_key(self, key):
+        self.key, self.epoch = key, 0
+        self._keying = (key, 0)
+        self.key_event.set()
+
+    def _on_rekey(self, data):
+        # As room.html: send with the new key from now on, then confirm the switch
+        self.key, self.epoch = data["key"], data["epoch"]
+        self._keying = (data["key"], data["epoch"]) # One assignment, so send() never mixes key and epoch
+        self.rekeys += 1
+        self.sio.emit("rekeyAck", {"epoch": data["epoch"]})
+
+    def _on_message(self, data):
+        self.frames += 1
+        if self.on_message is not None:
+            self.on_message(data)
+
+    def _on_messages(self, batch):
+        self.frames += 1
+        if self.on_message is not None:
+            for data in batch:
+                self.on_message(data)
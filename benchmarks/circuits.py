@@ -0,0 +1,110 @@
+'''
+BB84 circuit construction: cached parameterized templates vs building every circuit.
+
+"before" is how each session's circuit used to be made (kept here as the reference):
+Alice's x/h gates in her own circuit, serialized to OpenQASM 3 and parsed back gate by
+gate into Bob's circuit, with the channel's bit/phase-flip errors added as extra x/z
+gates. "after" is qkd.backends.build_circuits: the session's bits and bases bound as
+angles into the template for that qubit count (qkd.backends.CircuitTemplate), with the
+channel as an Aer noise model. The template itself is built once per qubit count; its
+cost is reported separately ("template").
+
+Also times running the circuit on Aer, so the per-distribution total can be compared.
+
+Usage: python benchmarks/circuits.py [--qubits 24 64 256] [--runs 200]
+'''
+
+import argparse
+import os
+import sys
+import time
+from random import randrange
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qkd.backends import build_circuits, circuit_template, simulator
+
+def legacy_build(n_qubits):
+    # The per-session construction the templates replaced
+    from qiskit import QuantumRegister, ClassicalRegister, QuantumCircuit, qasm3
+
+    qreg = QuantumRegister(n_qubits)
+    creg = ClassicalRegister(n_qubits)
+    alice = QuantumCircuit(qreg, creg, name='alice')
+    send_list = [randrange(2) for _ in range(n_qubits)]
+    for i, bit in enumerate(send_list):
+        if bit == 1:
+            alice.x(qreg[i])
+    alice_basis = []
+    for i in range(n_qubits):
+        if randrange(2) == 0:
+            alice_basis.append('Z')
+        else:
+            alice.h(qreg[i])
+            alice_basis.append('X')
+
+    bob = QuantumCircuit(qreg, creg, name='bob')
+    instructions = [instruction.lstrip() for instruction in qasm3.dumps(alice).split(sep=';')[4:-1]]
+    for instruction in instructions:
+        index = int(instruction[instruction.index('[')+1:-1])
+        if instruction[0] == 'x':
+            bob.x(qreg[index])
+        elif instruction[0] == 'h':
+            bob.h(qreg[index])
+    for instruction in instructions:
+        index = int(instruction[instruction.index('[')+1:-1])
+        if randrange(7) < 1:
+            bob.x(qreg[index])
+        if randrange(7) < 1:
+            bob.z(qreg[index])
+
+    bob_basis = []
+    for i in range(n_qubits):
+        if randrange(2) == 0:
+            bob.measure(qreg[i], creg[i])
+            bob_basis.append('Z')
+        else:
+            bob.h(qreg[i])
+            bob.measure(qreg[i], creg[i])
+            bob_basis.append('X')
+    return send_list, alice_basis, bob_basis, bob
+
+def per_call(run, runs):
+    # Mean seconds per call, after one untimed call
+    run()
+    started = time.perf_counter()
+    for _ in range(runs):
+        run()
+    return (time.perf_counter() - started) / runs
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--qubits", type=int, nargs="+", default=[24, 64, 256])
+    parser.add_argument("--runs", type=int, default=200, help="circuits built per measurement")
+    args = parser.parse_args()
+
+    from qiskit_aer import AerSimulator
+    legacy_simulator = AerSimulator() # As before: Aer picks the (stabilizer) method itself
+
+    print(f"{'qubits':>6} {'template ms':>12} {'build before':>13} {'build after':>12} {'speedup':>8} "
+          f"{'run before':>11} {'run after':>10} {'dist/s before':>14} {'dist/s after':>13}")
+    for n_qubits in args.qubits:
+        started = time.perf_counter()
+        circuit_template(n_qubits)
+        template = time.perf_counter() - started
+
+        build_before = per_call(lambda: legacy_build(n_qubits), args.runs)
+        build_after = per_call(lambda: build_circuits(n_qubits), args.runs)
+
+        before_circuit = legacy_build(n_qubits)[3]
+        after_circuit = build_circuits(n_qubits)[3]
+        runs = max(args.runs // 4, 5)
+        run_before = per_call(lambda: legacy_simulator.run(before_circuit, shots=1).result(), runs)
+        run_after = per_call(lambda: simulator().run(after_circuit, shots=1).result(), runs)
+
+        print(f"{n_qubits:>6} {1000 * template:>12.2f} {1000 * build_before:>10.3f} ms {1000 * build_after:>9.3f} ms "
+              f"{build_before / build_after:>7.1f}x {1000 * run_before:>8.3f} ms {1000 * run_after:>7.3f} ms "
+              f"{1 / (build_before + run_before):>14.1f} {1 / (build_after + run_after):>13.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+'''
+Measures how much key generation stalls chat in other rooms.
+
+A "pinger" sits in its own room and keeps sending messages, timing how long each
+takes to come back, while "churn" clients keep creating rooms and connecting (each
+connect runs a full BB84 exchange, the key pool is disabled). This is run with QKD
+in the server process (QKD_PROCESSES=0) and in worker processes, and the pinger's
+round-trip latencies are compared.
+
+Usage: python benchmarks/event_loop_latency.py [--duration 10] [--churn 4] [--processes 2]
+'''
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from chat_client import ChatClient, Server
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else float("nan")
+
+def run(env, duration, churn, interval):
+    with Server(env=env) as server:
+        pinger = ChatClient(server.url, "pinger")
+        pinger.create_room()
+        pinger.connect()
+
+        sent = {}
+        rtts = []
+        def on_message(data):
+            started = sent.pop(data.get("message"), None)
+            if started is not None:
+                rtts.append(time.perf_counter() - started)
+        pinger.on_message = on_message
+
+        stop = threading.Event()
+        connects = []
+        failures = []
+        def churner(n):
+            i = 0
+            while not stop.is_set():
+                client = ChatClient(server.url, f"churn{n}-{i}")
+                try:
+                    client.create_room()
+                    client.connect()
+                    connects.append(client.connect_latency)
+                except Exception as error:
+                    failures.append(error)
+                client.disconnect()
+                i += 1
+        threads = [threading.Thread(target=churner, args=(n,), daemon=True) for n in range(churn)]
+        for thread in threads:
+            thread.start()
+
+        deadline = time.perf_counter() + duration
+        seq = 0
+        while time.perf_counter() < deadline:
+            text = f"ping {seq}"
+            sent[text] = time.perf_counter()
+            pinger.send(text)
+            seq += 1
+            time.sleep(interval)
+        time.sleep(1) # Let the last echoes arrive
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=60)
+        pinger.disconnect()
+
+    return {
+        "pings": seq,
+        "lost": len(sent),
+        "rtt_ms": {p: 1000 * percentile(rtts, p) for p in (50, 95, 99, 100)},
+        "connects": len(connects),
+        "failed": len(failures),
+        "connect_ms": 1000 * statistics.mean(connects) if connects else float("nan"),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=10, help="seconds to measure each mode")
+    parser.add_argument("--churn", type=int, default=4, help="clients continuously connecting to new rooms")
+    parser.add_argument("--processes", type=int, default=2, help="QKD_PROCESSES for the worker-process mode")
+    parser.add_argument("--interval", type=float, default=0.02, help="seconds between pings")
+    parser.add_argument("--backend", default="qiskit")
+    args = parser.parse_args()
+
+    modes = {
+        "in-process": "0",
+        f"{args.processes} processes": str(args.processes),
+    }
+    results = {}
+    print(f"{'mode':<14} {'pings':>6} {'lost':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'connects':>9} {'failed':>7} {'connect ms':>11}")
+    for mode, processes in modes.items():
+        env = {"QKD_PROCESSES": processes, "QKD_POOL_SIZE": "0", "QKD_BACKEND": args.backend, "QKD_TIMEOUT": "5"}
+        result = results[mode] = run(env, args.duration, args.churn, args.interval)
+        rtt = result["rtt_ms"]
+        print(f"{mode:<14} {result['pings']:>6} {result['lost']:>5} {rtt[50]:>8.1f} {rtt[95]:>8.1f} {rtt[99]:>8.1f} {rtt[100]:>8.1f} {result['connects']:>9} {result['failed']:>7} {result['connect_ms']:>11.1f}")
+
+    before, after = (results[mode]["rtt_ms"] for mode in modes)
+    for p in (50, 95, 99):
+        print(f"p{p} message latency in other rooms: {before[p]:.1f} ms -> {after[p]:.1f} ms ({before[p] / after[p]:.1f}x)")
+
+if __name__ == "__main__":
+    main()
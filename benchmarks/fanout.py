@@ -0,0 +1,100 @@
+'''
+Measures room fan-out with outbound coalescing off and on (ROOM_COALESCE_MS).
+
+Puts --clients clients in one room, has --senders of them send --messages messages each
+as fast as they can, and times how long it takes until every client has received every
+message. Reports deliveries/sec, the websocket events ("frames") each client received,
+and message latency from send to receipt.
+
+Usage: python benchmarks/fanout.py [--clients 20] [--senders 5] [--messages 200] [--windows 0 5 20]
+'''
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from chat_client import ChatClient, Server
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else float("nan")
+
+def run(window_ms, clients, senders, messages, max_batch, timeout=120):
+    env = {"QKD_BACKEND": "numpy", "QKD_POOL_SIZE": "8", "ROOM_COALESCE_MS": str(window_ms),
+           "ROOM_COALESCE_MAX": str(max_batch), "HISTORY_SIZE": "100"}
+    with Server(env=env) as server:
+        expected = senders * messages
+        lock = threading.Lock()
+        done = threading.Event()
+        received = {}
+        latencies = []
+
+        members = []
+        for i in range(clients):
+            client = ChatClient(server.url, f"user{i}")
+            client.create_room() if i == 0 else client.join_room(members[0].room)
+            received[client.name] = 0
+            def on_message(data, name=client.name):
+                text = data.get("message", "")
+                if not text.startswith("bench "):
+                    return
+                now = time.perf_counter()
+                with lock:
+                    latencies.append(now - float(text.split()[1]))
+                    received[name] += 1
+                    if all(count >= expected for count in received.values()):
+                        done.set()
+            client.on_message = on_message
+            client.connect()
+            members.append(client)
+        time.sleep(0.5)
+        for client in members:
+            client.frames = 0
+
+        def send_all(client):
+            for _ in range(messages):
+                client.send(f"bench {time.perf_counter():.6f}")
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=send_all, args=(client,)) for client in members[:senders]]
+        for thread in threads:
+            thread.start()
+        delivered = done.wait(timeout)
+        elapsed = time.perf_counter() - started
+        frames = sum(client.frames for client in members) / clients
+
+        for thread in threads:
+            thread.join()
+        for client in members:
+            client.disconnect()
+
+    return {
+        "delivered": delivered,
+        "deliveries_per_s": clients * expected / elapsed if delivered else float("nan"),
+        "frames_per_client": frames,
+        "latency_ms": {p: 1000 * percentile(latencies, p) for p in (50, 95, 99)},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=20, help="clients in the room")
+    parser.add_argument("--senders", type=int, default=5, help="clients sending messages")
+    parser.add_argument("--messages", type=int, default=200, help="messages per sender")
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 5, 20], help="ROOM_COALESCE_MS values (0 = off)")
+    parser.add_argument("--max-batch", type=int, default=32, help="ROOM_COALESCE_MAX")
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients, {args.senders} senders x {args.messages} messages")
+    print(f"{'window ms':>9} {'delivered':>9} {'deliveries/s':>13} {'frames/client':>14} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for window in args.windows:
+        result = run(window, args.clients, args.senders, args.messages, args.max_batch)
+        latency = result["latency_ms"]
+        print(f"{window:>9g} {str(result['delivered']):>9} {result['deliveries_per_s']:>13.0f} "
+              f"{result['frames_per_client']:>14.0f} {latency[50]:>8.1f} {latency[95]:>8.1f} {latency[99]:>8.1f}")
+
+if __name__ == "__main__":
+    main()
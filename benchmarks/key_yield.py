@@ -0,0 +1,45 @@
+'''
+Reports key yield for different final key lengths: how many qubits and chunks each
+key needs, and how many keys / secure key bits per second one core produces (secure bits
+being the estimate each key is sized from, see qkd.amplification.secure_length).
+
+Usage: python benchmarks/key_yield.py [--lengths 256 1024 4096 16384] [--chunk-qubits 1024] [--backend numpy] [--amplification hash] [--keys 5]
+'''
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qkd import generate_key
+from qkd.bb84 import N_QUBITS
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[256, 1024, 4096, 16384], help="final key lengths in bits")
+    parser.add_argument("--chunk-qubits", type=int, default=N_QUBITS, help="qubits simulated per chunk")
+    parser.add_argument("--backend", default="numpy")
+    parser.add_argument("--amplification", default="hash", help="privacy amplification mode")
+    parser.add_argument("--keys", type=int, default=5, help="keys generated per length")
+    args = parser.parse_args()
+
+    print(f"backend={args.backend} chunk_qubits={args.chunk_qubits} amplification={args.amplification}")
+    print(f"{'bits':>7} {'qubits/key':>11} {'chunks/key':>11} {'aborted':>8} {'leaked/key':>11} {'keys/s':>9} {'secure bits/s':>14}")
+    for length in args.lengths:
+        totals = {"chunks": 0, "aborted": 0, "qubits": 0, "leaked_bits": 0, "secure_bits": 0}
+        started = time.perf_counter()
+        for _ in range(args.keys):
+            stats = {}
+            generate_key(backend=args.backend, key_length=length, chunk_qubits=args.chunk_qubits,
+                         amplification=args.amplification, stats=stats)
+            for name in totals:
+                totals[name] += stats[name]
+        elapsed = time.perf_counter() - started
+        print(f"{length:>7} {totals['qubits'] / args.keys:>11.0f} {totals['chunks'] / args.keys:>11.1f} "
+              f"{totals['aborted'] / totals['chunks']:>8.1%} {totals['leaked_bits'] / args.keys:>11.0f} "
+              f"{args.keys / elapsed:>9.2f} {totals['secure_bits'] / elapsed:>14.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+'''
+Load test: N rooms x M clients against a local server.
+
+Starts the app under gunicorn + eventlet (as in the Procfile) and runs --rooms rooms of
+--clients clients each. Every client goes through the real flow: home POST (create or
+join) -> /room -> socket connect -> QKD key -> XOR-encrypted "message" events. Clients
+join concurrently, then each sends --messages messages at --rate messages/sec.
+
+Reports connect latency (socket connect until the key arrives, i.e. the QKD exchange)
+percentiles, end-to-end message latency (send until each room member receives it) and
+messages/sec sent and delivered. Results are written as JSON (--output) so runs can be
+compared: --compare old.json prints the change of every metric against an earlier run.
+
+Usage: python benchmarks/load.py [--rooms 5] [--clients 4] [--messages 20] [--rate 5]
+                                 [--env QKD_BACKEND=numpy ...] [--output load.json] [--compare old.json]
+'''
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from chat_client import ROOT, ChatClient, Server
+
+PERCENTILES = (50, 90, 95, 99)
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else None
+
+def summarize(seconds):
+    # Latencies in ms: count, mean, percentiles and max
+    if not seconds:
+        return {"count": 0}
+    ms = [1000 * value for value in seconds]
+    summary = {"count": len(ms), "mean": round(sum(ms) / len(ms), 2)}
+    summary.update({f"p{p}": round(percentile(ms, p), 2) for p in PERCENTILES})
+    summary["max"] = round(max(ms), 2)
+    return summary
+
+class Room:
+    ''' One room's clients and what they received. '''
+
+    def __init__(self, index):
+        self.index = index
+        self.clients = []
+        self.lock = threading.Lock()
+        self.sent = {} # message id -> send time
+        self.latencies = []
+        self.deliveries = 0
+
+    def on_message(self, data):
+        text = data.get("message", "")
+        if not text.startswith("load "):
+            return
+        received = time.perf_counter()
+        with self.lock:
+            sent = self.sent.get(text.split()[1])
+            if sent is not None:
+                self.latencies.append(received - sent)
+                self.deliveries += 1
+
+def run(url, rooms, clients, messages, rate, join_concurrency):
+    rooms = [Room(i) for i in range(rooms)]
+    failures = []
+
+    def join(room, i):
+        client = ChatClient(url, f"r{room.index}c{i}")
+        client.on_message = room.on_message
+        try:
+            client.create_room() if i == 0 else client.join_room(room.clients[0].room)
+            client.connect()
+        except Exception as error:
+            failures.append(f"{client.name}: {type(error).__name__}: {error}")
+            return None
+        return client
+
+    # Creators first (the others need their room codes), then everyone else concurrently
+    started = time.perf_counter()
+    with ThreadPoolExecutor(join_concurrency) as pool:
+        for room, client in zip(rooms, pool.map(lambda room: join(room, 0), rooms)):
+            if client is not None:
+                room.clients.append(client)
+        jobs = [(room, pool.submit(join, room, i)) for room in rooms if room.clients for i in range(1, clients)]
+        for room, job in jobs:
+            client = job.result()
+            if client is not None:
+                room.clients.append(client)
+    join_time = time.perf_counter() - started
+    connected = [client for room in rooms for client in room.clients]
+    time.sleep(0.5) # Let join notices settle before timing messages
+
+    def send_all(room, client):
+        interval = 1 / rate if rate > 0 else 0
+        next_send = time.perf_counter()
+        for n in range(messages):
+            message_id = f"{client.name}-{n}"
+            with room.lock:
+                room.sent[message_id] = time.perf_counter()
+            client.send(f"load {message_id}")
+            next_send += interval
+            time.sleep(max(0.0, next_send - time.perf_counter()))
+
+    started = time.perf_counter()
+    senders = [threading.Thread(target=send_all, args=(room, client)) for room in rooms for client in room.clients]
+    for sender in senders:
+        sender.start()
+    for sender in senders:
+        sender.join()
+    send_time = time.perf_counter() - started
+
+    # Wait (bounded) for the last deliveries
+    expected = sum(len(room.clients) ** 2 * messages for room in rooms)
+    deadline = time.monotonic() + 30
+    while sum(room.deliveries for room in rooms) < expected and time.monotonic() < deadline:
+        time.sleep(0.05)
+    total_time = time.perf_counter() - started
+
+    for client in connected:
+        try:
+            client.disconnect()
+        except Exception:
+            pass
+
+    sent = sum(len(room.sent) for room in rooms)
+    delivered = sum(room.deliveries for room in rooms)
+    return {
+        "clients": len(connected),
+        "connect_failures": len(failures),
+        "failures": failures[:10],
+        "join_seconds": round(join_time, 3),
+        "connect_latency_ms": summarize([client.connect_latency for client in connected]),
+        "message_latency_ms": summarize([latency for room in rooms for latency in room.latencies]),
+        "messages_sent": sent,
+        "deliveries_expected": expected,
+        "deliveries": delivered,
+        "delivery_ratio": round(delivered / expected, 4) if expected else None,
+        "messages_per_s": round(sent / send_time, 1) if send_time else None,
+        "deliveries_per_s": round(delivered / total_time, 1) if total_time else None,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def flatten(data, prefix=""):
+    # {"a": {"b": 1}} -> {"a.b": 1}, numbers only
+    flat = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+def compare(old, new):
+    before, after = flatten(old["results"]), flatten(new["results"])
+    print(f"\nCompared with {old.get('commit') or '?'} ({old.get('timestamp', '?')}):")
+    print(f"{'metric':<30} {'before':>12} {'after':>12} {'change':>9}")
+    for metric in after:
+        if metric not in before:
+            continue
+        change = f"{100 * (after[metric] - before[metric]) / before[metric]:+.1f}%" if before[metric] else ""
+        print(f"{metric:<30} {before[metric]:>12g} {after[metric]:>12g} {change:>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=5)
+    parser.add_argument("--clients", type=int, default=4, help="clients per room")
+    parser.add_argument("--messages", type=int, default=20, help="messages sent by each client")
+    parser.add_argument("--rate", type=float, default=5, help="messages/sec per client (0 = as fast as possible)")
+    parser.add_argument("--join-concurrency", type=int, default=16, help="clients joining at the same time")
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn workers (more than one needs REDIS_URL in --env)")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="server environment variable (repeatable)")
+    parser.add_argument("--url", help="drive an already running server instead of starting one")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    env = dict(item.split("=", 1) for item in args.env)
+    config = {key: getattr(args, key) for key in ("rooms", "clients", "messages", "rate", "join_concurrency", "workers")}
+    print(f"{args.rooms} rooms x {args.clients} clients, {args.messages} messages each at {args.rate}/s, env {env or '{}'}")
+
+    if args.url:
+        results = run(args.url, args.rooms, args.clients, args.messages, args.rate, args.join_concurrency)
+    else:
+        with Server(env=env, workers=args.workers) as server:
+            results = run(server.url, args.rooms, args.clients, args.messages, args.rate, args.join_concurrency)
+
+    connect, message = results["connect_latency_ms"], results["message_latency_ms"]
+    print(f"clients connected      {results['clients']} ({results['connect_failures']} failed) in {results['join_seconds']} s")
+    for label, latency in (("connect latency ms", connect), ("message latency ms", message)):
+        if latency["count"]:
+            print(f"{label:<22} " + "  ".join(f"{key} {latency[key]}" for key in ("mean", *(f"p{p}" for p in PERCENTILES), "max")))
+    print(f"messages/s sent        {results['messages_per_s']}")
+    print(f"deliveries/s           {results['deliveries_per_s']} ({results['deliveries']}/{results['deliveries_expected']} delivered)")
+    for failure in results["failures"]:
+        print(f"  failed: {failure}")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "config": config,
+        "env": env,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
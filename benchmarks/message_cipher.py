@@ -0,0 +1,59 @@
+'''
+Benchmarks the server side of the "message" event: decrypting Base64 XOR-encrypted
+messages of 10 B to 1 MB with the per-connection cached key bytes and whole-buffer XOR
+(qkd/cipher.py), next to the previous per-message key derivation and per-character
+chr() loop (kept below as a reference). Reports messages/sec and MB/sec.
+
+Usage: python benchmarks/message_cipher.py [--sizes 10 100 1000 10000 100000 1000000] [--key-bits 256] [--seconds 1]
+'''
+
+import argparse
+import base64
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qkd.cipher import key_bytes, xor_decrypt
+
+def legacy_decrypt(encrypted_message, binary_key):
+    # What every message event did before: derive the ASCII key, then decrypt one chr() at a time
+    key = ''.join([chr(int(binary_key[i:i+8], 2)) for i in range(0, len(binary_key), 8)])
+    decoded_message = base64.b64decode(encrypted_message)
+    return ''.join(chr(decoded_message[i] ^ ord(key[i % len(key)])) for i in range(len(decoded_message)))
+
+def rate(function, args, seconds):
+    # Calls per second, running for about the given time
+    calls, started = 0, time.perf_counter()
+    while True:
+        function(*args)
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= seconds:
+            return calls / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000, 1000000], help="message sizes in bytes")
+    parser.add_argument("--key-bits", type=int, default=256)
+    parser.add_argument("--seconds", type=float, default=1.0, help="time spent per size and implementation")
+    args = parser.parse_args()
+
+    binary_key = ''.join(random.choice('01') for _ in range(args.key_bits))
+    cached_key = key_bytes(binary_key)
+    print(f"key_bits={args.key_bits}")
+    print(f"{'bytes':>8} {'impl':>7} {'msgs/s':>10} {'MB/s':>8} {'speedup':>8}")
+    for size in args.sizes:
+        text = ''.join(chr(random.randrange(32, 256)) for _ in range(size))
+        encrypted = base64.b64encode(bytes(ord(c) ^ cached_key[i % len(cached_key)] for i, c in enumerate(text))).decode()
+        assert xor_decrypt(encrypted, cached_key) == legacy_decrypt(encrypted, binary_key) == text
+
+        cached = rate(xor_decrypt, (encrypted, cached_key), args.seconds)
+        legacy = rate(legacy_decrypt, (encrypted, binary_key), args.seconds)
+        for name, messages in (("cached", cached), ("legacy", legacy)):
+            print(f"{size:>8} {name:>7} {messages:>10.0f} {messages * size / 1e6:>8.1f} {messages / legacy:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
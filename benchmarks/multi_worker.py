@@ -0,0 +1,147 @@
+'''
+Checks and measures one chat room served by several gunicorn workers sharing a Redis
+room store and message queue (REDIS_URL).
+
+Starts the Redis stand-in (benchmarks/redis_standin.py) unless --redis-url is given,
+then for each mode puts --clients clients in one room (their connections are spread
+over the workers), has every client send --messages messages and checks that:
+- every client receives every chat message, whichever worker its sender is on
+- every client ends up with the full user list (from join deltas after its first full list)
+- the room history holds all the messages and pages back through all of them
+and reports chat message deliveries per second.
+
+Usage: python benchmarks/multi_worker.py [--workers 4] [--clients 8] [--messages 50]
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from chat_client import ChatClient, Server, free_port
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+class Standin:
+    ''' The Redis stand-in in a subprocess. '''
+
+    def __enter__(self):
+        self.port = free_port()
+        self.url = f"redis://127.0.0.1:{self.port}/0"
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(HERE, "redis_standin.py"), "--port", str(self.port)],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        self.process.stdout.readline() # "listening on ..."
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.wait()
+
+def run(redis_url, workers, clients, messages, history_size, timeout=60):
+    env = {"QKD_BACKEND": "numpy", "QKD_POOL_SIZE": "4", "HISTORY_SIZE": str(history_size)}
+    if redis_url:
+        env["REDIS_URL"] = redis_url
+    with Server(env=env, workers=workers) as server:
+        expected = clients * messages
+        done = threading.Event()
+        lock = threading.Lock()
+        received = {}
+        user_lists = {}
+        pages = []
+
+        members = []
+        for i in range(clients):
+            client = ChatClient(server.url, f"user{i}")
+            client.create_room() if i == 0 else client.join_room(members[0].room)
+            received[client.name] = 0
+            def on_message(data, name=client.name):
+                if not data.get("message", "").startswith("bench "):
+                    return
+                with lock:
+                    received[name] += 1
+                    if all(count >= expected for count in received.values()):
+                        done.set()
+            client.on_message = on_message
+            # Full list, then the join/leave deltas applied as room.html does
+            client.sio.on("updateUserList", lambda data, name=client.name: user_lists.__setitem__(name, list(data["users"])))
+            client.sio.on("userJoined", lambda data, name=client.name: user_lists.setdefault(name, []).append(data["name"]))
+            client.sio.on("userLeft", lambda data, name=client.name: user_lists.setdefault(name, []).remove(data["name"]))
+            client.sio.on("history", pages.append)
+            client.connect()
+            client.sio.emit("requestUserList")
+            members.append(client)
+        time.sleep(0.5) # Let the last updateUserList reach everyone
+
+        started = time.perf_counter()
+        for n in range(messages):
+            for client in members:
+                client.send(f"bench {client.name} {n}")
+        delivered = done.wait(timeout)
+        elapsed = time.perf_counter() - started
+
+        # Page back through the whole history from the newest message
+        history_ids = []
+        cursor = expected
+        while cursor is not None:
+            pages.clear()
+            members[-1].sio.emit("requestHistory", {"before": cursor})
+            deadline = time.monotonic() + 10
+            while not pages and time.monotonic() < deadline:
+                time.sleep(0.01)
+            if not pages:
+                break
+            history_ids[:0] = [message["id"] for message in pages[0]["messages"]]
+            cursor = pages[0]["cursor"]
+
+        names = sorted(client.name for client in members)
+        user_lists_ok = all(sorted(user_lists.get(name, [])) == names for name in names)
+        for client in members:
+            client.disconnect()
+
+    kept = min(expected, history_size)
+    return {
+        "delivered": delivered,
+        "missing": sum(max(0, expected - count) for count in received.values()),
+        "user_lists_ok": user_lists_ok,
+        "history_ok": history_ids == list(range(expected - kept, expected)),
+        "deliveries_per_s": clients * expected / elapsed if delivered else float("nan"),
+        "elapsed_s": elapsed,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=8, help="clients in the room")
+    parser.add_argument("--messages", type=int, default=50, help="messages sent by each client")
+    parser.add_argument("--history-size", type=int, default=500)
+    parser.add_argument("--redis-url", help="use this Redis instead of starting the stand-in")
+    args = parser.parse_args()
+
+    standin = Standin() if args.redis_url is None else None
+    redis_url = standin.__enter__().url if standin else args.redis_url
+    try:
+        modes = {
+            "1 worker, in-memory": (None, 1),
+            "1 worker, redis": (redis_url, 1),
+            f"{args.workers} workers, redis": (redis_url, args.workers),
+        }
+        print(f"{'mode':<22} {'delivered':>9} {'missing':>8} {'users ok':>9} {'history ok':>11} {'deliveries/s':>13}")
+        failed = False
+        for mode, (url, workers) in modes.items():
+            result = run(url, workers, args.clients, args.messages, args.history_size)
+            failed |= not (result["delivered"] and result["user_lists_ok"] and result["history_ok"])
+            print(f"{mode:<22} {str(result['delivered']):>9} {result['missing']:>8} {str(result['user_lists_ok']):>9} "
+                  f"{str(result['history_ok']):>11} {result['deliveries_per_s']:>13.0f}")
+    finally:
+        if standin:
+            standin.__exit__()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
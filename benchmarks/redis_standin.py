@@ -0,0 +1,410 @@
+'''
+Stand-in Redis server for trying multi-worker mode locally without installing Redis.
+
+Speaks the Redis protocol (RESP2) and implements the commands used by RedisRoomStore
+(roomstore.py) and python-socketio's Redis message queue: strings, hashes, lists, sets,
+sorted sets, MULTI/EXEC with WATCH and PUBLISH/SUBSCRIBE. Everything is kept in memory, nothing
+expires and there is a single database. Not meant for production.
+
+Usage: python benchmarks/redis_standin.py [--port 6379]
+'''
+
+import argparse
+import asyncio
+import fnmatch
+
+class CommandError(Exception):
+    pass
+
+class _Subscriber:
+    def __init__(self, writer):
+        self.writer = writer
+        self.channels = set()
+
+class RedisStandin:
+    # Commands that change their key (del: all of its keys); WATCH compares the keys' versions
+    WRITES = {"del", "set", "incr", "incrby", "hset", "hsetnx", "hincrby", "hdel", "rpush", "lpush", "lpop",
+              "lrem", "sadd", "srem", "zadd", "zrem", "zremrangebyrank"}
+
+    def __init__(self):
+        self.data = {}
+        self.channels = {} # channel -> set of _Subscriber
+        self.versions = {} # key -> number of the last write to it
+        self.writes = 0
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self._client, host, port)
+        async with server:
+            await server.serve_forever()
+
+    # Protocol:
+
+    async def _client(self, reader, writer):
+        subscriber = _Subscriber(writer)
+        transaction = None
+        watched = {} # key -> its version when WATCHed
+        try:
+            while True:
+                command = await _read_command(reader)
+                if command is None:
+                    break
+                name = command[0].upper()
+                if name == b'MULTI':
+                    transaction = []
+                    reply = _OK
+                elif name == b'EXEC':
+                    queued, transaction = transaction or [], None
+                    if any(self.versions.get(key, 0) != version for key, version in watched.items()):
+                        reply = None # A watched key was written to: nothing runs
+                    else:
+                        reply = [self._run(queued_command, subscriber) for queued_command in queued]
+                    watched = {}
+                elif name == b'DISCARD':
+                    transaction = None
+                    watched = {}
+                    reply = _OK
+                elif name == b'WATCH':
+                    watched.update((key, self.versions.get(key, 0)) for key in command[1:])
+                    reply = _OK
+                elif name == b'UNWATCH':
+                    watched = {}
+                    reply = _OK
+                elif transaction is not None:
+                    transaction.append(command)
+                    reply = _Simple(b'QUEUED')
+                else:
+                    reply = self._run(command, subscriber)
+                if reply is not _NO_REPLY:
+                    writer.write(_encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in subscriber.channels:
+                self.channels.get(channel, set()).discard(subscriber)
+            writer.close()
+
+    def _run(self, command, subscriber):
+        name, args = command[0].decode().lower(), command[1:]
+        handler = getattr(self, f"cmd_{name}", None)
+        if handler is None:
+            return CommandError(f"unknown command '{name}'")
+        if name in self.WRITES and args:
+            self.writes += 1
+            for key in (args if name == "del" else args[:1]):
+                self.versions[key] = self.writes
+        try:
+            if name in ("subscribe", "unsubscribe"):
+                return handler(subscriber, *args)
+            return handler(*args)
+        except CommandError as error:
+            return error
+        except (TypeError, ValueError, IndexError):
+            return CommandError(f"wrong arguments for '{name}' command")
+
+    def _get(self, key, kind, create=False):
+        value = self.data.get(key)
+        if value is None:
+            if not create:
+                return None
+            value = self.data[key] = kind()
+        if not isinstance(value, kind):
+            raise CommandError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    # Connection:
+
+    def cmd_ping(self, message=None):
+        return _Simple(b'PONG') if message is None else message
+
+    def cmd_echo(self, message):
+        return message
+
+    def cmd_select(self, index):
+        return _OK
+
+    def cmd_client(self, *args):
+        return _OK
+
+    def cmd_flushall(self, *args):
+        self.writes += 1
+        for key in self.data:
+            self.versions[key] = self.writes
+        self.data.clear()
+        return _OK
+
+    cmd_flushdb = cmd_flushall
+
+    # Keys and strings:
+
+    def cmd_exists(self, *keys):
+        return sum(key in self.data for key in keys)
+
+    def cmd_del(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def cmd_keys(self, pattern):
+        return [key for key in self.data if fnmatch.fnmatchcase(key.decode(), pattern.decode())]
+
+    def cmd_get(self, key):
+        return self._get(key, bytes)
+
+    def cmd_set(self, key, value, *options):
+        if b'NX' in (option.upper() for option in options) and key in self.data:
+            return None
+        self.data[key] = value
+        return _OK
+
+    def cmd_incr(self, key):
+        return self.cmd_incrby(key, b'1')
+
+    def cmd_incrby(self, key, amount):
+        value = int(self._get(key, bytes) or 0) + int(amount)
+        self.data[key] = str(value).encode()
+        return value
+
+    # Hashes:
+
+    def cmd_hset(self, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise ValueError
+        hash_ = self._get(key, dict, create=True)
+        added = sum(field not in hash_ for field in pairs[::2])
+        hash_.update(zip(pairs[::2], pairs[1::2]))
+        return added
+
+    def cmd_hsetnx(self, key, field, value):
+        hash_ = self._get(key, dict, create=True)
+        if field in hash_:
+            return 0
+        hash_[field] = value
+        return 1
+
+    def cmd_hget(self, key, field):
+        return (self._get(key, dict) or {}).get(field)
+
+    def cmd_hgetall(self, key):
+        return [item for pair in (self._get(key, dict) or {}).items() for item in pair]
+
+    def cmd_hincrby(self, key, field, amount):
+        hash_ = self._get(key, dict, create=True)
+        value = int(hash_.get(field, 0)) + int(amount)
+        hash_[field] = str(value).encode()
+        return value
+
+    def cmd_hmget(self, key, *fields):
+        hash_ = self._get(key, dict) or {}
+        return [hash_.get(field) for field in fields]
+
+    def cmd_hdel(self, key, *fields):
+        hash_ = self._get(key, dict) or {}
+        return sum(hash_.pop(field, None) is not None for field in fields)
+
+    # Lists:
+
+    def cmd_rpush(self, key, *values):
+        items = self._get(key, list, create=True)
+        items.extend(values)
+        return len(items)
+
+    def cmd_lpush(self, key, *values):
+        items = self._get(key, list, create=True)
+        items[:0] = reversed(values)
+        return len(items)
+
+    def cmd_lpop(self, key):
+        items = self._get(key, list)
+        if not items:
+            return None
+        item = items.pop(0)
+        if not items:
+            self.data.pop(key, None)
+        return item
+
+    def cmd_llen(self, key):
+        return len(self._get(key, list) or [])
+
+    def cmd_lindex(self, key, index):
+        items = self._get(key, list) or []
+        index = int(index)
+        return items[index] if -len(items) <= index < len(items) else None
+
+    def cmd_lrange(self, key, start, stop):
+        return _slice(self._get(key, list) or [], int(start), int(stop))
+
+    def cmd_lrem(self, key, count, value):
+        items = self._get(key, list) or []
+        if int(count) != 0:
+            raise CommandError("only LREM key 0 value is supported")
+        kept = [item for item in items if item != value]
+        removed = len(items) - len(kept)
+        items[:] = kept
+        if not items:
+            self.data.pop(key, None)
+        return removed
+
+    # Sets:
+
+    def cmd_sadd(self, key, *members):
+        members_ = self._get(key, set, create=True)
+        added = len(set(members) - members_)
+        members_.update(members)
+        return added
+
+    def cmd_srem(self, key, *members):
+        members_ = self._get(key, set) or set()
+        removed = len(members_ & set(members))
+        members_.difference_update(members)
+        return removed
+
+    def cmd_smembers(self, key):
+        return list(self._get(key, set) or ())
+
+    def cmd_scard(self, key):
+        return len(self._get(key, set) or ())
+
+    def cmd_sismember(self, key, member):
+        return int(member in (self._get(key, set) or ()))
+
+    # Sorted sets (dict member -> score, sorted on read):
+
+    def _sorted(self, key):
+        zset = self._get(key, _ZSet) or {}
+        return sorted(zset.items(), key=lambda item: (item[1], item[0]))
+
+    def cmd_zadd(self, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise ValueError
+        zset = self._get(key, _ZSet, create=True)
+        added = sum(member not in zset for member in pairs[1::2])
+        zset.update((member, float(score)) for score, member in zip(pairs[::2], pairs[1::2]))
+        return added
+
+    def cmd_zcard(self, key):
+        return len(self._get(key, _ZSet) or ())
+
+    def cmd_zrange(self, key, start, stop, *options):
+        items = _slice(self._sorted(key), int(start), int(stop))
+        return _with_scores(items, options)
+
+    def cmd_zrangebyscore(self, key, minimum, maximum, *options):
+        above, below = _score_bound(minimum, low=True), _score_bound(maximum, low=False)
+        return _with_scores([item for item in self._sorted(key) if above(item[1]) and below(item[1])], options)
+
+    def cmd_zrevrangebyscore(self, key, maximum, minimum, *options):
+        above, below = _score_bound(minimum, low=True), _score_bound(maximum, low=False)
+        items = [item for item in reversed(self._sorted(key)) if above(item[1]) and below(item[1])]
+        upper = [option.upper() for option in options]
+        if b'LIMIT' in upper:
+            at = upper.index(b'LIMIT')
+            offset, count = int(options[at + 1]), int(options[at + 2])
+            items = items[offset:] if count < 0 else items[offset:offset + count]
+        return _with_scores(items, options)
+
+    def cmd_zrem(self, key, *members):
+        zset = self._get(key, _ZSet) or {}
+        return sum(zset.pop(member, None) is not None for member in members)
+
+    def cmd_zremrangebyrank(self, key, start, stop):
+        zset = self._get(key, _ZSet) or {}
+        removed = _slice(self._sorted(key), int(start), int(stop))
+        for member, _ in removed:
+            del zset[member]
+        return len(removed)
+
+    # Pub/sub:
+
+    def cmd_publish(self, channel, message):
+        subscribers = self.channels.get(channel, ())
+        for subscriber in subscribers:
+            subscriber.writer.write(_encode([b'message', channel, message]))
+        return len(subscribers)
+
+    def cmd_subscribe(self, subscriber, *channels):
+        for channel in channels:
+            subscriber.channels.add(channel)
+            self.channels.setdefault(channel, set()).add(subscriber)
+            subscriber.writer.write(_encode([b'subscribe', channel, len(subscriber.channels)]))
+        return _NO_REPLY
+
+    def cmd_unsubscribe(self, subscriber, *channels):
+        for channel in channels or list(subscriber.channels):
+            subscriber.channels.discard(channel)
+            self.channels.get(channel, set()).discard(subscriber)
+            subscriber.writer.write(_encode([b'unsubscribe', channel, len(subscriber.channels)]))
+        return _NO_REPLY
+
+class _ZSet(dict):
+    pass
+
+class _Simple(bytes):
+    pass
+
+_OK = _Simple(b'OK')
+_NO_REPLY = object()
+
+def _slice(items, start, stop):
+    # Redis-style inclusive range with negative indexes
+    length = len(items)
+    start = max(start + length if start < 0 else start, 0)
+    stop = stop + length if stop < 0 else min(stop, length - 1)
+    return items[start:stop + 1] if start <= stop else []
+
+def _score_bound(bound, low):
+    # "-inf", "+inf", "(5" (exclusive) or "5" -> predicate on scores
+    text = bound.decode()
+    exclusive = text.startswith('(')
+    value = float(text.lstrip('('))
+    if low:
+        return (lambda score: score > value) if exclusive else (lambda score: score >= value)
+    return (lambda score: score < value) if exclusive else (lambda score: score <= value)
+
+def _with_scores(items, options):
+    if b'WITHSCORES' in (option.upper() for option in options):
+        return [value for member, score in items for value in (member, _score(score))]
+    return [member for member, _ in items]
+
+def _score(score):
+    return (str(int(score)) if score == int(score) else repr(score)).encode()
+
+async def _read_command(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b'*'): # Inline command (e.g. typed into telnet)
+        return line.split() or [b'PING']
+    command = []
+    for _ in range(int(line[1:])):
+        length = int((await reader.readline())[1:])
+        command.append((await reader.readexactly(length + 2))[:-2])
+    return command
+
+def _encode(reply):
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, CommandError):
+        message = str(reply)
+        return f"-{message if message.split()[0].isupper() else 'ERR ' + message}\r\n".encode()
+    if isinstance(reply, _Simple):
+        return b'+' + reply + b'\r\n'
+    if isinstance(reply, bool) or isinstance(reply, int):
+        return b':%d\r\n' % reply
+    if isinstance(reply, bytes):
+        return b'$%d\r\n%s\r\n' % (len(reply), reply)
+    if isinstance(reply, list):
+        return b'*%d\r\n' % len(reply) + b''.join(_encode(item) for item in reply)
+    raise TypeError(f"Can't encode {reply!r}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    print(f"Redis stand-in listening on {args.host}:{args.port}", flush=True)
+    try:
+        asyncio.run(RedisStandin().serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
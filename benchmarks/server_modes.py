@@ -0,0 +1,78 @@
+'''
+Eventlet vs asyncio server mode, side by side.
+
+Runs the load benchmark (benchmarks/load.py: N rooms x M clients, create/join, QKD key,
+encrypted messages) against main:app under gunicorn + eventlet and against asgi:app
+under uvicorn, with the same settings and server environment, and prints connect (QKD)
+latency, message latency and throughput of both.
+
+With --no-pool every connect runs BB84 (QKD_POOL_SIZE=0), which is where the modes
+differ most: eventlet polls the QKD worker processes from green threads (or runs BB84 on
+the loop with QKD_PROCESSES=0), the asyncio mode waits for them on a thread pool.
+
+Usage: python benchmarks/server_modes.py [--rooms 5] [--clients 4] [--messages 50] [--rate 0]
+                                         [--no-pool] [--env QKD_BACKEND=numpy ...] [--output modes.json]
+'''
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from chat_client import Server
+from load import run
+
+MODES = ("eventlet", "asgi")
+
+ROWS = [
+    ("clients connected", lambda r: r["clients"]),
+    ("connect failures", lambda r: r["connect_failures"]),
+    ("join seconds", lambda r: r["join_seconds"]),
+    *[(f"connect ms {key}", lambda r, key=key: r["connect_latency_ms"].get(key)) for key in ("mean", "p50", "p95", "p99")],
+    *[(f"message ms {key}", lambda r, key=key: r["message_latency_ms"].get(key)) for key in ("mean", "p50", "p95", "p99", "max")],
+    ("messages/s sent", lambda r: r["messages_per_s"]),
+    ("deliveries/s", lambda r: r["deliveries_per_s"]),
+    ("delivery ratio", lambda r: r["delivery_ratio"]),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=5)
+    parser.add_argument("--clients", type=int, default=4, help="clients per room")
+    parser.add_argument("--messages", type=int, default=50, help="messages sent by each client")
+    parser.add_argument("--rate", type=float, default=0, help="messages/sec per client (0 = as fast as possible)")
+    parser.add_argument("--join-concurrency", type=int, default=16, help="clients joining at the same time")
+    parser.add_argument("--no-pool", action="store_true", help="run BB84 on every connect (QKD_POOL_SIZE=0)")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="server environment variable (repeatable)")
+    parser.add_argument("--output", help="write the results of both modes as JSON")
+    args = parser.parse_args()
+
+    env = {"LOG_LEVEL": "WARNING", **dict(item.split("=", 1) for item in args.env)}
+    if args.no_pool:
+        env["QKD_POOL_SIZE"] = "0"
+    print(f"{args.rooms} rooms x {args.clients} clients, {args.messages} messages each at "
+          f"{args.rate or 'max'}/s, env {env}")
+
+    results = {}
+    for mode in MODES:
+        with Server(env=env, mode=mode) as server:
+            results[mode] = run(server.url, args.rooms, args.clients, args.messages, args.rate, args.join_concurrency)
+
+    print(f"\n{'':<20} {'eventlet':>10} {'asgi':>10} {'change':>9}")
+    for label, value in ROWS:
+        before, after = value(results["eventlet"]), value(results["asgi"])
+        change = f"{100 * (after - before) / before:+.1f}%" if before and after is not None else ""
+        print(f"{label:<20} {before if before is not None else '-':>10} {after if after is not None else '-':>10} {change:>9}")
+    for mode in MODES:
+        for failure in results[mode]["failures"]:
+            print(f"  {mode} failed: {failure}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "env": env, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+'''
+Per-stage BB84 microbenchmarks with regression tracking.
+
+Times each protocol stage on its own (qkd.bb84: distribute -> sift -> estimate_qber ->
+reconcile (Cascade + BICONF) -> amplify) across qubit counts and channel noise rates
+(each rate is used for both bit-flips and phase-flips).
+Every configuration is seeded, so each run times the same inputs. A stage's time is the
+fastest of repeated runs on fresh copies of its inputs (as timeit does: slower runs are
+the machine doing something else, not the code).
+
+Results are compared with a stored baseline (benchmarks/baselines/stages.json by
+default): stages slower than the baseline by more than --threshold (and by more than
+--min-us, so tiny stages don't flag on timer noise) are reported as regressions and the
+script exits with status 1. --save writes the current results as the new baseline.
+
+Each run also times a fixed calibration workload (Python loops and NumPy array work),
+and baseline times are scaled by how much faster or slower it ran, so a machine that
+is busier or clocked differently than when the baseline was saved doesn't flag every
+stage. Baselines are still best saved on the machine you compare on.
+
+Usage: python benchmarks/stages.py [--qubits 24 256 4096 65536] [--noise 0 0.02 0.05 0.143]
+                                   [--backend numpy] [--threshold 0.5] [--save] [--baseline path]
+'''
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from qkd import amplify, estimate_qber, get_backend, reconcile, sift
+from qkd.backends import BIT_FLIP_RATE, numpy_distribute
+from qkd.bb84 import KEY_BITS
+
+STAGES = ("distribution", "sifting", "qber", "cascade", "biconf", "amplification")
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baselines", "stages.json")
+
+def calibrate(min_time=0.5):
+    # Seconds for a fixed mix of interpreter and NumPy work, as a speed reference
+    data = list(range(20000))
+    array = np.random.default_rng(0).random(200000)
+    def workload():
+        sum(x * x for x in data if x & 1)
+        np.sort(array)
+    return best_time(workload, tuple, min_time, 1000)
+
+def best_time(run, prepare, min_time, max_repeats):
+    # Fastest seconds of run(*prepare()) over repeats (at least 3, until min_time has passed)
+    times = []
+    deadline = time.perf_counter() + min_time
+    while len(times) < 3 or (time.perf_counter() < deadline and len(times) < max_repeats):
+        inputs = prepare()
+        started = time.perf_counter()
+        run(*inputs)
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+def bench_config(backend, n_qubits, noise, seed, amplification, min_time, max_repeats):
+    ''' Times every stage for one (backend, qubits, noise) configuration. Returns
+        ({stage: microseconds}, {"qber", "sifted_bits", "reconciled_bits"}).
+    '''
+    if backend == "numpy":
+        distribute = lambda: numpy_distribute(n_qubits, rng=np.random.default_rng(seed), bit_flip_rate=noise,
+                                              phase_flip_rate=noise)
+    else:
+        # The circuit backends draw from the random module
+        distribute_states = get_backend(backend)
+        def distribute():
+            random.seed(seed)
+            return distribute_states(n_qubits, bit_flip_rate=noise, phase_flip_rate=noise)
+
+    timings = {}
+    timings["distribution"] = best_time(distribute, tuple, min_time, max_repeats)
+    send_list, alice_basis, bob_basis, received = distribute()
+
+    timings["sifting"] = best_time(sift, lambda: (send_list, alice_basis, bob_basis, received), min_time, max_repeats)
+    alice_sifted, bob_sifted = sift(send_list, alice_basis, bob_basis, received)
+
+    qber_inputs = lambda: (list(alice_sifted), list(bob_sifted), random.Random(seed))
+    timings["qber"] = best_time(estimate_qber, qber_inputs, min_time, max_repeats)
+    alice_key, bob_key, rng = qber_inputs()
+    qber, _, _ = estimate_qber(alice_key, bob_key, rng)
+    qber = qber or 0.0
+
+    # Cascade and BICONF are timed separately from reconcile()'s own per-sub-stage timings
+    sub_stages = {"cascade": [], "biconf": []}
+    def reconcile_once(alice, bob, rng):
+        stage_timings = {}
+        reconcile(alice, bob, qber, rng=rng, timings=stage_timings)
+        for stage in sub_stages:
+            sub_stages[stage].append(stage_timings.get(stage, 0.0))
+    reconcile_inputs = lambda: (list(alice_key), list(bob_key), np.random.default_rng(seed))
+    best_time(reconcile_once, reconcile_inputs, min_time, max_repeats)
+    timings.update({stage: min(values) for stage, values in sub_stages.items()})
+    key_bits, _ = reconcile(*reconcile_inputs()[:2], qber, rng=np.random.default_rng(seed))
+
+    length = KEY_BITS if amplification == "hash" else min(KEY_BITS, len(key_bits))
+    if key_bits and length:
+        amplify_inputs = lambda: ([key_bits], length, amplification, np.random.default_rng(seed))
+        timings["amplification"] = best_time(amplify, amplify_inputs, min_time, max_repeats)
+    else:
+        timings["amplification"] = 0.0
+
+    info = {"qber": qber, "sifted_bits": len(alice_sifted), "reconciled_bits": len(key_bits)}
+    return {stage: round(1e6 * timings[stage], 2) for stage in STAGES}, info
+
+def config_key(backend, n_qubits, noise):
+    return f"{backend}/{n_qubits}/{noise:g}"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--qubits", type=int, nargs="+", default=[24, 256, 4096, 65536])
+    parser.add_argument("--noise", type=float, nargs="+", default=[0.0, 0.02, 0.05, round(BIT_FLIP_RATE, 3)],
+                        help="channel bit/phase-flip rates")
+    parser.add_argument("--backend", default="numpy")
+    parser.add_argument("--amplification", default="hash")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds to keep repeating each stage")
+    parser.add_argument("--max-repeats", type=int, default=200)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.5, help="relative slowdown flagged as a regression")
+    parser.add_argument("--min-us", type=float, default=5.0, help="ignore slowdowns smaller than this many microseconds")
+    parser.add_argument("--save", action="store_true", help="store these results as the baseline")
+    args = parser.parse_args()
+
+    calibration = calibrate()
+    results = {}
+    print(f"{'config':<24} {'qber':>5} " + " ".join(f"{stage:>13}" for stage in STAGES) + "   dominant (us)")
+    for n_qubits in args.qubits:
+        for noise in args.noise:
+            key = config_key(args.backend, n_qubits, noise)
+            timings, info = bench_config(args.backend, n_qubits, noise, args.seed, args.amplification,
+                                         args.min_time, args.max_repeats)
+            results[key] = {"stages_us": timings, **info}
+            dominant = max(timings, key=timings.get)
+            print(f"{key:<24} {info['qber']:>5.2f} " + " ".join(f"{timings[stage]:>13.1f}" for stage in STAGES) + f"   {dominant}")
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        speed = calibration / baseline.get("calibration_s", calibration) # > 1: this machine is slower now
+        print(f"\nCompared with baseline {os.path.relpath(args.baseline)} ({baseline.get('timestamp', '?')}), "
+              f"threshold +{100 * args.threshold:.0f}%, baseline scaled by {speed:.2f} (calibration):")
+        for key, result in results.items():
+            old = baseline["results"].get(key)
+            if old is None:
+                continue
+            for stage in STAGES:
+                before, after = old["stages_us"].get(stage), result["stages_us"][stage]
+                before = before * speed if before else before
+                if before and after > before * (1 + args.threshold) and after - before > args.min_us:
+                    regressions.append((key, stage, before, after))
+        for key, stage, before, after in regressions:
+            print(f"  REGRESSION {key} {stage}: {before:.1f} -> {after:.1f} us ({100 * (after / before - 1):+.0f}%)")
+        if not regressions:
+            print("  no regressions")
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "seed": args.seed,
+                "amplification": args.amplification,
+                "calibration_s": calibration,
+                "results": results,
+            }, f, indent=2)
+        print(f"\nBaseline saved to {os.path.relpath(args.baseline)}")
+
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
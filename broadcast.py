@@ -0,0 +1,95 @@
+'''
+Outbound chat messages to rooms, optionally coalesced.
+
+Without coalescing every message is its own "message" emit, so a busy room costs one
+emit (and, with REDIS_URL, one pub/sub publish) plus one websocket frame per recipient
+per message. With a window set, messages for a room are held for up to that long (or
+until max_batch_size have collected) and then go out together as one "messages" event
+carrying the list; room.html unpacks it and handles each entry like a "message" event.
+A batch that ends up holding a single message is sent as a plain "message".
+'''
+
+import threading
+import time
+
+from qkd.threads import spawn_thread
+
+class RoomBroadcaster:
+    ''' Sends chat messages to rooms through emit(event, data, to=room) (e.g. socketio.emit).
+
+        window is in seconds (0 sends every message straight away). spawn/sleep let the
+        flush timers run on green threads (socketio's start_background_task and sleep).
+    '''
+
+    def __init__(self, emit, window=0.0, max_batch_size=32, spawn=None, sleep=time.sleep):
+        self.emit = emit
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.spawn = spawn or spawn_thread
+        self.sleep = sleep
+
+        self._pending = {} # room -> messages waiting for the next flush
+        self._scheduled = set() # rooms with a flush timer running
+        self._lock = threading.Lock()
+
+        # Coalescing metrics:
+        self.messages = 0
+        self.frames = 0 # Emits sent ("message" or "messages")
+        self.flushes = {"window": 0, "size": 0, "explicit": 0}
+
+    def send(self, room, message):
+        if self.window <= 0:
+            self._emit(room, [message])
+            return
+        batch = None
+        with self._lock:
+            pending = self._pending.setdefault(room, [])
+            pending.append(message)
+            if len(pending) >= self.max_batch_size:
+                batch = self._pending.pop(room)
+                self.flushes["size"] += 1
+            elif room not in self._scheduled:
+                self._scheduled.add(room)
+                self.spawn(lambda: self._flush_later(room))
+        if batch:
+            self._emit(room, batch)
+
+    def _flush_later(self, room):
+        self.sleep(self.window)
+        with self._lock:
+            self._scheduled.discard(room)
+            batch = self._pending.pop(room, None)
+            if batch:
+                self.flushes["window"] += 1
+        if batch:
+            self._emit(room, batch)
+
+    def flush(self, room):
+        # Sends the room's held messages now (e.g. before the room is terminated)
+        with self._lock:
+            batch = self._pending.pop(room, None)
+            if batch:
+                self.flushes["explicit"] += 1
+        if batch:
+            self._emit(room, batch)
+
+    def _emit(self, room, batch):
+        if len(batch) == 1:
+            self.emit("message", batch[0], to=room)
+        else:
+            self.emit("messages", batch, to=room)
+        with self._lock:
+            self.messages += len(batch)
+            self.frames += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "window_ms": round(1000 * self.window, 2),
+                "max_batch_size": self.max_batch_size,
+                "queued": sum(len(pending) for pending in self._pending.values()),
+                "messages": self.messages,
+                "frames": self.frames,
+                "avg_batch_size": round(self.messages / self.frames, 2) if self.frames else None,
+                "flushes": dict(self.flushes),
+            }
@@ -0,0 +1,79 @@
+'''
+Bounded per-room message history.
+
+Each room keeps its messages in a fixed-size ring buffer: once it is full, the oldest
+message is overwritten. Every message gets an id from a per-room counter, which doubles
+as the cursor for paging back through the history, and the buffer keeps a running
+estimate of the memory its messages use.
+'''
+
+import sys
+import time
+
+class MessageHistory:
+    ''' Ring buffer of the last `capacity` messages of a room. Messages are dicts with
+        "name" and "message"; append() adds their "id" and "time" (ms since the epoch).
+    '''
+
+    __slots__ = ("capacity", "_items", "_next_id", "bytes")
+
+    def __init__(self, capacity=500):
+        self.capacity = capacity
+        self._items = [None] * capacity
+        self._next_id = 0 # Id of the next message; message i lives at slot i % capacity
+        self.bytes = 0 # Approximate memory used by the stored messages
+
+    def __len__(self):
+        return min(self._next_id, self.capacity)
+
+    @property
+    def first_id(self):
+        # Oldest id still in the buffer
+        return self._next_id - len(self)
+
+    def append(self, message):
+        if self.capacity <= 0:
+            return message
+        message["id"] = self._next_id
+        message["time"] = int(time.time() * 1000)
+        slot = self._next_id % self.capacity
+        evicted = self._items[slot]
+        if evicted is not None:
+            self.bytes -= _size(evicted)
+        self._items[slot] = message
+        self.bytes += _size(message)
+        self._next_id += 1
+        return message
+
+    def _range(self, start, end):
+        return [self._items[i % self.capacity] for i in range(start, end)]
+
+    def latest(self, limit):
+        # The last `limit` messages, oldest first
+        return self._range(max(self.first_id, self._next_id - limit), self._next_id)
+
+    def before(self, cursor, limit):
+        ''' Page of up to `limit` messages older than id `cursor` (oldest first), and the
+            cursor for the page before it (None once the start of the history is reached).
+        '''
+        end = min(max(cursor, self.first_id), self._next_id)
+        start = max(self.first_id, end - limit)
+        return self._range(start, end), (start if start > self.first_id else None)
+
+    def cursor(self, messages):
+        # Cursor for the page older than `messages` (as returned by latest())
+        if not messages or messages[0]["id"] <= self.first_id:
+            return None
+        return messages[0]["id"]
+
+    def stats(self):
+        return {
+            "messages": len(self),
+            "capacity": self.capacity,
+            "bytes": self.bytes,
+            "total_messages": self._next_id,
+        }
+
+def _size(message):
+    # Memory of the message dict and its values
+    return sys.getsizeof(message) + sum(sys.getsizeof(value) for value in message.values())
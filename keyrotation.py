@@ -0,0 +1,158 @@
+'''
+In-session QKD key rotation.
+
+Every connection starts on the key from its key exchange (epoch 0). Once it has sent
+every_messages messages, or its key is older than every_seconds when it sends one, a
+new key is generated in the background while the old one stays in use, so messages
+keep flowing during the exchange. The switchover is tagged with an epoch number:
+
+1. the new key is stored as epoch n+1 next to epoch n and sent to the client ("rekey")
+2. the client encrypts everything from then on with it, tagging messages with n+1, and
+   acknowledges ("rekeyAck"); messages still in flight with n decrypt with the old key
+3. on the acknowledgement the old key is dropped - Socket.IO delivers a connection's
+   events in order, so nothing tagged n can arrive after it
+
+Key age is only checked when the connection sends a message: a key that encrypts
+nothing isn't exposed, so idle connections aren't rekeyed.
+'''
+
+import logging
+import threading
+import time
+
+from qkd import key_bytes
+from qkd.threads import spawn_thread
+
+qkd_log = logging.getLogger("qkd")
+
+class _Keys:
+    __slots__ = ("keys", "epoch", "messages", "since", "rotating")
+
+    def __init__(self, key, now):
+        self.keys = {0: key_bytes(key)} # epoch -> ASCII key bytes; two entries during a switchover
+        self.epoch = 0 # Latest epoch the client has acknowledged
+        self.messages = 0 # Messages since the last (offered) key
+        self.since = now
+        self.rotating = False
+
+class KeyRotator:
+    ''' Keys of each connection (by sid), rotated in the background.
+
+        generate() returns a new binary key string (it may block: it runs in a task started
+        with spawn, e.g. socketio.start_background_task). emit(event, data, to=sid) sends
+        the "rekey" offer. every_messages / every_seconds of 0 disable that trigger.
+    '''
+
+    def __init__(self, generate, emit, every_messages=0, every_seconds=0.0, spawn=None, clock=time.monotonic):
+        self.generate = generate
+        self.emit = emit
+        self.every_messages = every_messages
+        self.every_seconds = every_seconds
+        self.spawn = spawn or spawn_thread
+        self.clock = clock
+
+        self._connections = {} # sid -> _Keys
+        self._lock = threading.Lock()
+
+        # Rotation metrics:
+        self.started = 0
+        self.offered = 0 # New keys sent to clients
+        self.acknowledged = 0
+        self.failures = 0
+        self.stale = 0 # Messages dropped for an unknown (already retired) epoch
+        self.total_time = 0.0 # Seconds spent generating rotated keys
+
+    @property
+    def enabled(self):
+        return self.every_messages > 0 or self.every_seconds > 0
+
+    def add(self, sid, key):
+        with self._lock:
+            self._connections[sid] = _Keys(key, self.clock())
+
+    def remove(self, sid):
+        with self._lock:
+            self._connections.pop(sid, None)
+
+    def key(self, sid, epoch=None):
+        ''' ASCII key bytes for decrypting a message of sid tagged with epoch (the latest
+            acknowledged key when None). None if the epoch is unknown.
+        '''
+        with self._lock:
+            record = self._connections.get(sid)
+            if record is None:
+                return None
+            key = record.keys.get(record.epoch if epoch is None else epoch)
+            if key is None:
+                self.stale += 1
+            return key
+
+    def message_sent(self, sid):
+        # Counts a message of sid and starts a rotation if one is due
+        if not self.enabled:
+            return False
+        with self._lock:
+            record = self._connections.get(sid)
+            if record is None or record.rotating:
+                return False
+            record.messages += 1
+            due = ((self.every_messages and record.messages >= self.every_messages)
+                   or (self.every_seconds and self.clock() - record.since >= self.every_seconds))
+            if not due:
+                return False
+            record.rotating = True
+            self.started += 1
+        self.spawn(lambda: self._rotate(sid))
+        return True
+
+    def _rotate(self, sid):
+        started = time.perf_counter()
+        try:
+            key = self.generate()
+        except Exception as error:
+            qkd_log.warning("key rotation failed sid=%s error=%s", sid, type(error).__name__)
+            with self._lock:
+                self.failures += 1
+                record = self._connections.get(sid)
+                if record is not None:
+                    record.rotating = False # Retried on a later message
+            return
+        with self._lock:
+            self.total_time += time.perf_counter() - started
+            record = self._connections.get(sid)
+            if record is None: # Disconnected while the key was being made
+                return
+            epoch = max(record.keys) + 1
+            record.keys[epoch] = key_bytes(key)
+            record.messages = 0
+            record.since = self.clock()
+            self.offered += 1
+        self.emit("rekey", {"key": key, "epoch": epoch}, to=sid)
+        qkd_log.info("key rotated sid=%s epoch=%d bits=%d", sid, epoch, len(key))
+
+    def acknowledge(self, sid, epoch):
+        # The client has switched to epoch: older keys are retired and the next rotation may start
+        with self._lock:
+            record = self._connections.get(sid)
+            if record is None or epoch not in record.keys or epoch <= record.epoch:
+                return False
+            record.epoch = epoch
+            record.keys = {e: key for e, key in record.keys.items() if e >= epoch}
+            record.rotating = False
+            self.acknowledged += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "every_messages": self.every_messages,
+                "every_seconds": self.every_seconds,
+                "connections": len(self._connections),
+                "rotating": sum(record.rotating for record in self._connections.values()),
+                "started": self.started,
+                "offered": self.offered,
+                "acknowledged": self.acknowledged,
+                "failures": self.failures,
+                "stale_messages": self.stale,
+                "avg_generation_ms": round(1000 * self.total_time / self.offered, 2) if self.offered else None,
+            }
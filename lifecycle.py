@@ -0,0 +1,173 @@
+'''
+Room lifecycle: allocating room codes, deleting rooms and reaping the ones left behind.
+
+Codes come from a pool of every possible code in a random order (see CodePool), so
+allocating one is O(1) however many rooms exist, instead of drawing random codes until
+an unused one turns up. Deleted rooms give their code back to the end of the pool, so a
+code is reused as late as possible (an old invitation shouldn't lead into a new room).
+
+Rooms that nobody is connected to are leaked unless something deletes them: rooms
+created on the home page that were never joined (closed tab, failed key exchange), or
+rooms whose last member's disconnect never ran (a worker that died). The reaper deletes
+rooms that have had no members for empty_ttl seconds and, if idle_ttl is set, rooms with
+no activity at all (joins, leaves or messages) for that long, even with members left.
+'''
+
+import logging
+import threading
+import time
+from collections import deque
+from string import ascii_uppercase
+
+import numpy as np
+
+from qkd.threads import spawn_thread
+
+CODE_LENGTH = 4
+
+rooms_log = logging.getLogger("rooms")
+
+def code_from_index(index, length=CODE_LENGTH):
+    # 0 -> "AAAA", 1 -> "AAAB", ... (base 26, most significant letter first)
+    letters = []
+    for _ in range(length):
+        index, digit = divmod(index, 26)
+        letters.append(ascii_uppercase[digit])
+    return "".join(reversed(letters))
+
+def codes_from_indexes(indexes, length=CODE_LENGTH):
+    # Vectorized code_from_index: array of indexes -> array of codes as bytes
+    digits = (indexes[:, None] // 26 ** np.arange(length - 1, -1, -1)) % 26
+    return (digits + ord("A")).astype(np.uint8).view(f"S{length}").ravel()
+
+def shuffled_codes(length=CODE_LENGTH, rng=None):
+    # Every code once, in a random order (as indexes: 4 bytes per code rather than a str object)
+    rng = rng or np.random.default_rng()
+    return rng.permutation(26 ** length).astype(np.uint32)
+
+class CodePool:
+    ''' Free room codes of one process: a shuffled array of all code indexes read through
+        a cursor, then the codes given back, oldest first. take() and give_back() are O(1).
+    '''
+
+    def __init__(self, length=CODE_LENGTH, rng=None):
+        self.length = length
+        self._fresh = shuffled_codes(length, rng)
+        self._next = 0
+        self._returned = deque()
+
+    def take(self):
+        # A free code, or None if every code is in use
+        if self._next < len(self._fresh):
+            index = int(self._fresh[self._next])
+            self._next += 1
+            return code_from_index(index, self.length)
+        if self._returned:
+            return self._returned.popleft()
+        return None
+
+    def give_back(self, code):
+        self._returned.append(code)
+
+    def __len__(self):
+        return len(self._fresh) - self._next + len(self._returned)
+
+class RoomLifecycle:
+    ''' Creates and deletes rooms of a room store (see roomstore.py) and runs the reaper.
+
+        on_reap(code, reason) is called for every reaped room after it is deleted (e.g. to
+        tell members still connected to it). spawn/sleep run the reaper on a green thread
+        (socketio's start_background_task and sleep).
+    '''
+
+    def __init__(self, store, empty_ttl=600.0, idle_ttl=0.0, interval=30.0, leak_grace=60.0, on_reap=None,
+                 spawn=None, sleep=time.sleep, clock=time.time):
+        self.store = store
+        self.empty_ttl = empty_ttl
+        self.idle_ttl = idle_ttl
+        self.interval = interval
+        self.leak_grace = leak_grace # Empty rooms younger than this are counted as joining, not leaked
+        self.on_reap = on_reap
+        self.spawn = spawn or spawn_thread
+        self.sleep = sleep
+        self.clock = clock
+        self._started = False
+        self._lock = threading.Lock()
+
+        # Lifecycle metrics:
+        self.created = 0
+        self.exhausted = 0 # Creations refused because every code was in use
+        self.deleted = {} # reason -> rooms deleted
+        self.reaped = {"unjoined": 0, "empty": 0, "idle": 0}
+        self.reaper_runs = 0
+        self.reaper_time = 0.0
+
+    def create(self, creator, qkd_debug=False):
+        # Allocates a code and creates the room; None if no code is free
+        code = self.store.allocate(creator, qkd_debug=qkd_debug)
+        with self._lock:
+            if code is None:
+                self.exhausted += 1
+            else:
+                self.created += 1
+        return code
+
+    def delete(self, code, reason):
+        # Deletes the room and frees its code; False if it was already gone
+        deleted = self.store.delete(code)
+        if deleted:
+            with self._lock:
+                self.deleted[reason] = self.deleted.get(reason, 0) + 1
+        return deleted
+
+    def reap(self):
+        # One reaper pass; returns [(code, reason)] of the rooms it deleted
+        started = time.perf_counter()
+        reaped = []
+        for code, reason in self.store.expired(self.clock(), self.empty_ttl, self.idle_ttl):
+            if self.store.delete(code): # Another worker may have reaped it first
+                reaped.append((code, reason))
+                if self.on_reap is not None:
+                    self.on_reap(code, reason)
+        with self._lock:
+            for _, reason in reaped:
+                self.reaped[reason] += 1
+            self.reaper_runs += 1
+            self.reaper_time += time.perf_counter() - started
+        return reaped
+
+    def start(self):
+        # Fills the code pool in the background (so the first room doesn't wait for it) and starts the reaper
+        if self._started:
+            return self
+        self._started = True
+        self.spawn(self.store.prepare_codes)
+        if self.interval > 0 and (self.empty_ttl > 0 or self.idle_ttl > 0):
+            self.spawn(self._reaper)
+        return self
+
+    def _reaper(self):
+        while True:
+            self.sleep(self.interval)
+            try:
+                reaped = self.reap()
+            except Exception as error: # A failed pass (e.g. Redis unavailable) is retried on the next one
+                rooms_log.warning("room reaper failed error=%s", type(error).__name__)
+                continue
+            for code, reason in reaped:
+                rooms_log.info("room deleted room=%s reason=%s", code, reason)
+
+    def stats(self):
+        rooms = self.store.lifecycle_stats(self.clock(), self.leak_grace)
+        with self._lock:
+            return {
+                **rooms,
+                "created": self.created,
+                "exhausted": self.exhausted,
+                "deleted": dict(self.deleted),
+                "reaped": dict(self.reaped),
+                "empty_ttl": self.empty_ttl,
+                "idle_ttl": self.idle_ttl,
+                "reaper_runs": self.reaper_runs,
+                "avg_reaper_ms": round(1000 * self.reaper_time / self.reaper_runs, 2) if self.reaper_runs else None,
+            }
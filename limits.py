@@ -0,0 +1,264 @@
+'''
+Rate limits on the Socket.IO events clients send, and bounds on what is queued for them.
+
+Inbound: token buckets per connection (sid), per room and per client address. A bucket
+holds up to burst tokens and refills at rate tokens per second; every event spends one,
+and an event that finds a bucket empty is rejected: a message is dropped (the sender is
+told, "rateLimited"), a user list request is ignored, a connect is refused before any
+QKD runs. Connects are limited per client address rather than per sid, since every
+reconnect gets a new sid.
+
+Outbound: every client has a queue of packets waiting for its websocket (Engine.IO's).
+A client that reads slower than its rooms talk lets it grow without bound, so with
+OutboundLimit a client whose queue holds max_queue packets either stops getting chat
+messages until it catches up ("drop"; everything else still goes out) or is
+disconnected ("disconnect"; its page reconnects and reloads the history). Healthy
+clients' queues also fill while the server works through a burst, so max_queue should
+stay well above what the message rate limits let into a room at once.
+
+python-socketio has no public hook for this: OutboundLimit wraps the server's private
+_send_eio_packet and reads the Engine.IO sockets' queues, as in python-socketio 5.11.4
+and python-engineio 4.9.1 (pinned in requirements.txt). install() checks that both are
+still there and refuses to start otherwise, rather than leaving the queues unbounded.
+'''
+
+import asyncio
+import threading
+import time
+
+from qkd.threads import spawn_thread
+
+def parse_limit(value):
+    # "rate,burst" (tokens per second, bucket size) or "rate" (burst = rate, at least 1) -> (rate, burst); "0" or "" -> None
+    parts = [float(part) for part in str(value).split(",") if part.strip()]
+    if not parts or parts[0] <= 0:
+        return None
+    rate = parts[0]
+    burst = parts[1] if len(parts) > 1 else max(rate, 1.0)
+    return rate, burst
+
+def client_address(environ, trusted_proxies=0):
+    # The client's IP. X-Forwarded-For is only believed behind trusted_proxies proxies of our own
+    # (as werkzeug's ProxyFix x_for): each adds the address it got the request from, so the client is
+    # the trusted_proxies-th entry from the end; anything before it came from the client. Without
+    # proxies (or with fewer entries than proxies) it is the peer address
+    forwarded = environ.get("HTTP_X_FORWARDED_FOR") if trusted_proxies > 0 else None
+    if forwarded:
+        entries = [entry.strip() for entry in forwarded.split(",")]
+        if len(entries) >= trusted_proxies:
+            return entries[-trusted_proxies]
+    return environ.get("REMOTE_ADDR")
+
+class TokenBuckets:
+    ''' Token buckets by key, all with the same rate and burst. take(key) spends a token
+        (False when the bucket is empty). Buckets that have refilled are dropped from
+        time to time, so departed sids and deleted rooms don't pile up.
+    '''
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._buckets = {} # key -> [tokens, time of the last take]
+        self._prune_at = 1024
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) >= self._prune_at:
+                    self._prune(now)
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                return False
+            bucket[0] = tokens - 1
+            return True
+
+    def _prune(self, now):
+        full = now - self.burst / self.rate # Buckets untouched since then are full again
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[1] > full}
+        self._prune_at = max(1024, 2 * len(self._buckets))
+
+    def __len__(self):
+        return len(self._buckets)
+
+class RateLimits:
+    ''' The rate limits of each event and scope: limits is {event: {scope: (rate, burst)}}
+        with scopes "sid", "room" and "address" (None or missing: not limited).
+
+        allow(event, sid=..., room=..., address=...) checks the event's scopes in that order
+        and returns the scope whose bucket was empty (the event is rejected and counted),
+        or None when the event may go ahead.
+    '''
+
+    SCOPES = ("sid", "room", "address")
+
+    def __init__(self, limits, clock=time.monotonic):
+        self._buckets = {
+            (event, scope): TokenBuckets(*limit, clock=clock)
+            for event, scopes in limits.items() for scope, limit in scopes.items() if limit is not None
+        }
+        self.limits = {f"{event}.{scope}": {"rate": buckets.rate, "burst": buckets.burst}
+                       for (event, scope), buckets in self._buckets.items()}
+        self._lock = threading.Lock()
+        self.allowed = {} # event -> events let through
+        self.rejected = {} # (event, scope) -> events rejected
+
+    def allow(self, event, **keys):
+        for scope in self.SCOPES:
+            buckets = self._buckets.get((event, scope))
+            key = keys.get(scope)
+            if buckets is None or key is None:
+                continue
+            if not buckets.take(key):
+                with self._lock:
+                    self.rejected[event, scope] = self.rejected.get((event, scope), 0) + 1
+                return scope
+        with self._lock:
+            self.allowed[event] = self.allowed.get(event, 0) + 1
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "limits": self.limits,
+                "allowed": dict(self.allowed),
+                "rejected": {f"{event}.{scope}": count for (event, scope), count in self.rejected.items()},
+                "buckets": {f"{event}.{scope}": len(buckets) for (event, scope), buckets in self._buckets.items()},
+            }
+
+class OutboundLimit:
+    ''' Bounds the outbound queues of the clients of a socketio.Server or AsyncServer
+        (install(server) wraps its per-client packet send). max_queue of 0 leaves them
+        unbounded. policy "drop" skips the droppable events (chat messages) for a client
+        with a full queue, "disconnect" closes its connection (once, from a background
+        task; packets for it are dropped meanwhile).
+    '''
+
+    POLICIES = ("drop", "disconnect")
+    TESTED_WITH = "python-socketio 5.11.4 / python-engineio 4.9.1"
+
+    def __init__(self, max_queue=500, policy="drop", droppable=("message", "messages"), spawn=None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown outbound queue policy {policy!r}, expected one of {self.POLICIES}")
+        self.max_queue = max_queue
+        self.policy = policy
+        # A Socket.IO event on the default namespace is sent as 2["event",...]
+        self.droppable = tuple(f'2["{event}",' for event in droppable)
+        self.spawn = spawn or spawn_thread
+        self.server = None
+        self._closing = set() # Engine.IO sids being disconnected
+        self._tasks = set() # asyncio disconnects in flight (the loop only keeps weak references)
+        self._lock = threading.Lock()
+
+        # Backpressure metrics:
+        self.dropped = 0
+        self.disconnects = 0
+
+    def install(self, server):
+        self.server = server
+        if self.max_queue <= 0:
+            return server
+        self._check(server)
+        send = server._send_eio_packet
+
+        if asyncio.iscoroutinefunction(send):
+            async def bounded_send(eio_sid, eio_pkt):
+                if self._admit(eio_sid, eio_pkt):
+                    await send(eio_sid, eio_pkt)
+        else:
+            def bounded_send(eio_sid, eio_pkt):
+                if self._admit(eio_sid, eio_pkt):
+                    send(eio_sid, eio_pkt)
+
+        server._send_eio_packet = bounded_send
+        return server
+
+    def _check(self, server):
+        # The private internals install() relies on (see the module docstring)
+        eio = getattr(server, "eio", None)
+        missing = [name for name, present in (
+            ("Server._send_eio_packet", callable(getattr(server, "_send_eio_packet", None))),
+            ("Server.eio.sockets", isinstance(getattr(eio, "sockets", None), dict)),
+            ("Engine.IO socket queues", callable(getattr(eio, "create_queue", None)) and hasattr(eio.create_queue(), "qsize")),
+        ) if not present]
+        if missing:
+            raise RuntimeError(
+                f"Can't bound outbound queues: {', '.join(missing)} not found in this python-socketio/python-engineio "
+                f"(OutboundLimit was written against {self.TESTED_WITH}; set OUTBOUND_QUEUE_MAX=0 to run without it)"
+            )
+
+    def _depth(self, eio_sid):
+        socket = self.server.eio.sockets.get(eio_sid)
+        return socket.queue.qsize() if socket is not None else 0
+
+    def _admit(self, eio_sid, eio_pkt):
+        # Whether the packet may be queued for the client
+        if eio_sid in self._closing:
+            with self._lock:
+                self.dropped += 1
+            return False
+        if self._depth(eio_sid) < self.max_queue:
+            return True
+        if self.policy == "drop":
+            if not (isinstance(eio_pkt.data, str) and eio_pkt.data.startswith(self.droppable)):
+                return True
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            if eio_sid in self._closing:
+                return False
+            self._closing.add(eio_sid)
+            self.disconnects += 1
+            self.dropped += 1
+        self._disconnect(eio_sid)
+        return False
+
+    def _disconnect(self, eio_sid):
+        # Closes the connection without waiting for its queue to drain (it won't, the client isn't
+        # reading) and forgets the socket, so nothing more is queued for it
+        socket = self.server.eio.sockets.get(eio_sid)
+        if socket is None:
+            self._closing.discard(eio_sid)
+            return
+
+        def forget():
+            self.server.eio.sockets.pop(eio_sid, None)
+            self._closing.discard(eio_sid)
+
+        if asyncio.iscoroutinefunction(socket.close):
+            async def close():
+                try:
+                    await socket.close(wait=False, abort=True)
+                finally:
+                    forget()
+            task = asyncio.get_running_loop().create_task(close())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            def close():
+                try:
+                    socket.close(wait=False, abort=True)
+                finally:
+                    forget()
+            self.spawn(close)
+
+    def stats(self):
+        sockets = list(self.server.eio.sockets.values()) if self.server is not None else []
+        depths = [socket.queue.qsize() for socket in sockets]
+        with self._lock:
+            return {
+                "max_queue": self.max_queue,
+                "policy": self.policy,
+                "clients": len(depths),
+                "deepest_queue": max(depths, default=0),
+                "full_queues": sum(depth >= self.max_queue for depth in depths) if self.max_queue > 0 else 0,
+                "dropped": self.dropped,
+                "disconnects": self.disconnects,
+            }
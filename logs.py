@@ -0,0 +1,173 @@
+'''
+Logging for the chat server.
+
+Records go to one logger per category, each with its own level and sampling rate:
+- "server": boot and readiness
+- "qkd": key exchange (pool hits/misses, failures) and, at DEBUG, per-chunk BB84 details
+- "rooms": room lifecycle (create, join, leave, delete, terminate)
+- "messages": chat messages (sender, room and size, never the text)
+Secrets (QKD keys, key bits, decrypted text) are never passed to a logger.
+
+Handlers never do I/O on the event loop: a QueueHandler puts each record on a bounded
+queue that a real OS thread drains to stderr (eventlet's unpatched threading, so the
+writer isn't just another green thread on the hub). When the queue is full records are
+dropped and counted rather than blocking the caller.
+'''
+
+import atexit
+import logging
+import logging.handlers
+import os
+import sys
+
+try:
+    from eventlet.patcher import original # Unpatched stdlib modules, even after monkey-patching
+except ImportError:
+    from importlib import import_module as original
+
+CATEGORIES = ("server", "qkd", "rooms", "messages")
+OFF = logging.CRITICAL + 1
+FORMAT = "%(asctime)s %(levelname)s %(name)s %(message)s"
+
+# Default share of sub-WARNING records kept per category; chat messages are the high-rate one:
+DEFAULT_SAMPLE_RATES = {"messages": 0.01}
+
+_native_queue = original('queue')
+_native_threading = original('threading')
+
+class SamplingFilter(logging.Filter):
+    ''' Keeps a fraction of each category's records below WARNING (deterministically,
+        e.g. every 100th for a rate of 0.01); warnings and errors always pass. Categories
+        are the first part of the logger name, so "qkd.bb84" is sampled as "qkd".
+    '''
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self._credit = dict.fromkeys(rates, 0.0)
+        self.sampled_out = dict.fromkeys(rates, 0)
+
+    def filter(self, record):
+        category = record.name.partition('.')[0]
+        rate = self.rates.get(category, 1.0)
+        if rate >= 1.0 or record.levelno >= logging.WARNING:
+            return True
+        self._credit[category] += rate
+        if self._credit[category] >= 1.0:
+            self._credit[category] -= 1.0
+            return True
+        self.sampled_out[category] += 1
+        return False
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    ''' QueueHandler that drops (and counts) records instead of blocking when the queue is full. '''
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except _native_queue.Full:
+            self.dropped += 1
+
+class _Writer:
+    # Drains the queue into the output handler on a native thread
+    def __init__(self, queue, handler):
+        self.queue = queue
+        self.handler = handler
+        self.written = 0
+        self._thread = _native_threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                return
+            self.handler.handle(record)
+            self.written += 1
+
+    def stop(self, timeout=1.0):
+        try:
+            self.queue.put(None, timeout=timeout)
+        except _native_queue.Full:
+            return
+        self._thread.join(timeout)
+
+_state = {}
+
+def _level(name, default):
+    if not name:
+        return default
+    name = name.upper()
+    if name == "OFF":
+        return OFF
+    level = logging.getLevelName(name)
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level '{name}' (expected DEBUG, INFO, WARNING, ERROR, CRITICAL or OFF)")
+    return level
+
+def configure(environ=os.environ, stream=None):
+    ''' Sets up logging from the environment (once; later calls return the same state):
+        LOG_LEVEL (INFO) for all categories, LOG_LEVEL_<CATEGORY> (a level or OFF) per category,
+        LOG_SAMPLE_<CATEGORY> (0-1) for the share of sub-WARNING records kept and
+        LOG_QUEUE_SIZE (10000) for the records buffered for the writer thread.
+    '''
+    if _state:
+        return _state
+
+    root = logging.getLogger()
+    root.setLevel(logging.WARNING) # Other libraries (qiskit, engineio, ...) only report problems
+    level = _level(environ.get('LOG_LEVEL'), logging.INFO)
+    for category in CATEGORIES:
+        logging.getLogger(category).setLevel(_level(environ.get(f'LOG_LEVEL_{category.upper()}'), level))
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(logging.Formatter(FORMAT))
+    output.lock = _native_threading.RLock() # Only ever taken by the writer thread
+
+    queue_size = int(environ.get('LOG_QUEUE_SIZE', 10000))
+    handler = DroppingQueueHandler(_native_queue.Queue(queue_size))
+    sampler = SamplingFilter({
+        category: float(environ.get(f'LOG_SAMPLE_{category.upper()}', DEFAULT_SAMPLE_RATES.get(category, 1.0)))
+        for category in CATEGORIES
+    })
+    handler.addFilter(sampler)
+    root.addHandler(handler)
+
+    _state.update(handler=handler, output=output, sampler=sampler, queue_size=queue_size,
+                  writer=_Writer(handler.queue, output))
+    atexit.register(lambda: _state["writer"].stop())
+    # Worker processes forked by the QKD executor inherit the handler but not the writer thread:
+    os.register_at_fork(after_in_child=_restart_writer)
+    return _state
+
+def _restart_writer():
+    handler = _state["handler"]
+    handler.queue = _native_queue.Queue(_state["queue_size"])
+    _state["writer"] = _Writer(handler.queue, _state["output"])
+
+def _level_name(level):
+    return "OFF" if level >= OFF else logging.getLevelName(level)
+
+def stats():
+    if not _state:
+        return {"configured": False}
+    handler, sampler = _state["handler"], _state["sampler"]
+    return {
+        "configured": True,
+        "categories": {
+            category: {
+                "level": _level_name(logging.getLogger(category).level),
+                "sample_rate": sampler.rates[category],
+                "sampled_out": sampler.sampled_out[category],
+            }
+            for category in CATEGORIES
+        },
+        "queued": handler.queue.qsize(),
+        "queue_size": _state["queue_size"],
+        "dropped": handler.dropped,
+        "written": _state["writer"].written,
+    }
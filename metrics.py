@@ -0,0 +1,228 @@
+'''
+Prometheus metrics for GET /metrics, in the text exposition format (0.0.4), without a
+client library.
+
+Counters and histograms are updated where things happen, which costs a dict lookup and
+an add under a lock. Values other components already keep (room counts, history sizes,
+the broadcaster's totals) are read by collectors only when /metrics is scraped, so
+nothing is tracked twice and a scrape costs about as much as the JSON stats routes.
+
+Every gunicorn worker has its own registry: counters and histograms are per worker
+(scrape each worker, or run one), while the room gauges come from the room store, which
+all workers share when REDIS_URL is set.
+'''
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left
+
+from qkd.threads import spawn_thread
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from sub-millisecond protocol stages up to a connect stuck behind a busy executor
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+server_log = logging.getLogger("server")
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(pairs):
+    # {name="value",...} or "" without labels
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}" if pairs else ""
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+def _header(name, kind, help):
+    return [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {} # label values -> value
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self):
+        with self._lock:
+            values = list(self._values.items())
+        return _header(self.name, self.kind, self.help) + [
+            f"{self.name}{_labels(list(zip(self.label_names, key)))} {_number(value)}" for key, value in values
+        ]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * len(self.buckets) + [0.0] # per-bucket counts, then the sum
+            counts[bisect_left(self.buckets, value)] += 1 # First bucket with value <= le
+            counts[-1] += value
+
+    def render(self):
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in self._values.items()]
+        lines = _header(self.name, self.kind, self.help)
+        for key, counts in values:
+            pairs = list(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(pairs + [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(pairs)} {_number(counts[-1])}")
+            lines.append(f"{self.name}_count{_labels(pairs)} {cumulative}")
+        return lines
+
+class Registry:
+    ''' The metrics of this process, rendered by render() in registration order.
+
+        collector(callback) adds values read at scrape time: callback() returns
+        [(name, kind, help, samples)] where samples is a number or [(labels dict, value)].
+        A collector that fails (e.g. Redis unavailable) is left out of that scrape.
+    '''
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self.scrapes = 0
+        self.collector_errors = 0
+        self.last_scrape = 0.0 # Seconds the previous render() took
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def collector(self, callback):
+        self._collectors.append(callback)
+        return callback
+
+    def render(self):
+        started = time.perf_counter()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for callback in self._collectors:
+            try:
+                families = list(callback())
+            except Exception as error:
+                self.collector_errors += 1
+                server_log.warning("metrics collector failed collector=%s error=%s", callback.__name__, type(error).__name__)
+                continue
+            for name, kind, help, samples in families:
+                lines.extend(_header(name, kind, help))
+                if not isinstance(samples, list):
+                    samples = [({}, samples)]
+                lines.extend(f"{name}{_labels(list(labels.items()))} {_number(value)}" for labels, value in samples)
+        self.scrapes += 1
+        lines.extend(_header("metrics_scrape_seconds", "gauge", "Time the previous scrape of this worker took"))
+        lines.append(f"metrics_scrape_seconds {_number(self.last_scrape)}")
+        lines.extend(_header("metrics_collector_errors_total", "counter", "Collectors left out of a scrape because they failed"))
+        lines.append(f"metrics_collector_errors_total {self.collector_errors}")
+        self.last_scrape = time.perf_counter() - started
+        return "\n".join(lines) + "\n"
+
+def count_emits(server, counter):
+    ''' Counts every event server (a socketio.Server or AsyncServer) emits, by event name,
+        in counter. Flask-SocketIO's emit() and SocketIO.emit() both end up in server.emit.
+    '''
+    emit = server.emit
+
+    def counted_emit(event, *args, **kwargs):
+        counter.inc(event=event)
+        return emit(event, *args, **kwargs)
+
+    server.emit = counted_emit
+    return server
+
+class LoopLagMonitor:
+    ''' Measures event loop lag: a background task sleeps for interval seconds and records
+        how much later than that it woke up. Under eventlet that is how long a green thread
+        that became ready had to wait for the hub, i.e. for whatever was running to yield.
+
+        spawn/sleep are socketio's start_background_task and sleep, so the task runs on the
+        loop it measures. On an asyncio loop (asgi.py) run_async() is run as a task instead.
+    '''
+
+    def __init__(self, histogram, gauge, interval=0.5, spawn=None, sleep=time.sleep, clock=time.perf_counter):
+        self.histogram = histogram
+        self.gauge = gauge
+        self.interval = interval
+        self.spawn = spawn or spawn_thread
+        self.sleep = sleep
+        self.clock = clock
+        self._started = False
+
+    def start(self):
+        if self._started or self.interval <= 0:
+            return self
+        self._started = True
+        self.spawn(self._run)
+        return self
+
+    def _run(self):
+        while True:
+            started = self.clock()
+            self.sleep(self.interval)
+            self._record(started)
+
+    async def run_async(self):
+        if self.interval <= 0:
+            return
+        while True:
+            started = self.clock()
+            await asyncio.sleep(self.interval)
+            self._record(started)
+
+    def _record(self, started):
+        lag = max(self.clock() - started - self.interval, 0.0)
+        self.histogram.observe(lag)
+        self.gauge.set(lag)
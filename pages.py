@@ -0,0 +1,157 @@
+'''
+The Flask app: the home and room pages and the JSON/Prometheus stats routes. Served by
+both server modes, directly by Flask-SocketIO (main.py) and under uvicorn through a WSGI
+adapter next to the asyncio Socket.IO server (asgi.py).
+'''
+
+import logging
+
+from flask import Flask, Response, render_template, request, session, redirect, url_for, jsonify
+
+import logs
+from metrics import CONTENT_TYPE
+
+rooms_log = logging.getLogger("rooms")
+
+def create_app():
+    # Create an instance of the app:
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = "very_secret_key" #TODO: See how to make this more secure
+    return app
+
+def register_pages(app, services):
+    ''' Adds the routes to app; they use the components of services (see services.py). '''
+    room_store = services.room_store
+    room_lifecycle = services.room_lifecycle
+
+    # Function to generate a random bright color
+    # def generate_bright_color():
+    #     return "#{:02x}{:02x}{:02x}".format(random.randint(128, 255), random.randint(128, 255), random.randint(128, 255))
+
+
+    # Define routing for home page:
+    @app.route('/', methods=["GET", "POST"])
+    def home():
+        # Clear session data:
+        session.clear()
+        # Wait for post request from front-end (after submission of form):
+        if request.method == "POST":
+            name = request.form.get("name")
+            code = request.form.get("code")
+            join = request.form.get("join", False) # .get() function attempts to get a value from dictionary else returns None (but we set it to a default value of False, instead of None)
+            create = request.form.get("create", False)
+            qkd_debug = request.form.get("qkd_debug") is not None # Creator's opt-in to QKD details for every member
+
+            # Check if user didn't pass their name (regardless of joining or creating a room):
+            if not name:
+                return render_template("home.html", error="Please enter a name.", code=code, name=name) # To prevent removal of entered text (because post request refresh the page)
+
+            # Check if user wants to join, but didn't provide a room code:
+            if join != False and not code:
+                return render_template("home.html", error="Please enter a room code.", code=code, name=name)
+
+            # Normalize the room code to uppercase for storage and comparison
+            room = code.upper() if code else None
+
+            rooms_log.debug("home post room=%s create=%s rooms=%d", room, create != False, room_store.count())
+
+            # Check if user wants to create a room (once the form is valid, so failed posts leave no room behind):
+            if create != False:
+                room = room_lifecycle.create(name, qkd_debug=qkd_debug)  # Free code from the pool; initializes 'users' and 'creator'
+                if room is None:
+                    return render_template("home.html", error="No room codes left, please try again later.", code=code, name=name)
+                session["is_new_room"] = True  # Add this flag to indicate a newly created room
+
+            # Else, if user wants to join a room with code:
+            # 1) If invalid code:
+            elif not room_store.exists(code.upper()):
+                return render_template("home.html", error="Room does not exist.", code=code, name=name)
+
+            # 2) If valid code (or even in the case of creating a room):
+            # Instead of advanced user authentication,
+            # Use sessions that are semi-permanent user-data storage by server:
+            # While running, use incognito tabs to have different sessions
+            session["room"] = room
+            session["name"] = name
+            session["key"] = None #* Initialize with no key
+            return redirect(url_for("room")) # Redirect to chatroom
+
+        return render_template("home.html") # Render the HTML code for the home page
+        #Note: no need to pass the name and code since this is for get requests only, not for posts, which refresh the page
+
+    # Define code & routing for chat room:
+    @app.route('/room', methods=["POST", "GET"])
+    def room():
+        # To prevent user directly entering the /room without creating / joining a room:
+        room = session.get("room")
+        if room is None or session.get("name") is None or not room_store.exists(room):
+            return redirect(url_for("home"))
+
+        # Render the HTML for the chat room with only the latest messages; older ones are fetched by cursor ("requestHistory"):
+        latest, cursor = room_store.latest_messages(room, services.history_initial)
+        return render_template("room.html", code=room, messages=latest, cursor=cursor, socketio_options=services.socketio_options)
+
+    # Readiness probe for load balancers / deploy checks:
+    @app.route('/ready')
+    def ready():
+        return jsonify(services.readiness), 200 if services.readiness["ready"] else 503
+
+    # Key pool metrics:
+    @app.route('/qkd/pool')
+    def qkd_pool():
+        return jsonify(services.key_pool.stats())
+
+    # Key rotation metrics:
+    @app.route('/qkd/rotation')
+    def qkd_rotation():
+        return jsonify(services.key_rotator.stats())
+
+    # Aer batching metrics:
+    @app.route('/qkd/batcher')
+    def qkd_batcher():
+        return jsonify(services.aer_batcher.stats())
+
+    # QKD worker process metrics:
+    @app.route('/qkd/executor')
+    def qkd_executor_stats():
+        if services.qkd_executor is None:
+            return jsonify({"processes": 0})
+        return jsonify(services.qkd_executor.stats())
+
+    # Room lifecycle metrics (live, empty and leaked rooms, codes left, reaped rooms):
+    @app.route('/rooms')
+    def rooms_stats():
+        return jsonify(room_lifecycle.stats())
+
+    # Message history memory per room (room codes are left out, they are what grants access to a room):
+    @app.route('/history')
+    def history_stats():
+        per_room = sorted(room_store.history_stats(), key=lambda stats: stats["bytes"], reverse=True)
+        return jsonify({
+            "rooms": len(per_room),
+            "messages": sum(stats["messages"] for stats in per_room),
+            "bytes": sum(stats["bytes"] for stats in per_room),
+            "per_room": per_room,
+        })
+
+    # Outbound message coalescing metrics (messages, frames, average batch size):
+    @app.route('/broadcast')
+    def broadcast_stats():
+        return jsonify(services.broadcaster.stats())
+
+    # Rate limits and outbound queues (events allowed and rejected per scope, deepest queue, drops):
+    @app.route('/limits')
+    def limits_stats():
+        return jsonify({"rate": services.rate_limits.stats(), "outbound": services.outbound.stats()})
+
+    # Logging metrics (queue depth, dropped and sampled-out records per category):
+    @app.route('/logging')
+    def logging_stats():
+        return jsonify(logs.stats())
+
+    # Prometheus text exposition of the metrics in services.py (see metrics.py):
+    @app.route('/metrics')
+    def metrics_route():
+        return Response(services.metrics.render(), content_type=CONTENT_TYPE)
+
+    return app
@@ -0,0 +1,11 @@
+from .bb84 import generate_key, ChannelTooNoisy, BB84Pipeline, StageProfiler, sift, estimate_qber, cascade_stage, biconf_stage, reconcile, amplify
+from .amplification import AMPLIFIERS, get_amplifier
+from .cipher import key_bytes, xor_decrypt
+from .biconf import biconf
+from .cascade import cascade
+from .backends import BACKENDS, get_backend
+from .batching import AerBatcher
+from .executor import QKDExecutor, QKDBusy
+from .keypool import KeyPool
+from .bulk import generate_keys
+from .warmup import warm_up
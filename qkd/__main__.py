@@ -0,0 +1,87 @@
+'''
+Bulk BB84 key generation: python -m qkd
+
+Generates --keys keys on --processes worker processes (all cores by default) and writes
+them to --output, one per line as a binary string (or hex with --format hex); without
+--output the keys are thrown away, which is what a capacity planning run wants. A
+report of keys/sec, secure bits/sec (the estimate the key lengths are sized from, see
+qkd.amplification.secure_length), chunks per key and time per stage goes to stderr.
+With --seed the output only depends on the seed and --batch-size (numpy backend).
+
+Usage: python -m qkd --keys 1000 [--output keys.txt | -] [--processes 4] [--backend numpy]
+                     [--key-length 256] [--amplification hash] [--chunk-qubits 1024] [--seed 1]
+                     [--bit-flip-rate 0.03] [--phase-flip-rate 0.03]
+'''
+
+import argparse
+import os
+import sys
+
+from .backends import BIT_FLIP_RATE, PHASE_FLIP_RATE
+from .bb84 import KEY_BITS, N_QUBITS
+from .bulk import generate_keys
+from .cipher import key_bytes
+
+STAGE_ORDER = ("distribution", "sifting", "qber", "cascade", "biconf", "amplification")
+
+def report(stats, key_length, file=sys.stderr):
+    keys, seconds, processes = stats["keys"], stats["seconds"], stats["processes"]
+    rate = keys / seconds if seconds else float("nan")
+    print(f"{keys} keys of {key_length} bits in {seconds:.2f} s on {processes} process(es) "
+          f"(+{stats['warm_up_seconds']:.2f} s warm-up)", file=file)
+    print(f"keys/s          {rate:.1f} ({rate / processes:.1f} per process)", file=file)
+    print(f"key bits/s      {rate * key_length:.0f}", file=file)
+    print(f"secure bits/s   {stats.get('secure_bits', 0) / seconds if seconds else float('nan'):.0f} "
+          f"(reconciled bits less disclosed parity bits and the QBER's share)", file=file)
+    if keys:
+        print(f"chunks/key      {stats['chunks'] / keys:.2f} ({stats['aborted'] / keys:.2f} aborted), "
+              f"{stats['qubits'] / keys:.0f} qubits, {stats['reconciled_bits'] / keys:.0f} reconciled bits, "
+              f"{stats['leaked_bits'] / keys:.0f} disclosed, {stats['secure_bits'] / keys:.0f} secure", file=file)
+        stage_ms = stats.get("stage_ms", {})
+        stages = [stage for stage in STAGE_ORDER if stage in stage_ms] + [stage for stage in stage_ms if stage not in STAGE_ORDER]
+        total = sum(stage_ms.values()) or 1
+        print("ms/key per stage " + "  ".join(f"{stage} {stage_ms[stage] / keys:.3f} ({100 * stage_ms[stage] / total:.0f}%)"
+                                              for stage in stages), file=file)
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m qkd", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", type=int, default=1000, help="number of keys to generate")
+    parser.add_argument("--output", help="file to write the keys to ('-' for stdout)")
+    parser.add_argument("--format", choices=("bin", "hex"), default="bin")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="worker processes (1 = this process)")
+    parser.add_argument("--batch-size", type=int, default=50, help="keys per task handed to a worker")
+    parser.add_argument("--backend", default="numpy")
+    parser.add_argument("--key-length", type=int, help=f"final key length in bits (default {KEY_BITS})")
+    parser.add_argument("--amplification", default="hash", help="privacy amplification mode")
+    parser.add_argument("--chunk-qubits", type=int, default=N_QUBITS, help="qubits simulated per chunk")
+    parser.add_argument("--seed", type=int, help="seed for reproducible keys")
+    parser.add_argument("--bit-flip-rate", type=float, default=BIT_FLIP_RATE, help="channel bit-flip probability per qubit")
+    parser.add_argument("--phase-flip-rate", type=float, default=PHASE_FLIP_RATE, help="channel phase-flip probability per qubit")
+    args = parser.parse_args()
+
+    if args.output == "-":
+        output = sys.stdout
+    elif args.output:
+        output = open(args.output, "w")
+    else:
+        output = None
+
+    stats = {}
+    keys = generate_keys(args.keys, processes=args.processes, batch_size=args.batch_size, key_length=args.key_length,
+                         seed=args.seed, stats=stats, backend=args.backend, chunk_qubits=args.chunk_qubits,
+                         amplification=args.amplification, bit_flip_rate=args.bit_flip_rate,
+                         phase_flip_rate=args.phase_flip_rate)
+    try:
+        for key in keys:
+            if output is not None:
+                output.write((key_bytes(key).hex() if args.format == "hex" else key) + "\n")
+    finally:
+        if output not in (None, sys.stdout):
+            output.close()
+
+    report(stats, args.key_length or KEY_BITS)
+    if args.output and args.output != "-":
+        print(f"Keys written to {args.output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
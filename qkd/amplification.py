@@ -0,0 +1,126 @@
+from math import log2
+from random import randrange
+import hashlib
+
+import numpy as np
+
+'''
+STEP 5: PRIVACY AMPLIFICATION: (THROUGH HASHING)
+
+Two modes, both fed one chunk of reconciled key bits at a time:
+- "toeplitz": universal hashing with a random Toeplitz matrix over the packed key bits
+- "hash": the original SHA-256 / SHA3-256 hashing
+
+How long the key may be is secure_length's call: the reconciled bits an eavesdropper can't
+know, given the error rate and the parity bits reconciliation disclosed.
+'''
+
+def binary_entropy(p):
+    # h(p) = -p log2 p - (1 - p) log2 (1 - p)
+    if p <= 0 or p >= 1:
+        return 0.0
+    return -p * log2(p) - (1 - p) * log2(1 - p)
+
+def secure_length(reconciled, leaked, qber):
+    ''' Key bits privacy amplification can distill from reconciled bits: the asymptotic BB84
+        bound reconciled * (1 - h(qber)) - leaked, h(qber) per bit for what an eavesdropper
+        causing that error rate may know and one per parity bit Cascade and BICONF disclosed.
+        0 when nothing is left, which at a QBER of about 11% or more is always the case.
+    '''
+    return max(0, int(reconciled * (1 - binary_entropy(qber)) - leaked))
+
+class HashAmplifier:
+    ''' Privacy amplification by hashing, fed one chunk of reconciled key bits at a time
+        so long keys never have to be held in memory as a whole.
+
+        Each chunk is hashed together with a random seed (salt) of the same length. The
+        hash function is picked by the first key bit: SHA-256 if it is 1, SHA3-256 otherwise.
+        Keys longer than one digest are read out in counter mode: H(state || 0), H(state || 1), ...
+        (which can't hold more than one digest's worth of secure bits).
+    '''
+
+    def __init__(self, rng=None):
+        self._rng = rng # numpy Generator for the seeds; the random module when None
+        self._hash = None
+        self.name = None
+
+    def update(self, bits):
+        # Generating seed (salt):
+        seed = [randrange(2) for _ in bits] if self._rng is None else self._rng.integers(0, 2, len(bits)).tolist()
+
+        # Checking first bit to decide hash function to use:
+        if self._hash is None:
+            if bits[0]==1:
+                self._hash, self.name = hashlib.sha256(), "SHA-256"
+            else:
+                self._hash, self.name = hashlib.sha3_256(), "SHA3-256"
+
+        # Converting lists to strings and adding seeds to the keys:
+        self._hash.update((''.join(map(str, bits)) + ''.join(map(str, seed))).encode())
+
+    def bits(self, length):
+        # Final key as a binary string of exactly length bits
+        digest_bits = self._hash.digest_size * 8
+        if length <= digest_bits:
+            digest = self._hash.digest()
+        else:
+            blocks = []
+            for counter in range(-(-length // digest_bits)):
+                block = self._hash.copy()
+                block.update(counter.to_bytes(4, 'big'))
+                blocks.append(block.digest())
+            digest = b''.join(blocks)
+        value = int.from_bytes(digest, 'big') >> (8 * len(digest) - length)
+        return format(value, f'0{length}b')
+
+class ToeplitzAmplifier:
+    ''' Privacy amplification by universal hashing: the n reconciled bits x are
+        multiplied (mod 2) by a random length x n Toeplitz matrix T, T[i][j] = seed[i - j + n - 1],
+        drawn from a seed of length + n - 1 bits. T x is a slice of the convolution of seed
+        and x, which is computed with an FFT in O(n log n) instead of the O(length * n)
+        matrix product, so it scales to long keys. The output can't be longer than the input,
+        and generate_key makes it as long as secure_length of the input allows at most, so
+        the key is the input compressed by what reconciliation disclosed and the QBER.
+
+        Chunks are kept packed 8 bits per byte until the key is read out.
+    '''
+
+    name = "Toeplitz"
+
+    def __init__(self, rng=None):
+        self._rng = rng or np.random.default_rng()
+        self._chunks = [] # (packed bits, bit count)
+        self.n = 0
+
+    def update(self, bits):
+        bits = np.asarray(bits, dtype=np.uint8)
+        self._chunks.append((np.packbits(bits), len(bits)))
+        self.n += len(bits)
+
+    def bits(self, length):
+        # Final key as a binary string of exactly length bits
+        if length > self.n:
+            raise ValueError(f"Toeplitz hashing can't produce {length} bits from {self.n} reconciled bits")
+        key = np.concatenate([np.unpackbits(packed, count=count) for packed, count in self._chunks])
+        seed = self._rng.integers(0, 2, length + self.n - 1, dtype=np.uint8)
+        return (toeplitz_hash(key, seed, length) + ord('0')).tobytes().decode()
+
+def toeplitz_hash(bits, seed, length):
+    # T x mod 2 for T[i][j] = seed[i - j + n - 1], as uint8 bits
+    # A circular convolution as long as the seed is enough: the terms that wrap around
+    # only land below index n - 1, before the slice that is read out.
+    n = len(bits)
+    size = 1 << (len(seed) - 1).bit_length()
+    product = np.fft.irfft(np.fft.rfft(seed, size) * np.fft.rfft(bits, size), size)
+    return (np.rint(product[n - 1:n - 1 + length]).astype(np.int64) & 1).astype(np.uint8)
+
+AMPLIFIERS = {
+    "toeplitz": ToeplitzAmplifier,
+    "hash": HashAmplifier,
+}
+
+def get_amplifier(name):
+    try:
+        return AMPLIFIERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown privacy amplification mode '{name}' (expected one of: {', '.join(AMPLIFIERS)})") from None
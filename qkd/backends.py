@@ -0,0 +1,155 @@
+'''
+STEP 1 BACKENDS: DISTRIBUTING QUANTUM STATES
+
+Each backend takes the number of qubits to send, plus the channel's bit_flip_rate and
+phase_flip_rate, and returns (send_list, alice_basis, bob_basis, received) as plain lists, e.g.
+([1, 0, ...], ['Z', 'X', ...], ['X', 'X', ...], [0, 0, ...]).
+
+- "qiskit": reference backend, binds the session's states into a cached circuit template
+  and runs it on Aer with the channel as a noise model
+- "numpy": computes the same prepare-and-measure statistics directly on arrays
+- "qiskit-batched": same circuits as "qiskit", but many users' circuits share one Aer job
+  (registered by qkd.batching.AerBatcher)
+'''
+
+from functools import lru_cache
+from math import pi
+from random import randrange
+
+# Channel noise: on its way to Bob every qubit is bit-flipped (X) with probability
+# BIT_FLIP_RATE and, independently, phase-flipped (Z) with probability PHASE_FLIP_RATE.
+# The defaults give a 3% error rate on matching bases, a fiber link's. The original
+# channel drew a 1/7 bit-flip and phase-flip for each of Alice's gates, ~13.3%, which is
+# past the ~11% at which privacy amplification has no secure bits left to keep.
+BIT_FLIP_RATE = PHASE_FLIP_RATE = 0.03
+
+# Every state and measurement is a single RY rotation, so one circuit structure serves all sessions:
+ALICE_ANGLES = {(0, 'Z'): 0.0, (1, 'Z'): pi, (0, 'X'): pi/2, (1, 'X'): -pi/2} # (bit, basis) -> |0>, |1>, |+>, |->
+BOB_ANGLES = {'Z': 0.0, 'X': -pi/2} # Rotates the X basis onto Z before measuring
+
+class CircuitTemplate:
+    ''' The BB84 circuit for n_qubits qubits with the session's choices left as parameters:
+        qubit i is prepared with RY(alice[i]) (labelled "alice", which is where the channel
+        noise model attaches its errors), rotated with RY(bob[i]) and measured into bit i.
+        Building it is paid once per qubit count (see circuit_template); a session only
+        binds its angles.
+    '''
+
+    def __init__(self, n_qubits):
+        from qiskit import QuantumCircuit
+        from qiskit.circuit import ParameterVector
+        from qiskit.circuit.library import RYGate
+
+        self.n_qubits = n_qubits
+        self.alice = ParameterVector("alice", n_qubits)
+        self.bob = ParameterVector("bob", n_qubits)
+        self.circuit = QuantumCircuit(n_qubits, n_qubits, name='bob')
+        for i in range(n_qubits):
+            self.circuit.append(RYGate(self.alice[i], label="alice"), [i])
+            self.circuit.ry(self.bob[i], i)
+            self.circuit.measure(i, i)
+
+    def bind(self, alice_angles, bob_angles):
+        # Parameters are ordered alice[0..n-1], bob[0..n-1] (by name, then index)
+        return self.circuit.assign_parameters(list(alice_angles) + list(bob_angles))
+
+@lru_cache(maxsize=None)
+def circuit_template(n_qubits):
+    return CircuitTemplate(n_qubits)
+
+@lru_cache(maxsize=None)
+def channel_noise(bit_flip_rate=BIT_FLIP_RATE, phase_flip_rate=PHASE_FLIP_RATE):
+    ''' Aer noise model of the channel: a Pauli error after Alice's preparation gate.
+        None for a noiseless channel.
+    '''
+    from qiskit_aer.noise import NoiseModel, pauli_error
+
+    errors = [pauli_error([(pauli, rate), ('I', 1 - rate)])
+              for pauli, rate in (('X', bit_flip_rate), ('Z', phase_flip_rate)) if rate > 0]
+    if not errors:
+        return None
+    error = errors[0] if len(errors) == 1 else errors[0].compose(errors[1])
+    noise_model = NoiseModel()
+    noise_model.add_all_qubit_quantum_error(error, "alice")
+    return noise_model
+
+@lru_cache(maxsize=None)
+def simulator(bit_flip_rate=BIT_FLIP_RATE, phase_flip_rate=PHASE_FLIP_RATE):
+    ''' Aer simulator of the channel. The noise model is given to the simulator once rather
+        than with every run, which would convert it again each time.
+    '''
+    from qiskit_aer import AerSimulator
+
+    # Qubits are never entangled, so a matrix product state stays tiny however many there are
+    # (the statevector method Aer would pick for non-Clifford RY gates grows as 2^n):
+    return AerSimulator(method="matrix_product_state", noise_model=channel_noise(bit_flip_rate, phase_flip_rate))
+
+def build_circuits(n_qubits):
+    ''' Draws Alice's random bits/bases and Bob's random bases and binds them into the
+        template for n_qubits. Returns (send_list, alice_basis, bob_basis, bob) where bob is
+        the circuit to run (on a channel's simulator).
+    '''
+    send_list = [randrange(2) for _ in range(n_qubits)] # Initial bit string to send
+    alice_basis = ['ZX'[randrange(2)] for _ in range(n_qubits)] # Alice's encoding bases
+    bob_basis = ['ZX'[randrange(2)] for _ in range(n_qubits)] # Bob's decoding bases
+
+    bob = circuit_template(n_qubits).bind(
+        [ALICE_ANGLES[bit, basis] for bit, basis in zip(send_list, alice_basis)],
+        [BOB_ANGLES[basis] for basis in bob_basis],
+    )
+    return send_list, alice_basis, bob_basis, bob
+
+def received_bits(counts):
+    # Bob's bits from the counts of a single-shot run (qiskit orders bits right to left)
+    from .bb84 import print_outcomes_in_reverse
+    return list(map(int, print_outcomes_in_reverse(counts)))
+
+def qiskit_distribute(n_qubits, bit_flip_rate=BIT_FLIP_RATE, phase_flip_rate=PHASE_FLIP_RATE):
+    send_list, alice_basis, bob_basis, bob = build_circuits(n_qubits)
+
+    # Run the bob circuit:
+    job = simulator(bit_flip_rate, phase_flip_rate).run(bob, shots=1)
+    received = received_bits(job.result().get_counts(0))
+
+    return send_list, alice_basis, bob_basis, received
+
+def numpy_distribute(n_qubits, rng=None, bit_flip_rate=BIT_FLIP_RATE, phase_flip_rate=PHASE_FLIP_RATE):
+    ''' Exact array version of qiskit_distribute.
+
+        Every qubit is H^a X^b |0> (bit b, basis a: 0=Z, 1=X). The channel flips the qubit
+        (X) with probability bit_flip_rate and its phase (Z) with probability
+        phase_flip_rate. Pauli errors commute up to a global phase, so:
+        - a bit-flip changes the outcome of a Z-basis state
+        - a phase-flip changes the outcome of an X-basis state
+        If Bob measures in the other basis his outcome is a fair coin.
+    '''
+    import numpy as np
+
+    rng = rng or np.random.default_rng()
+
+    send = rng.integers(0, 2, n_qubits, dtype=np.int8) # Alice's bits
+    alice_x = rng.integers(0, 2, n_qubits, dtype=np.int8) # 1 -> X basis (h-gate applied)
+    bob_x = rng.integers(0, 2, n_qubits, dtype=np.int8)
+
+    bit_flips = rng.random(n_qubits) < bit_flip_rate
+    phase_flips = rng.random(n_qubits) < phase_flip_rate
+
+    flipped = np.where(alice_x == 1, phase_flips, bit_flips).astype(np.int8)
+    received = np.where(alice_x == bob_x, send ^ flipped, rng.integers(0, 2, n_qubits, dtype=np.int8))
+
+    bases = np.array(['Z', 'X'])
+    return send.tolist(), bases[alice_x].tolist(), bases[bob_x].tolist(), received.tolist()
+
+BACKENDS = {
+    "qiskit": qiskit_distribute,
+    "numpy": numpy_distribute,
+}
+
+def register_backend(name, distribute):
+    BACKENDS[name] = distribute
+
+def get_backend(name):
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown QKD backend '{name}' (expected one of: {', '.join(BACKENDS)})") from None
@@ -0,0 +1,132 @@
+import time
+import threading
+
+from .backends import BIT_FLIP_RATE, PHASE_FLIP_RATE, build_circuits, received_bits, register_backend, simulator
+from .threads import spawn_thread
+
+class _Request:
+    __slots__ = ("circuit", "simulator", "event", "counts", "error", "submitted")
+
+    def __init__(self, circuit, simulator, event):
+        self.circuit = circuit
+        self.simulator = simulator
+        self.event = event
+        self.counts = None
+        self.error = None
+        self.submitted = time.perf_counter()
+
+class AerBatcher:
+    ''' Collects Bob circuits from concurrent key requests and runs them as a single
+        multi-circuit AerSimulator job, so job setup and transpilation are paid once per
+        batch instead of once per user.
+
+        A batch is flushed window seconds after its first circuit arrives, or straight away
+        once it reaches max_batch_size. Callers block in distribute() until their own
+        counts come back.
+
+        spawn/sleep/event let the batcher run on green threads (e.g. socketio's
+        start_background_task, sleep and server.eio.create_event) as well as OS threads.
+    '''
+
+    def __init__(self, max_batch_size=16, window=0.02, timeout=30.0,
+                 spawn=None, sleep=time.sleep, event=threading.Event):
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self.timeout = timeout
+        self.spawn = spawn or spawn_thread
+        self.sleep = sleep
+        self.event = event
+
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_scheduled = False
+
+        # Batching metrics:
+        self.batches = 0
+        self.requests = 0
+        self.max_batch_seen = 0
+        self.total_wait = 0.0 # Seconds between submitting a circuit and getting its counts
+        self.max_wait = 0.0
+        self.batch_sizes = {} # batch size -> number of batches of that size
+
+    def register(self, name="qiskit-batched"):
+        # Make the batcher selectable as a QKD backend:
+        register_backend(name, self.distribute)
+        return self
+
+    def distribute(self, n_qubits, bit_flip_rate=BIT_FLIP_RATE, phase_flip_rate=PHASE_FLIP_RATE):
+        send_list, alice_basis, bob_basis, bob = build_circuits(n_qubits)
+        counts = self.run(bob, simulator(bit_flip_rate, phase_flip_rate))
+        return send_list, alice_basis, bob_basis, received_bits(counts)
+
+    def run(self, circuit, simulator=None):
+        # Queue a single-shot circuit (for simulator, the default channel's if None) and wait for its counts:
+        request = _Request(circuit, simulator, self.event())
+        batch = None
+        with self._lock:
+            self._pending.append(request)
+            if len(self._pending) >= self.max_batch_size:
+                batch, self._pending = self._pending, []
+            elif not self._flush_scheduled:
+                self._flush_scheduled = True
+                self.spawn(self._flush_later)
+
+        if batch:
+            self._execute(batch)
+
+        if not request.event.wait(self.timeout):
+            raise TimeoutError(f"Aer batch did not complete within {self.timeout}s")
+        if request.error is not None:
+            raise request.error
+        return request.counts
+
+    def _flush_later(self):
+        self.sleep(self.window)
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._flush_scheduled = False
+        if batch:
+            self._execute(batch)
+
+    def _execute(self, batch):
+        # One Aer job per simulator in the batch (a single one unless callers use different channels):
+        groups = {}
+        for request in batch:
+            groups.setdefault(request.simulator or simulator(), []).append(request)
+        for channel_simulator, group in groups.items():
+            try:
+                result = channel_simulator.run([request.circuit for request in group], shots=1).result()
+                for i, request in enumerate(group):
+                    request.counts = result.get_counts(i)
+            except Exception as error:
+                for request in group:
+                    request.error = error
+
+        finished = time.perf_counter()
+        with self._lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+            for request in batch:
+                wait = finished - request.submitted
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+
+        for request in batch:
+            request.event.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "window_ms": round(1000 * self.window, 2),
+                "queued": len(self._pending),
+                "batches": self.batches,
+                "requests": self.requests,
+                "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else None,
+                "max_batch_seen": self.max_batch_seen,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                "avg_wait_ms": round(1000 * self.total_wait / self.requests, 2) if self.requests else None,
+                "max_wait_ms": round(1000 * self.max_wait, 2),
+            }
@@ -0,0 +1,431 @@
+import cProfile
+import logging
+import pstats
+import time
+from random import Random, randrange
+
+import numpy as np
+
+from .amplification import get_amplifier, secure_length
+from .backends import BIT_FLIP_RATE, PHASE_FLIP_RATE, get_backend, numpy_distribute
+from .biconf import DEFAULT_ROUNDS, biconf
+from .cascade import DEFAULT_PASSES, cascade, initial_block_size
+
+'''
+MAJOR STEPS INVOLVED IN THE BB84 QKD PROTOCOL:
+1) DISTRIBUTING QUANTUM STATES
+2) SIFTING
+3) COMPUTING QBER
+4) INFORMATION RECONCILIATION (IF NOISY CHANNEL IS USED)
+5) PRIVACY AMPLIFICATION
+'''
+
+N_QUBITS = 1024 # Qubits sent per protocol run (one chunk); small chunks disclose more parity bits than they hold
+KEY_BITS = 256 # Default final key length
+QBER_THRESHOLD = 0.11 # Chunks are aborted (and re-run) at or above this error rate, past which no secure bits are left
+GIVE_UP_CHUNKS = 16 # Chunks run without a single secure bit before the channel is given up on
+CASCADE_PASSES = DEFAULT_PASSES # Cascade passes per chunk (each doubles the block size)
+BICONF_ROUNDS = DEFAULT_ROUNDS # Random-subset parity checks after Cascade
+
+logger = logging.getLogger(__name__) # "qkd" log category; never given key bits
+
+#####################################################################################################
+
+'''
+STEP 0: DEFINING HELPER FUNCTIONS:
+'''
+
+class ChannelTooNoisy(Exception):
+    ''' Raised when the channel's error rate leaves no secure bits to make a key from. '''
+
+def _no_debug(message, msg_type='info'):
+    pass
+
+def _preview(values, limit=32):
+    # The first values of a per-qubit list, for the protocol log
+    return f"{values[:limit]}{f' ... ({len(values)} in all)' if len(values) > limit else ''}"
+
+def _timed(timings, stage, started):
+    # Adds the seconds since started to the stage's total
+    timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+
+def print_outcomes_in_reverse(counts): # takes a dictionary variable
+    for outcome in counts: # for each key-value in dictionary
+        reverse_outcome = ''
+        for i in outcome: # each string can be considered as a list of characters
+            reverse_outcome = i + reverse_outcome # each new symbol comes before the old symbol(s)
+    return reverse_outcome
+
+#####################################################################################################
+
+def generate_key(debug=_no_debug, backend="qiskit", key_length=None, chunk_qubits=N_QUBITS, amplification="hash", stats=None,
+                 bit_flip_rate=BIT_FLIP_RATE, phase_flip_rate=PHASE_FLIP_RATE):
+    ''' Runs the full BB84 protocol and returns the privacy-amplified key as a binary string.
+        Progress is reported through debug(message, msg_type), which mirrors the
+        "qkd_debug" socket event. backend selects how quantum states are distributed
+        (see qkd/backends.py) and amplification the privacy amplification mode (see
+        qkd/amplification.py); bit_flip_rate and phase_flip_rate set the channel noise.
+
+        The protocol runs in chunks of chunk_qubits qubits (steps 1-4) until the reconciled
+        bits hold enough secure bits for a key_length-bit key (KEY_BITS by default): the
+        secure_length (see qkd/amplification.py) of all reconciled bits, given the parity
+        bits Cascade and BICONF disclosed and the QBER measured over all tested bits. Every
+        reconciled bit then goes into privacy amplification (step 5), which compresses them
+        into the key. Chunks aborted by the QBER check are simply re-run; ChannelTooNoisy is
+        raised when GIVE_UP_CHUNKS chunks have gone by without any secure bits.
+
+        If stats is a dict it is filled with the number of chunks, aborted chunks
+        (qber_aborts of them for a QBER at or above QBER_THRESHOLD, residual_aborts for
+        errors Cascade and BICONF left in Bob's key, the rest for too few sifted bits),
+        qubits, reconciled bits, tested bits and the errors among them, the
+        measured qber, parity bits disclosed (leaked_bits), secure bits and Cascade passes,
+        and with stage_ms: milliseconds spent per protocol stage (distribution, sifting,
+        qber, cascade, biconf, amplification), summed over all chunks.
+
+        A one-off BB84Pipeline; build one directly to seed it, swap stages or add hooks.
+    '''
+    pipeline = BB84Pipeline(backend=backend, chunk_qubits=chunk_qubits, amplification=amplification,
+                            bit_flip_rate=bit_flip_rate, phase_flip_rate=phase_flip_rate)
+    return pipeline.generate_key(key_length, debug=debug, stats=stats)
+
+class BB84Pipeline:
+    ''' The BB84 protocol as a sequence of stages that can be replaced, timed and seeded.
+
+        Each stage is a callable; stages={name: callable} replaces the defaults:
+        - "distribution": (n_qubits, rng) -> (send_list, alice_basis, bob_basis, received);
+          defaults to the backend's distribute (see qkd/backends.py) over a channel with
+          bit_flip_rate and phase_flip_rate
+        - "sifting": sift(send_list, alice_basis, bob_basis, received) -> (alice_key, bob_key)
+        - "qber": estimate_qber(alice_key, bob_key, random) -> (qber or None, tested, errors),
+          removing the tested bits from both keys
+        - "cascade": cascade_stage(alice_key, bob_key, qber, rng) -> (Bob's corrected bits, info)
+        - "biconf": biconf_stage(alice_key, bob_key, qber, rng) -> (Bob's bits, info)
+        - "amplification": (rng) -> amplifier with update(bits) and bits(length), defaults to
+          the one named by amplification (see qkd/amplification.py)
+        Cascade and BICONF are run by reconcile(), as when it is called on its own. Each
+        chunk's reconciled bits are fed to the key's amplifier as soon as they are
+        reconciled, so only the amplifier's state is kept between chunks, and the key is
+        read out of it at the end.
+
+        Every stage call is timed and hooks are called with (stage, seconds) after it; a
+        hook that also has an enter(stage) method is called before it (see StageProfiler).
+        The amplifier's update() and bits() calls count as "amplification" stage calls.
+        With a seed, rng (a numpy Generator) and random (a random.Random) are seeded from
+        it and all of the protocol's random choices come from them, so the same seed gives
+        the same keys. The circuit backends draw from the random module and Aer, which a
+        seed doesn't cover; without one the module-level generators are used, as before.
+    '''
+
+    def __init__(self, backend="qiskit", chunk_qubits=N_QUBITS, amplification="hash", seed=None,
+                 stages=None, hooks=(), bit_flip_rate=BIT_FLIP_RATE, phase_flip_rate=PHASE_FLIP_RATE):
+        self.chunk_qubits = chunk_qubits
+        self.amplification = amplification
+        self.seed = seed
+        self.rng = np.random.default_rng(seed) if seed is not None else None
+        self.random = Random(seed) if seed is not None else None
+        self.hooks = list(hooks)
+
+        self.stages = {
+            "distribution": _distribution_stage(get_backend(backend), bit_flip_rate, phase_flip_rate),
+            "sifting": sift,
+            "qber": estimate_qber,
+            "cascade": cascade_stage,
+            "biconf": biconf_stage,
+            "amplification": get_amplifier(amplification),
+        }
+        unknown = set(stages or ()) - set(self.stages)
+        if unknown:
+            raise ValueError(f"Unknown BB84 stage(s) {', '.join(sorted(unknown))} (expected one of: {', '.join(self.stages)})")
+        self.stages.update(stages or {})
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+        return hook
+
+    def _run(self, stage, timings, *args, call=None):
+        # Calls the stage's callable (or call, for the amplifier's methods), timing it and notifying the hooks
+        for hook in self.hooks:
+            enter = getattr(hook, "enter", None)
+            if enter is not None:
+                enter(stage)
+        started = time.perf_counter()
+        result = (call or self.stages[stage])(*args)
+        seconds = time.perf_counter() - started
+        timings[stage] = timings.get(stage, 0.0) + seconds
+        for hook in self.hooks:
+            hook(stage, seconds)
+        return result
+
+    def generate_key(self, key_length=None, debug=_no_debug, stats=None):
+        # Same contract as the module-level generate_key
+        length = key_length or KEY_BITS
+        collected = chunks = aborted = secure = 0
+        qber = 0.0
+        amplifier = self.stages["amplification"](self.rng)
+        timings = {}
+        counts = {"qber_aborts": 0, "residual_aborts": 0, "cascade_passes": 0, "tested_bits": 0, "test_errors": 0, "leaked_bits": 0}
+
+        while secure < length:
+            if secure == 0 and chunks >= GIVE_UP_CHUNKS:
+                logger.debug("key abandoned chunks=%d aborted=%d qber=%.3f leaked_bits=%d reconciled_bits=%d",
+                             chunks, aborted, qber, counts["leaked_bits"], collected)
+                debug(f"❌ No secure bits after {chunks} chunks (QBER {qber:.3f}) - channel too noisy!", "error")
+                raise ChannelTooNoisy(f"No secure key bits after {chunks} chunks of {self.chunk_qubits} qubits "
+                                      f"({aborted} aborted, QBER {qber:.3f})")
+            # Only the first successful chunk (and the attempts before it) is logged step by step:
+            chunk_debug = debug if collected == 0 else _no_debug
+            bits = self.run_chunk(chunk_debug, timings, counts)
+            chunks += 1
+            if bits is None:
+                aborted += 1
+                continue
+            self._run("amplification", timings, bits, call=amplifier.update)
+            collected += len(bits)
+            qber = counts["test_errors"] / counts["tested_bits"]
+            secure = secure_length(collected, counts["leaked_bits"], qber)
+
+        debug(f"Collected {collected} reconciled bits from {chunks} chunks of {self.chunk_qubits} qubits ({aborted} aborted); "
+              f"with {counts['leaked_bits']} parity bits disclosed and a QBER of {qber:.3f}, {secure} of them are secure", "info")
+
+        '''
+        STEP 5: PRIVACY AMPLIFICATION: (THROUGH HASHING)
+        '''
+        debug("🔄 STEP 5: Privacy Amplification (Hashing)", "info")
+
+        final_key = self._run("amplification", timings, length, call=amplifier.bits)
+        debug(f"Used {amplifier.name} hash function", "info")
+        logger.debug("key generated bits=%d chunks=%d aborted=%d reconciled_bits=%d secure_bits=%d amplification=%s",
+                     len(final_key), chunks, aborted, collected, secure, amplifier.name)
+
+        debug(f"✅ Final key generated: {final_key[:32]}... ({len(final_key)} bits)", "success")
+        debug("🔐 QKD Protocol Complete - Secure channel established!", "success")
+
+        if stats is not None:
+            stats.update(chunks=chunks, aborted=aborted, qubits=chunks * self.chunk_qubits, reconciled_bits=collected,
+                         secure_bits=secure, qber=round(qber, 4), stage_ms={stage: round(1000 * seconds, 3) for stage, seconds in timings.items()}, **counts)
+        return final_key
+
+    def run_chunk(self, debug=_no_debug, timings=None, counts=None):
+        ''' Steps 1-4 for one chunk of chunk_qubits qubits; returns the reconciled key bits,
+            or None if the chunk was aborted. Seconds spent per stage are added to timings,
+            and aborts for a QBER at or above the threshold ("qber_aborts") or for errors
+            reconciliation left in Bob's key ("residual_aborts") and Cascade
+            passes ("cascade_passes") to counts, as well as, for a chunk that is kept, its
+            tested bits ("tested_bits"), the errors among them ("test_errors") and the
+            parity bits Cascade and BICONF disclosed ("leaked_bits").
+        '''
+        timings = {} if timings is None else timings
+        counts = {} if counts is None else counts
+        n_qubits = self.chunk_qubits
+        '''
+        STEP 1: DISTRIBUTING QUANTUM STATES:
+        '''
+        debug("🔄 STEP 1: Distributing Quantum States", "info")
+        debug(f"Initializing {n_qubits}-qubit quantum register...", "info")
+
+        send_list, alice_basis, bob_basis, received = self._run("distribution", timings, n_qubits, self.rng)
+
+        debug(f"Alice's encoding bases: {_preview(alice_basis)}", "info")
+        debug(f"Sending qubits through noisy channel...", "warning")
+        debug(f"Bob receiving and measuring qubits...", "info")
+        debug(f"Bob's measurement bases: {_preview(bob_basis)}", "info")
+        debug(f"Bob's received bits: {_preview(received)}", "info")
+
+        #####################################################################################################
+
+        '''
+        STEP 2: SIFTING:
+        '''
+        debug("🔄 STEP 2: Sifting Keys (Basis Reconciliation)", "info")
+
+        alice_key, bob_key = self._run("sifting", timings, send_list, alice_basis, bob_basis, received)
+
+        debug(f"Matched bases: {len(alice_key)}/{n_qubits}", "success")
+        debug(f"Alice's sifted key: {_preview(alice_key)}", "info")
+        debug(f"Bob's sifted key: {_preview(bob_key)}", "info")
+
+        #####################################################################################################
+
+        '''
+        STEP 3: COMPUTING QBER (QUANTUM BIT ERROR RATE):
+        '''
+        debug("🔄 STEP 3: Computing QBER (Quantum Bit Error Rate)", "info")
+
+        QBER, rounds, errors = self._run("qber", timings, alice_key, bob_key, self.random)
+        if QBER is None: # Too few matching bases to estimate the error rate, start over
+            debug("❌ Not enough sifted bits to estimate QBER", "error")
+            return None
+
+        debug(f"Tested {rounds} bits, found {errors} errors", "info")
+        debug(f"QBER = {QBER}", "success" if QBER < 0.11 else "warning")
+
+        logger.debug("chunk qber=%s tested=%d errors=%d sifted_bits=%d", QBER, rounds, errors, len(alice_key))
+
+        #####################################################################################################
+
+        '''
+        STEP 4: INFORMATION RECONCILIATION:
+
+        4.1] CASCADE PROTOCOL
+        4.2] BICONF STRATEGY
+        '''
+
+        # Before starting error correction, we check calculated QBER value:
+        if QBER==0.0:
+            debug("✅ QBER is 0 - Perfect channel! Skipping error correction.", "success")
+            logger.debug("chunk cascade skipped qber=0")
+        if QBER>=QBER_THRESHOLD:
+            debug(f"❌ QBER threshold exceeded ({QBER} >= {QBER_THRESHOLD})", "error")
+            debug("Protocol aborted - channel too noisy!", "error")
+            logger.debug("chunk aborted qber=%s threshold=%s", QBER, QBER_THRESHOLD) # If QBER is above threshold value - we abort protocol
+            counts["qber_aborts"] = counts.get("qber_aborts", 0) + 1
+            #* Try again:
+            return None
+        if QBER>0:
+            debug("🔄 STEP 4: Error Correction (Cascade Protocol)", "info")
+            debug(f"Block size: {initial_block_size(QBER, len(bob_key))}", "info")
+
+        key_bits, reconcile_info = reconcile(alice_key, bob_key, QBER, self.rng,
+                                             run=lambda stage, *args: self._run(stage, timings, *args))
+        cascade_info = reconcile_info["cascade"]
+        if cascade_info is not None:
+            counts["cascade_passes"] = counts.get("cascade_passes", 0) + cascade_info['passes']
+            logger.debug("chunk cascade passes=%d corrections=%d leaked_bits=%d",
+                         cascade_info['passes'], cascade_info['corrections'], cascade_info['leaked_bits'])
+            debug(f"✅ Cascade complete after {cascade_info['passes']} passes - {cascade_info['corrections']} errors corrected, "
+                  f"{cascade_info['leaked_bits']} parity bits exchanged", "success")
+
+        debug("🔄 Running BICONF strategy for additional error detection...", "info")
+        biconf_info = reconcile_info["biconf"]
+        error = len(biconf_info["corrections"])
+        logger.debug("chunk biconf rounds=%d corrections=%d", biconf_info["rounds"], error)
+        debug(f"✅ BICONF complete - {error} errors found and corrected", "success")
+
+        residual = reconcile_info["residual_errors"]
+        if residual:
+            debug(f"❌ {residual} errors left after reconciliation - keys don't match!", "error")
+            logger.debug("chunk aborted residual_errors=%d", residual)
+            counts["residual_aborts"] = counts.get("residual_aborts", 0) + 1
+            return None
+
+        for name, value in (("tested_bits", rounds), ("test_errors", errors),
+                            ("leaked_bits", (cascade_info or {}).get("leaked_bits", 0) + biconf_info["leaked_bits"])):
+            counts[name] = counts.get(name, 0) + value
+        return key_bits # Alice's bits, which both sides hold once reconciliation has succeeded
+
+def _distribution_stage(distribute, bit_flip_rate, phase_flip_rate):
+    # Binds the channel noise; only numpy_distribute can also draw from rng
+    if distribute is numpy_distribute:
+        return lambda n_qubits, rng=None: distribute(n_qubits, rng=rng, bit_flip_rate=bit_flip_rate,
+                                                     phase_flip_rate=phase_flip_rate)
+    return lambda n_qubits, rng=None: distribute(n_qubits, bit_flip_rate=bit_flip_rate, phase_flip_rate=phase_flip_rate)
+
+class StageProfiler:
+    ''' BB84Pipeline hook that runs cProfile around every stage, one profile per stage.
+        print_stats() shows the top functions of each stage.
+    '''
+
+    def __init__(self):
+        self.profiles = {}
+
+    def enter(self, stage):
+        self.profiles.setdefault(stage, cProfile.Profile()).enable()
+
+    def __call__(self, stage, seconds):
+        self.profiles[stage].disable()
+
+    def print_stats(self, sort="cumulative", limit=10, stream=None):
+        for stage, profile in self.profiles.items():
+            print(f"--- {stage} ---", file=stream)
+            pstats.Stats(profile, stream=stream).sort_stats(sort).print_stats(limit)
+
+#####################################################################################################
+
+'''
+PROTOCOL STAGES AS CALLABLE UNITS:
+Each stage can be run (and timed) on its own; rng arguments make runs reproducible.
+Stage 1 is a backend's distribute(n_qubits) (see qkd/backends.py).
+'''
+
+def sift(send_list, alice_basis, bob_basis, received):
+    # Stage 2: keep the rounds where Alice's and Bob's bases match -> (alice_key, bob_key)
+    alice_key=[] # Alice's register for matching rounds
+    bob_key=[] # Bob's register for matching rounds
+    for j in range(0,len(alice_basis)): # Going through list of bases
+        if alice_basis[j] == bob_basis[j]: # Comparing
+            alice_key.append(send_list[j])
+            bob_key.append(received[j]) # Keeping key bit if bases matched
+        else:
+            pass # Discard round if bases mismatched
+    return alice_key, bob_key
+
+def estimate_qber(alice_key, bob_key, rng=None):
+    ''' Stage 3: compares a third of the sifted bits, chosen at random, and removes them
+        from both keys (in place). Returns (qber, tested, errors), qber rounded to two
+        places or None if there are too few bits to test. rng is a random.Random.
+    '''
+    pick = rng.randrange if rng is not None else randrange
+    rounds = len(alice_key)//3
+    if rounds == 0:
+        return None, 0, 0
+    errors=0
+    for i in range(rounds):
+        bit_index = pick(len(alice_key))
+        if alice_key[bit_index]!=bob_key[bit_index]: # comparing tested rounds
+            errors=errors+1 # calculating errors
+        del alice_key[bit_index] # removing tested bits from key strings
+        del bob_key[bit_index]
+    QBER=errors/rounds # calculating QBER
+    QBER=round(QBER,2) # saving the answer to two decimal places
+    return QBER, rounds, errors
+
+def cascade_stage(alice_key, bob_key, qber, rng=None):
+    # Stage 4.1: Cascade with CASCADE_PASSES passes -> (Bob's corrected bits, info)
+    return cascade(alice_key, bob_key, qber, passes=CASCADE_PASSES, rng=rng)
+
+def biconf_stage(alice_key, bob_key, qber, rng=None):
+    # Stage 4.2: BICONF_ROUNDS rounds of BICONF -> (Bob's bits, info)
+    return biconf(alice_key, bob_key, qber, rounds=BICONF_ROUNDS, rng=rng)
+
+RECONCILIATION_STAGES = {"cascade": cascade_stage, "biconf": biconf_stage}
+
+def reconcile(alice_key, bob_key, qber, rng=None, timings=None, run=None):
+    ''' Stage 4: Cascade (skipped when qber is 0) then BICONF on Bob's corrected key.
+        Returns (key bits, {"cascade": info or None, "biconf": info, "residual_errors": n});
+        the key is Alice's bits, which both sides hold once reconciliation has succeeded,
+        that is when residual_errors (bits where Bob's final key still differs) is 0. rng is
+        a numpy Generator. A QBER at or above QBER_THRESHOLD, or residual errors, are the
+        caller's to abort on.
+
+        Each sub-stage is called as run(stage, alice_key, bob_key, qber, rng); by default
+        that runs cascade_stage / biconf_stage and adds the seconds to timings if given.
+        BB84Pipeline passes its own, which runs its (replaceable) stages and its hooks.
+    '''
+    if run is None:
+        timings = {} if timings is None else timings
+        def run(stage, *args):
+            started = time.perf_counter()
+            result = RECONCILIATION_STAGES[stage](*args)
+            _timed(timings, stage, started)
+            return result
+
+    cascade_info = None
+    if qber>0:
+        corrected, cascade_info = run("cascade", alice_key, bob_key, qber, rng)
+        bob_key=np.asarray(corrected).tolist() # bob continues (BICONF) with his corrected key
+
+    bob_final, biconf_info = run("biconf", alice_key, bob_key, qber, rng)
+    # Key confirmation: errors Cascade and BICONF both missed would give the two sides different keys
+    residual = int(np.count_nonzero(np.asarray(bob_final, dtype=np.uint8) != np.asarray(alice_key, dtype=np.uint8)))
+    return alice_key, {"cascade": cascade_info, "biconf": biconf_info, "residual_errors": residual}
+
+def amplify(chunks, length=KEY_BITS, amplification="hash", rng=None, info=None):
+    # Stage 5: privacy amplification of the reconciled chunks (lists of bits, any iterable, fed to the
+    # amplifier one at a time) into a length-bit key; info, if given, gets the name of the hash function used
+    amplifier = get_amplifier(amplification)(rng=rng)
+    for bits in chunks:
+        amplifier.update(bits)
+    key = amplifier.bits(length)
+    if info is not None:
+        info["name"] = amplifier.name
+    return key
@@ -0,0 +1,87 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .bb84 import BB84Pipeline
+
+'''
+BULK KEY GENERATION
+
+Generates many keys offline (e.g. to stock up keys or for capacity planning) on all
+cores: keys are made in batches, each batch by one BB84Pipeline in a worker process, and
+come back in order. With a seed every batch gets its own seed derived from it and its
+index, so the keys only depend on the seed and the batch size, not on how many
+processes made them.
+'''
+
+STAT_TOTALS = ("chunks", "aborted", "qber_aborts", "residual_aborts", "qubits", "reconciled_bits", "leaked_bits", "secure_bits", "cascade_passes")
+
+def batch_seed(seed, index):
+    # Independent seed for batch index of a seeded run
+    return int(np.random.SeedSequence([seed, index]).generate_state(1, np.uint64)[0])
+
+def _add_stats(totals, stats):
+    for name in STAT_TOTALS:
+        totals[name] = totals.get(name, 0) + stats.get(name, 0)
+    stage_ms = totals.setdefault("stage_ms", {})
+    for stage, ms in stats.get("stage_ms", {}).items():
+        stage_ms[stage] = stage_ms.get(stage, 0.0) + ms
+
+def _generate_batch(task):
+    # Runs in a worker process: count keys from one pipeline, with the summed stats
+    options, key_length, seed, count = task
+    pipeline = BB84Pipeline(seed=seed, **options)
+    keys, totals = [], {}
+    for _ in range(count):
+        stats = {}
+        keys.append(pipeline.generate_key(key_length, stats=stats))
+        _add_stats(totals, stats)
+    return keys, totals
+
+def _warm_up(options):
+    # Imports and first-run costs are paid here, before the clock starts
+    BB84Pipeline(**options).generate_key()
+    return os.getpid()
+
+def generate_keys(count, processes=None, batch_size=50, key_length=None, seed=None, stats=None, **options):
+    ''' Yields count keys (binary strings, in order) generated on processes worker
+        processes (os.cpu_count() by default; 1 runs in this process). options are
+        BB84Pipeline's (backend, chunk_qubits, amplification, bit_flip_rate,
+        phase_flip_rate) and key_length is passed to its generate_key. If stats is a dict
+        it is filled with the summed per-key stats (chunks, aborted, qber_aborts,
+        residual_aborts, qubits, reconciled_bits, leaked_bits, secure_bits, cascade_passes,
+        stage_ms), the number of keys, the seconds spent generating them and the seconds
+        spent warming the workers up.
+    '''
+    processes = processes or os.cpu_count() or 1
+    batches = [min(batch_size, count - start) for start in range(0, count, batch_size)]
+    tasks = [(options, key_length, batch_seed(seed, index) if seed is not None else None, size)
+             for index, size in enumerate(batches)]
+    totals = {"keys": 0}
+
+    started = time.perf_counter()
+    if processes == 1:
+        _warm_up(options)
+        warmed_up = time.perf_counter()
+        results = map(_generate_batch, tasks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=processes)
+        for future in [executor.submit(_warm_up, options) for _ in range(processes)]:
+            future.result()
+        warmed_up = time.perf_counter()
+        results = executor.map(_generate_batch, tasks)
+
+    try:
+        for keys, batch_stats in results:
+            _add_stats(totals, batch_stats)
+            totals["keys"] += len(keys)
+            yield from keys
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if stats is not None:
+            stats.update(totals, seconds=time.perf_counter() - warmed_up, warm_up_seconds=warmed_up - started,
+                         processes=processes)
@@ -0,0 +1,145 @@
+'''
+4.1] CASCADE PROTOCOL
+
+Standalone Cascade reconciliation over bit arrays. Alice and Bob compare the parity of
+blocks of their keys; a block whose parities differ holds an odd number of errors and is
+bisected until one error is found and flipped in Bob's key.
+
+- pass 1 uses blocks of about 0.73/QBER bits in the original order, every later pass
+  doubles the block size and uses a fresh random permutation (kept for backtracking)
+- fixing a bit flips the parity of the block holding it in every earlier pass, which may
+  expose errors hidden in pairs there, so those blocks are bisected too (the "cascade")
+- the number of passes is bounded
+
+Whether two parities differ only depends on alice ^ bob, so the engine works on that
+error vector. Each pass keeps it in permuted order inside an XOR Fenwick tree: a block
+parity is two O(log n) prefix queries and a correction is an O(log n) update, so the
+parity work for a whole run is O(n log n).
+
+Bits are kept one per element (uint8 arrays, and the trees as lists of ints) rather than
+packed 64 to a word. Nearly all of the parity work is single-node tree reads and flips
+from Python, and on a packed tree every one of those needs a word index, shift and mask:
+at 100k bits a prefix query takes ~2.0 us instead of ~1.0 us and a flip ~2.4 us instead
+of ~1.2 us. Packing would only speed up each pass's initial block parities, by ~25% at
+one 64-bit word per block, which is a small share of a run.
+'''
+
+import numpy as np
+
+DEFAULT_PASSES = 4
+
+def _fenwick(bits):
+    # 1-indexed XOR Fenwick tree: tree[i] = xor of bits[i - lowbit(i) : i]
+    n = len(bits)
+    prefix = np.zeros(n + 1, dtype=np.uint8)
+    np.bitwise_xor.accumulate(bits, out=prefix[1:])
+    index = np.arange(1, n + 1)
+    tree = np.zeros(n + 1, dtype=np.uint8)
+    tree[1:] = prefix[index] ^ prefix[index - (index & -index)]
+    return tree.tolist() # Plain ints are much faster than NumPy scalars for single lookups
+
+class _Pass:
+    __slots__ = ("permutation", "position", "block_size", "tree", "n")
+
+    def __init__(self, errors, permutation, block_size):
+        self.permutation = permutation # permuted index -> key index
+        self.position = np.argsort(permutation).tolist() # key index -> permuted index
+        self.block_size = block_size
+        self.tree = _fenwick(errors[permutation])
+        self.n = len(permutation)
+
+    def prefix_parity(self, i):
+        tree, parity = self.tree, 0
+        while i > 0:
+            parity ^= tree[i]
+            i &= i - 1
+        return parity
+
+    def parity(self, start, end):
+        return self.prefix_parity(end) ^ self.prefix_parity(start)
+
+    def flip(self, index):
+        tree, i = self.tree, self.position[index] + 1
+        while i <= self.n:
+            tree[i] ^= 1
+            i += i & -i
+
+    def block_of(self, index):
+        return self.position[index] // self.block_size
+
+    def block_range(self, block):
+        start = block * self.block_size
+        return start, min(start + self.block_size, self.n)
+
+    def bisect(self, start, end):
+        # Binary search for one error in an odd block; returns (key index, parities exchanged)
+        exchanged = 0
+        while end - start > 1:
+            middle = (start + end) // 2
+            exchanged += 1
+            if self.parity(start, middle):
+                end = middle
+            else:
+                start = middle
+        return int(self.permutation[start]), exchanged
+
+def initial_block_size(qber, n):
+    # ~0.73/QBER bits per block, so each first-pass block holds about one error
+    if qber <= 0:
+        return max(n, 1)
+    return max(2, min(n, int(0.73 / qber)))
+
+def cascade(alice, bob, qber, passes=DEFAULT_PASSES, rng=None):
+    ''' Reconciles Bob's key with Alice's. alice and bob are sequences of 0/1 bits and
+        qber is the estimated error rate. Returns (corrected_bob, info) where corrected_bob
+        is a uint8 array and info counts the passes run, bits corrected, parities exchanged
+        (bits leaked to an eavesdropper) and the errors left over.
+    '''
+    rng = rng or np.random.default_rng()
+    alice = np.asarray(alice, dtype=np.uint8)
+    bob = np.array(bob, dtype=np.uint8)
+    n = len(alice)
+
+    errors = alice ^ bob
+    block_size = initial_block_size(qber, n)
+    done = [] # Passes run so far, for backtracking
+    corrections = leaked = 0
+
+    for pass_number in range(passes if n else 0):
+        permutation = np.arange(n) if pass_number == 0 else rng.permutation(n)
+        current = _Pass(errors, permutation, block_size)
+        done.append(current)
+
+        # All block parities of this pass at once:
+        block_starts = np.arange(0, n, block_size)
+        block_parities = np.bitwise_xor.reduceat(errors[permutation], block_starts)
+        leaked += len(block_starts)
+        queue = [(current, int(block)) for block in np.flatnonzero(block_parities)]
+
+        while queue:
+            cascade_pass, block = queue.pop()
+            start, end = cascade_pass.block_range(block)
+            if not cascade_pass.parity(start, end): # Already fixed by an earlier correction
+                continue
+            index, exchanged = cascade_pass.bisect(start, end)
+            leaked += exchanged
+            corrections += 1
+            errors[index] ^= 1
+            bob[index] ^= 1
+            # Backtrack: the block holding this bit changes parity in every pass
+            for other in done:
+                other.flip(index)
+                if other is not cascade_pass:
+                    other_block = other.block_of(index)
+                    if other.parity(*other.block_range(other_block)):
+                        queue.append((other, other_block))
+
+        block_size = min(2 * block_size, n)
+
+    info = {
+        "passes": len(done),
+        "corrections": corrections,
+        "leaked_bits": leaked,
+        "residual_errors": int(errors.sum()),
+    }
+    return bob, info
@@ -0,0 +1,28 @@
+import base64
+
+'''
+XOR CIPHER FOR CHAT MESSAGES
+
+Clients XOR each message with the ASCII form of their QKD key (8 key bits per character)
+and send it Base64 encoded. The key bytes are derived once per connection with
+key_bytes() and messages are decrypted as one buffer: the key is repeated to the message
+length and both are XORed as (arbitrarily long) Python integers, which runs in C over
+the whole buffer instead of one chr() per character.
+'''
+
+def key_bytes(binary_key):
+    # Binary key string -> ASCII key bytes, 8 bits per byte (as binaryToAscii in room.html)
+    return bytes(int(binary_key[i:i+8], 2) for i in range(0, len(binary_key), 8))
+
+def xor_bytes(data, key):
+    # data XOR the key repeated to len(data); data can be bytes, bytearray or a memoryview
+    length = len(data)
+    if length == 0:
+        return b''
+    stream = (key * (length // len(key) + 1))[:length]
+    return (int.from_bytes(data, 'big') ^ int.from_bytes(stream, 'big')).to_bytes(length, 'big')
+
+def xor_decrypt(encrypted_message, key):
+    # Base64 decode the message first, then XOR with the key bytes.
+    # Every decrypted byte is one character, as the client encrypts one char code at a time:
+    return xor_bytes(memoryview(base64.b64decode(encrypted_message)), key).decode('latin-1')
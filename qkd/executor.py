@@ -0,0 +1,190 @@
+import atexit
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .bb84 import generate_key
+from .warmup import warm_up
+
+class QKDBusy(Exception):
+    ''' Raised when the executor's queue of pending key requests is full. '''
+
+def _generate_in_worker(options):
+    # Runs in a worker process: the debug callback can't cross the process boundary,
+    # so the protocol log and stats are recorded and sent back alongside the key
+    transcript = []
+    stats = {}
+    key = generate_key(debug=lambda message, msg_type='info': transcript.append((message, msg_type)), stats=stats, **options)
+    return key, transcript, stats
+
+class QKDExecutor:
+    ''' Runs BB84 key generation in worker processes so the CPU-bound protocol never
+        blocks the server's event loop.
+
+        Every worker is a single-process pool of its own and runs one request at a time, so
+        a worker that overruns the timeout can be replaced without touching the requests
+        running on the others. At most max_pending requests may be queued or running;
+        further callers wait for a slot and get QKDBusy if none frees up within the
+        timeout. Waiting is done by polling with sleep (socketio.sleep under eventlet),
+        which yields to other green threads instead of blocking the hub.
+    '''
+
+    def __init__(self, processes=1, max_pending=32, timeout=30.0, sleep=time.sleep, poll_interval=0.005):
+        self.processes = processes
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.sleep = sleep
+        self.poll_interval = poll_interval
+
+        self._workers = [] # One ProcessPoolExecutor(max_workers=1) per worker
+        self._busy = [] # Whether each worker is running a request
+        self._atexit_registered = False
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        # Executor metrics:
+        self.completed = 0
+        self.rejected = 0 # Requests refused because the queue stayed full
+        self.timeouts = 0
+        self.failures = 0
+        self.restarts = 0 # Workers replaced after a timeout or a crash
+        self.total_time = 0.0 # Seconds from submission to result, including queueing
+
+    def start(self):
+        with self._lock:
+            if not self._workers:
+                if not self._atexit_registered:
+                    # concurrent.futures' own exit hook hangs under eventlet's monkey-patching,
+                    # which would keep the gunicorn worker from exiting
+                    atexit.register(self.shutdown, wait=True)
+                    self._atexit_registered = True
+                self._workers = [ProcessPoolExecutor(max_workers=1) for _ in range(self.processes)]
+                self._busy = [False] * self.processes
+        return self
+
+    @staticmethod
+    def _terminate(executor, wait=False):
+        # The worker may be stuck in a runaway protocol run, so terminate it rather than wait
+        for process in list((executor._processes or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            workers, self._workers, self._busy = self._workers, [], []
+        for executor in workers:
+            self._terminate(executor, wait=wait)
+
+    def _recycle(self, slot, executor):
+        # A worker that overran the timeout can't be interrupted, so replace it; the other workers
+        # and the requests they are running are left alone
+        with self._lock:
+            if slot < len(self._workers) and self._workers[slot] is executor:
+                self._workers[slot] = ProcessPoolExecutor(max_workers=1)
+            self.restarts += 1
+        self._terminate(executor)
+
+    def warm_up(self, backend="qiskit"):
+        ''' Starts the worker processes and warms each of them up (see qkd.warm_up).
+            Returns the slowest worker's phase timings.
+        '''
+        with self.start()._lock:
+            futures = [executor.submit(warm_up, backend) for executor in self._workers]
+        while not all(future.done() for future in futures):
+            self.sleep(self.poll_interval)
+        timings = [future.result() for future in futures]
+        return {phase: max(timing[phase] for timing in timings) for phase in timings[0]}
+
+    def generate(self, debug=None, timeout=None, stats=None, **options):
+        ''' Same contract as qkd.generate_key (options are passed on to it), but the
+            protocol runs in a worker process. The recorded protocol log is replayed
+            through debug, and stats filled in, once the key is ready.
+        '''
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        started = time.perf_counter()
+
+        self._acquire_slot(deadline)
+        try:
+            slot, executor = self._acquire_worker(deadline, timeout)
+            try:
+                future = executor.submit(_generate_in_worker, options)
+                while not future.done():
+                    if time.monotonic() >= deadline:
+                        with self._lock:
+                            self.timeouts += 1
+                        self._recycle(slot, executor)
+                        raise TimeoutError(f"QKD key generation did not finish within {timeout}s")
+                    self.sleep(self.poll_interval)
+                try:
+                    key, transcript, key_stats = future.result()
+                except Exception as error:
+                    with self._lock:
+                        self.failures += 1
+                    if isinstance(error, BrokenProcessPool):
+                        self._recycle(slot, executor) # The worker died; the next request gets a new one
+                    raise
+            finally:
+                self._release_worker(slot)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+        with self._lock:
+            self.completed += 1
+            self.total_time += time.perf_counter() - started
+
+        if debug is not None:
+            for message, msg_type in transcript:
+                debug(message, msg_type)
+        if stats is not None:
+            stats.update(key_stats)
+        return key
+
+    def _acquire_slot(self, deadline):
+        while True:
+            with self._lock:
+                if self._pending < self.max_pending:
+                    self._pending += 1
+                    return
+            if time.monotonic() >= deadline:
+                with self._lock:
+                    self.rejected += 1
+                raise QKDBusy(f"{self.max_pending} QKD requests already pending")
+            self.sleep(self.poll_interval)
+
+    def _acquire_worker(self, deadline, timeout):
+        # Waits for an idle worker: (slot, its executor)
+        while True:
+            self.start()
+            with self._lock:
+                for slot, busy in enumerate(self._busy):
+                    if not busy:
+                        self._busy[slot] = True
+                        return slot, self._workers[slot]
+            if time.monotonic() >= deadline:
+                with self._lock:
+                    self.timeouts += 1
+                raise TimeoutError(f"No QKD worker became free within {timeout}s")
+            self.sleep(self.poll_interval)
+
+    def _release_worker(self, slot):
+        with self._lock:
+            if slot < len(self._busy):
+                self._busy[slot] = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "processes": self.processes,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "busy": sum(self._busy),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "failures": self.failures,
+                "restarts": self.restarts,
+                "avg_latency_ms": round(1000 * self.total_time / self.completed, 2) if self.completed else None,
+            }
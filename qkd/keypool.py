@@ -0,0 +1,130 @@
+import time
+import threading
+from collections import deque
+
+from .bb84 import generate_key
+from .threads import spawn_thread
+
+class KeyPool:
+    ''' Keeps a stock of finished BB84 keys so socket connections don't have to run
+        the protocol inline. Refill workers top the pool back up to high_watermark
+        whenever it drops below low_watermark.
+
+        Each pooled entry is (key, transcript, stats) where transcript holds the
+        (message, msg_type) debug lines recorded while the key was generated and stats
+        what generate_key reported (chunks, per-stage timings, ...), so a client's QKD
+        debug console can still be shown how its key was made.
+    '''
+
+    def __init__(self, size=8, low_watermark=None, workers=1, generator=generate_key,
+                 spawn=None, sleep=time.sleep, poll_interval=0.25):
+        self.size = size
+        self.high_watermark = size
+        self.low_watermark = size // 2 if low_watermark is None else low_watermark
+        self.workers = workers
+        self.generator = generator
+        self.spawn = spawn or spawn_thread
+        self.sleep = sleep
+        self.poll_interval = poll_interval
+
+        self._keys = deque()
+        self._lock = threading.Lock()
+        self._running = False
+        self._refilling = False
+        self._pending = 0 # Keys currently being generated by workers
+
+        # Pool metrics:
+        self.hits = 0 # Keys handed out from the pool
+        self.misses = 0 # Requests that found the pool empty
+        self.generated = 0 # Keys produced by refill workers
+        self.failures = 0 # Refill attempts that raised
+        self.generation_time = 0.0 # Total seconds spent generating pooled keys
+
+    @property
+    def enabled(self):
+        return self.size > 0
+
+    def start(self):
+        # Start the refill workers (no-op if the pool is disabled or already running):
+        if not self.enabled or self._running:
+            return
+        self._running = True
+        self._refilling = True # Fill the pool up on boot
+        for _ in range(self.workers):
+            self.spawn(self._worker)
+
+    def stop(self):
+        self._running = False
+
+    def get(self):
+        ''' Pops a (key, transcript, stats) entry, or returns None when the pool is empty.
+            Never blocks: callers fall back to generating a key inline.
+        '''
+        with self._lock:
+            entry = self._keys.popleft() if self._keys else None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            if len(self._keys) < self.low_watermark:
+                self._refilling = True
+        return entry
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _worker(self):
+        while self._running:
+            if not self._claim_slot():
+                self.sleep(self.poll_interval)
+                continue
+
+            transcript = []
+            stats = {}
+            started = time.perf_counter()
+            try:
+                key = self.generator(debug=lambda message, msg_type='info': transcript.append((message, msg_type)), stats=stats)
+            except Exception:
+                with self._lock:
+                    self.failures += 1
+                    self._pending -= 1
+                self.sleep(self.poll_interval)
+                continue
+            elapsed = time.perf_counter() - started
+
+            with self._lock:
+                self._keys.append((key, transcript, stats))
+                self._pending -= 1
+                self.generated += 1
+                self.generation_time += elapsed
+
+            self.sleep(0) # Yield to request handlers between keys
+
+    def _claim_slot(self):
+        # Reserve the right to generate one more key, honouring the watermarks:
+        with self._lock:
+            if not self._refilling:
+                return False
+            if len(self._keys) + self._pending >= self.high_watermark:
+                self._refilling = False
+                return False
+            self._pending += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "size": len(self._keys),
+                "pending": self._pending,
+                "low_watermark": self.low_watermark,
+                "high_watermark": self.high_watermark,
+                "workers": self.workers if self._running else 0,
+                "refilling": self._refilling,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / requests, 3) if requests else None,
+                "generated": self.generated,
+                "failures": self.failures,
+                "avg_generation_ms": round(1000 * self.generation_time / self.generated, 2) if self.generated else None,
+            }
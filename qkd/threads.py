@@ -0,0 +1,7 @@
+import threading
+
+def spawn_thread(target):
+    # The default spawn(target) of the server's background workers: target on a new daemon thread
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,25 @@
+import time
+
+from .backends import simulator
+from .bb84 import generate_key
+
+def import_quantum_stack():
+    # Qiskit, Aer and NumPy are imported lazily by the protocol; pull them in up front
+    import numpy
+    import qiskit
+    from qiskit_aer.noise import NoiseModel
+    simulator() # First construction loads the simulator's native library
+
+def warm_up(backend="qiskit"):
+    ''' Imports the quantum stack and runs one throwaway BB84 exchange so the first real
+        connection doesn't pay for either. Returns the time each phase took.
+    '''
+    started = time.perf_counter()
+    import_quantum_stack()
+    imported = time.perf_counter()
+    generate_key(backend=backend) # Throwaway key
+    finished = time.perf_counter()
+    return {
+        "imports_ms": round(1000 * (imported - started), 1),
+        "first_key_ms": round(1000 * (finished - imported), 1),
+    }
@@ -0,0 +1,88 @@
+'''
+In-memory registry of rooms and the connections in them.
+
+Every connection is one record (a sid, its room and its user name), indexed three ways:
+by sid, by room (in joining order) and by name within the room, counting connections
+per name. Joining and leaving are O(1) and only ever touch the leaving connection, so
+two tabs with the same name are two entries and closing one leaves the other listed.
+The full user list is only built when asked for.
+'''
+
+class Connection:
+    __slots__ = ("sid", "room", "name")
+
+    def __init__(self, sid, room, name):
+        self.sid = sid
+        self.room = room
+        self.name = name
+
+class Room:
+    __slots__ = ("code", "creator", "messages", "qkd_debug", "connections", "names")
+
+    def __init__(self, code, creator, messages, qkd_debug=False):
+        self.code = code
+        self.creator = creator
+        self.messages = messages
+        self.qkd_debug = qkd_debug # Send every member's key exchange details to their debug console
+        self.connections = {} # sid -> Connection, in joining order
+        self.names = {} # name -> number of connections with that name
+
+    @property
+    def members(self):
+        return len(self.connections)
+
+    def users(self):
+        # Names in joining order, one entry per connection
+        return [connection.name for connection in self.connections.values()]
+
+class Registry:
+    def __init__(self):
+        self.rooms = {} # code -> Room
+        self.sids = {} # sid -> Connection
+
+    def add_room(self, code, creator, messages, qkd_debug=False):
+        # Returns None if the code is already taken
+        if code in self.rooms:
+            return None
+        room = self.rooms[code] = Room(code, creator, messages, qkd_debug)
+        return room
+
+    def remove_room(self, code):
+        room = self.rooms.pop(code, None)
+        if room is not None:
+            for sid in room.connections:
+                self.sids.pop(sid, None)
+        return room
+
+    def join(self, sid, code, name):
+        room = self.rooms[code]
+        self.leave(sid) # A sid is in one room at a time
+        connection = self.sids[sid] = room.connections[sid] = Connection(sid, code, name)
+        room.names[name] = room.names.get(name, 0) + 1
+        return connection
+
+    def leave(self, sid):
+        ''' Removes the connection and returns it (None if unknown). When the room's creator
+            has no connection left, the longest-connected remaining user becomes creator.
+        '''
+        connection = self.sids.pop(sid, None)
+        if connection is None:
+            return None
+        room = self.rooms.get(connection.room)
+        if room is None:
+            return connection
+        del room.connections[sid]
+        remaining = room.names[connection.name] - 1
+        if remaining:
+            room.names[connection.name] = remaining
+        else:
+            del room.names[connection.name]
+        if room.creator not in room.names and room.connections:
+            room.creator = next(iter(room.connections.values())).name
+        return connection
+
+    def __contains__(self, code):
+        return code in self.rooms
+
+    def __len__(self):
+        return len(self.rooms)
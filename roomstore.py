@@ -0,0 +1,454 @@
+'''
+Room state (members, users, creator and message history) behind a store interface, so
+several server processes can share it.
+
+- MemoryRoomStore: a registry in this process (one worker; the default)
+- RedisRoomStore: any server speaking the Redis protocol, shared by all workers
+
+Members are tracked per connection (sid), so users sharing a name are counted and removed
+separately. join() and leave() only report the member count and creator; the full user
+list comes from info(code) as {"members", "users", "creator"}. join() never recreates a
+room that is gone and leave() ignores sids that aren't in the room: both return None. Messages are dicts with
+"name", "message", "id" and "time". Message ids count up per room and are the cursors for
+paging back through the history (see history.py).
+
+allocate() creates a room under a free code from the store's code pool and delete()
+gives the code back (see lifecycle.py). Every join, leave and message records the room's
+last activity, which expired() uses to find rooms to reap.
+'''
+
+import functools
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from history import MessageHistory
+from lifecycle import CODE_LENGTH, CodePool, code_from_index, codes_from_indexes, shuffled_codes
+from registry import Registry
+
+def _expiry(age, members, joined, empty_ttl, idle_ttl):
+    # Why a room with this much time since its last activity should be reaped (None: keep it)
+    if idle_ttl > 0 and age >= idle_ttl:
+        return "idle"
+    if empty_ttl > 0 and members <= 0 and age >= empty_ttl:
+        return "empty" if joined else "unjoined"
+    return None
+
+def _locked(method):
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+class MemoryRoomStore:
+    ''' Rooms kept in a registry of this process (see registry.py). Methods hold a lock:
+        in the asyncio server mode (asgi.py) pages and background tasks run on threads.
+    '''
+
+    def __init__(self, history_size=500):
+        self.history_size = history_size
+        self.registry = Registry()
+        self.codes = None # CodePool, made by the first allocate() (shuffling every code takes a few ms)
+        self._activity = OrderedDict() # code -> time of its last creation, join, leave or message, oldest first
+        self._joined = set() # Rooms someone has connected to
+        self._lock = threading.RLock()
+
+    def _touch(self, code):
+        self._activity[code] = time.time()
+        self._activity.move_to_end(code)
+
+    @_locked
+    def exists(self, code):
+        return code in self.registry
+
+    @_locked
+    def count(self):
+        return len(self.registry)
+
+    @_locked
+    def create(self, code, creator, qkd_debug=False):
+        # Returns False if the code is already taken
+        if self.registry.add_room(code, creator, MessageHistory(self.history_size), qkd_debug) is None:
+            return False
+        self._touch(code)
+        return True
+
+    @_locked
+    def prepare_codes(self):
+        if self.codes is None:
+            self.codes = CodePool()
+
+    @_locked
+    def allocate(self, creator, qkd_debug=False):
+        # Creates a room under the next free code and returns the code (None if all are in use)
+        self.prepare_codes()
+        while True:
+            code = self.codes.take()
+            if code is None or self.create(code, creator, qkd_debug):
+                return code
+            # Otherwise the code was taken through create(); try the next one
+
+    @_locked
+    def delete(self, code):
+        # Returns False if the room didn't exist; its code goes back to the pool
+        if self.registry.remove_room(code) is None:
+            return False
+        self._activity.pop(code, None)
+        self._joined.discard(code)
+        if self.codes is not None:
+            self.codes.give_back(code)
+        return True
+
+    @_locked
+    def qkd_debug(self, code):
+        # Whether the room was created with the QKD debug stream on for all its members
+        room = self.registry.rooms.get(code)
+        return room is not None and room.qkd_debug
+
+    @_locked
+    def info(self, code):
+        room = self.registry.rooms.get(code)
+        if room is None:
+            return None
+        return {"members": room.members, "users": room.users(), "creator": room.creator}
+
+    @_locked
+    def join(self, code, name, sid):
+        # The room's member count and creator after adding the connection (no user list, see info()),
+        # None if the room is gone (terminated or reaped while the connection waited for its key)
+        room = self.registry.rooms.get(code)
+        if room is None:
+            return None
+        self.registry.join(sid, code, name)
+        self._touch(code)
+        self._joined.add(code)
+        return {"members": room.members, "creator": room.creator}
+
+    @_locked
+    def leave(self, code, name, sid):
+        # Removes this connection only; the creator is handed on once none of theirs is left
+        # (member count, creator and "creator_changed", None if the room is gone or sid isn't in it)
+        room = self.registry.rooms.get(code)
+        if room is None or sid not in room.connections:
+            return None
+        creator = room.creator
+        self.registry.leave(sid)
+        self._touch(code)
+        return {"members": room.members, "creator": room.creator, "creator_changed": room.creator != creator}
+
+    @_locked
+    def append_message(self, code, message):
+        self._touch(code)
+        return self.registry.rooms[code].messages.append(message)
+
+    @_locked
+    def latest_messages(self, code, limit):
+        # The last `limit` messages (oldest first) and the cursor for the page before them
+        history = self.registry.rooms[code].messages
+        latest = history.latest(limit)
+        return latest, history.cursor(latest)
+
+    @_locked
+    def messages_before(self, code, cursor, limit):
+        return self.registry.rooms[code].messages.before(cursor, limit)
+
+    @_locked
+    def history_stats(self):
+        return [room.messages.stats() for room in self.registry.rooms.values()]
+
+    @_locked
+    def history_totals(self):
+        # Messages and bytes held in all rooms' histories (what /metrics reports, without the per-room list)
+        histories = [room.messages for room in self.registry.rooms.values()]
+        return {"messages": sum(len(history) for history in histories), "bytes": sum(history.bytes for history in histories)}
+
+    @_locked
+    def expired(self, now, empty_ttl, idle_ttl):
+        # [(code, reason)] of rooms to reap, walking from the least recently active room
+        ttls = [ttl for ttl in (empty_ttl, idle_ttl) if ttl > 0]
+        if not ttls:
+            return []
+        expired = []
+        for code, active in self._activity.items():
+            age = now - active
+            if age < min(ttls):
+                break
+            room = self.registry.rooms.get(code)
+            if room is None:
+                continue
+            reason = _expiry(age, room.members, code in self._joined, empty_ttl, idle_ttl)
+            if reason:
+                expired.append((code, reason))
+        return expired
+
+    @_locked
+    def lifecycle_stats(self, now, leak_grace):
+        # Rooms with members (live) and without; empty ones past leak_grace are counted as leaked
+        rooms = self.registry.rooms
+        empty = [code for code, room in rooms.items() if room.members == 0]
+        return {
+            "rooms": len(rooms),
+            "live": len(rooms) - len(empty),
+            "empty": len(empty),
+            "leaked": sum(now - self._activity.get(code, now) >= leak_grace for code in empty),
+            "members": len(self.registry.sids),
+            "free_codes": len(self.codes) if self.codes is not None else 26 ** CODE_LENGTH - len(rooms),
+        }
+
+class RedisRoomStore:
+    ''' Rooms kept in Redis (or anything speaking its protocol), under these keys:
+
+        <prefix>rooms                  set of room codes
+        <prefix>rooms:active           sorted set of room codes scored by last activity
+        <prefix>codes                  list of free room codes, shuffled (LPOP to allocate,
+                                       RPUSH to give one back)
+        <prefix>codes:filled           "filling" / "done" once a worker has started filling it
+        <prefix>room:<code>            hash: creator, members, qkd_debug, joined
+        <prefix>room:<code>:sids       hash: sid -> user name, one field per connection
+        <prefix>room:<code>:order      sorted set of sids scored by joining time
+        <prefix>room:<code>:names      hash: user name -> number of its connections
+        <prefix>room:<code>:messages   sorted set of JSON messages scored by id, trimmed
+                                       to the last history_size (the ring buffer)
+        <prefix>room:<code>:next_id    id of the next message
+
+        Multi-key updates go through MULTI/EXEC pipelines so other workers never see
+        half of them.
+    '''
+
+    PARTS = ("sids", "order", "names", "messages", "next_id")
+    FILL_BATCH = 10000 # Codes per RPUSH while filling the pool
+
+    def __init__(self, url, history_size=500, prefix="qkdchat:"):
+        import redis # Only needed when a Redis URL is configured
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.history_size = history_size
+        self.prefix = prefix
+        self._codes_checked = False
+
+    def _key(self, code, part=None):
+        key = f"{self.prefix}room:{code}"
+        return key if part is None else f"{key}:{part}"
+
+    def exists(self, code):
+        return bool(self.redis.exists(self._key(code)))
+
+    def count(self):
+        return self.redis.scard(self.prefix + "rooms")
+
+    def create(self, code, creator, qkd_debug=False):
+        if not self.redis.hsetnx(self._key(code), "creator", creator or ""):
+            return False
+        with self.redis.pipeline() as pipe:
+            pipe.hset(self._key(code), mapping={"members": 0, "qkd_debug": int(qkd_debug)})
+            pipe.sadd(self.prefix + "rooms", code)
+            pipe.zadd(self.prefix + "rooms:active", {code: time.time()})
+            pipe.execute()
+        return True
+
+    def prepare_codes(self):
+        # The first worker to get here fills the shared pool with every code in a random order
+        if self._codes_checked:
+            return
+        self._codes_checked = True
+        if not self.redis.set(self.prefix + "codes:filled", "filling", nx=True):
+            return
+        codes = codes_from_indexes(shuffled_codes())
+        for start in range(0, len(codes), self.FILL_BATCH):
+            self.redis.rpush(self.prefix + "codes", *codes[start:start + self.FILL_BATCH])
+        self.redis.set(self.prefix + "codes:filled", "done")
+
+    def allocate(self, creator, qkd_debug=False):
+        self.prepare_codes()
+        while True:
+            code = self.redis.lpop(self.prefix + "codes")
+            if code is None:
+                if self.redis.get(self.prefix + "codes:filled") == "done":
+                    return None # Every code is in use
+                # Another worker is still filling the pool: fall back to a random code
+                code = code_from_index(random.randrange(26 ** CODE_LENGTH))
+            if self.create(code, creator, qkd_debug):
+                return code
+
+    def delete(self, code):
+        with self.redis.pipeline() as pipe:
+            pipe.delete(self._key(code), *(self._key(code, part) for part in self.PARTS))
+            pipe.srem(self.prefix + "rooms", code)
+            pipe.zrem(self.prefix + "rooms:active", code)
+            _, removed, _ = pipe.execute()
+        if removed:
+            self.redis.rpush(self.prefix + "codes", code)
+        return bool(removed)
+
+    def qkd_debug(self, code):
+        return self.redis.hget(self._key(code), "qkd_debug") == "1"
+
+    def info(self, code):
+        with self.redis.pipeline() as pipe:
+            pipe.hgetall(self._key(code))
+            pipe.zrange(self._key(code, "order"), 0, -1)
+            pipe.hgetall(self._key(code, "sids"))
+            room, order, names = pipe.execute()
+        if not room:
+            return None
+        users = [names[sid] for sid in order if sid in names]
+        return {"members": int(room.get("members", 0)), "users": users, "creator": room.get("creator") or None}
+
+    def join(self, code, name, sid):
+        # None if the room is gone (terminated or reaped while the connection waited for its key):
+        # the check and the writes are one transaction (WATCH/MULTI, retried when the room's hash
+        # changes in between), so a late join can't bring back a room without a creator
+        def update(pipe):
+            room = pipe.hgetall(self._key(code))
+            if not room:
+                return None
+            pipe.multi()
+            pipe.hincrby(self._key(code), "members", 1)
+            pipe.hset(self._key(code, "sids"), sid, name)
+            pipe.zadd(self._key(code, "order"), {sid: time.time()})
+            pipe.hincrby(self._key(code, "names"), name, 1)
+            pipe.hset(self._key(code), "joined", 1)
+            pipe.zadd(self.prefix + "rooms:active", {code: time.time()})
+            return {"members": int(room.get("members", 0)) + 1, "creator": room.get("creator") or None}
+        return self.redis.transaction(update, self._key(code), value_from_callable=True)
+
+    def leave(self, code, name, sid):
+        # None if the room is gone or sid isn't one of its connections; otherwise one transaction
+        # like join's, which also hands on the creator
+        def update(pipe):
+            room = pipe.hgetall(self._key(code))
+            if not room or pipe.hget(self._key(code, "sids"), sid) is None:
+                return None
+            members = int(room.get("members", 0)) - 1
+            creator = room.get("creator") or None
+            # Whoever left, the creator keeps the room while any of their connections is left
+            # (names at 0 are left in place rather than racing a concurrent join; they go with the room)
+            remaining = int(pipe.hget(self._key(code, "names"), creator or "") or 0) - (creator == name)
+            successor = None
+            if remaining <= 0 and members > 0:
+                # Hand the room to the longest-connected remaining user
+                first = next((other for other in pipe.zrange(self._key(code, "order"), 0, 1) if other != sid), None)
+                successor = pipe.hget(self._key(code, "sids"), first) if first is not None else None
+            pipe.multi()
+            pipe.hincrby(self._key(code), "members", -1)
+            pipe.hdel(self._key(code, "sids"), sid)
+            pipe.zrem(self._key(code, "order"), sid)
+            pipe.hincrby(self._key(code, "names"), name, -1)
+            pipe.zadd(self.prefix + "rooms:active", {code: time.time()})
+            if successor is not None:
+                pipe.hset(self._key(code), "creator", successor)
+                creator = successor
+            return {"members": members, "creator": creator, "creator_changed": successor is not None}
+        return self.redis.transaction(update, self._key(code), self._key(code, "sids"), self._key(code, "names"),
+                                      value_from_callable=True)
+
+    def append_message(self, code, message):
+        if self.history_size <= 0:
+            return message
+        message["id"] = self.redis.incr(self._key(code, "next_id")) - 1
+        message["time"] = int(time.time() * 1000)
+        with self.redis.pipeline() as pipe:
+            pipe.zadd(self._key(code, "messages"), {json.dumps(message): message["id"]})
+            pipe.zremrangebyrank(self._key(code, "messages"), 0, -self.history_size - 1)
+            pipe.zadd(self.prefix + "rooms:active", {code: time.time()})
+            pipe.execute()
+        return message
+
+    def _page(self, messages, oldest):
+        # Messages (oldest first) and the cursor for the page before them
+        messages = [json.loads(message) for message in messages]
+        if not messages or not oldest or messages[0]["id"] <= oldest[0][1]:
+            return messages, None
+        return messages, messages[0]["id"]
+
+    def latest_messages(self, code, limit):
+        with self.redis.pipeline() as pipe:
+            pipe.zrange(self._key(code, "messages"), -limit, -1)
+            pipe.zrange(self._key(code, "messages"), 0, 0, withscores=True)
+            messages, oldest = pipe.execute()
+        return self._page(messages if limit > 0 else [], oldest)
+
+    def messages_before(self, code, cursor, limit):
+        with self.redis.pipeline() as pipe:
+            pipe.zrevrangebyscore(self._key(code, "messages"), f"({cursor}", "-inf", start=0, num=limit)
+            pipe.zrange(self._key(code, "messages"), 0, 0, withscores=True)
+            messages, oldest = pipe.execute()
+        return self._page(messages[::-1], oldest)
+
+    def history_stats(self):
+        # Bytes are the serialized size of the stored messages
+        codes = self.redis.smembers(self.prefix + "rooms")
+        with self.redis.pipeline() as pipe:
+            for code in codes:
+                pipe.zrange(self._key(code, "messages"), 0, -1)
+                pipe.get(self._key(code, "next_id"))
+            results = pipe.execute()
+        return [
+            {
+                "messages": len(messages),
+                "capacity": self.history_size,
+                "bytes": sum(len(message) for message in messages),
+                "total_messages": int(next_id or 0),
+            }
+            for messages, next_id in zip(results[::2], results[1::2])
+        ]
+
+    def history_totals(self):
+        # Message counts only: sizing the histories would mean fetching every stored message (see history_stats)
+        codes = self.redis.smembers(self.prefix + "rooms")
+        with self.redis.pipeline() as pipe:
+            for code in codes:
+                pipe.zcard(self._key(code, "messages"))
+            counts = pipe.execute()
+        return {"messages": sum(counts), "bytes": None}
+
+    def expired(self, now, empty_ttl, idle_ttl):
+        ttls = [ttl for ttl in (empty_ttl, idle_ttl) if ttl > 0]
+        if not ttls:
+            return []
+        candidates = self.redis.zrangebyscore(self.prefix + "rooms:active", "-inf", now - min(ttls), withscores=True)
+        with self.redis.pipeline() as pipe:
+            for code, _ in candidates:
+                pipe.hmget(self._key(code), "members", "joined")
+            rooms = pipe.execute()
+        expired, gone = [], []
+        for (code, active), (members, joined) in zip(candidates, rooms):
+            if members is None: # Deleted while a late leave/message marked it active
+                gone.append(code)
+                continue
+            reason = _expiry(now - active, int(members), joined == "1", empty_ttl, idle_ttl)
+            if reason:
+                expired.append((code, reason))
+        if gone:
+            self.redis.zrem(self.prefix + "rooms:active", *gone)
+        return expired
+
+    def lifecycle_stats(self, now, leak_grace):
+        with self.redis.pipeline() as pipe:
+            pipe.zrange(self.prefix + "rooms:active", 0, -1, withscores=True)
+            pipe.llen(self.prefix + "codes")
+            pipe.get(self.prefix + "codes:filled")
+            active, free_codes, filled = pipe.execute()
+        with self.redis.pipeline() as pipe:
+            for code, _ in active:
+                pipe.hget(self._key(code), "members")
+            members = [int(count or 0) for count in pipe.execute()]
+        empty = [now - last for (_, last), count in zip(active, members) if count <= 0]
+        return {
+            "rooms": len(active),
+            "live": len(active) - len(empty),
+            "empty": len(empty),
+            "leaked": sum(age >= leak_grace for age in empty),
+            "members": sum(count for count in members if count > 0),
+            # Codes handed out at random while the pool was still being filled can be in it twice
+            "free_codes": min(free_codes, 26 ** CODE_LENGTH - len(active)) if filled == "done" else 26 ** CODE_LENGTH - len(active),
+        }
+
+def create_store(url=None, history_size=500):
+    # Redis-backed store for a redis:// (or rediss://, unix://) URL, in-memory otherwise
+    if url:
+        return RedisRoomStore(url, history_size=history_size)
+    return MemoryRoomStore(history_size=history_size)
@@ -0,0 +1,505 @@
+'''
+The server's components, configured from the environment (see the README): metrics, the
+room store and lifecycle, the broadcaster, the QKD backend, worker processes and key
+pool, and key rotation.
+
+Both server modes build them: main.py (Flask-SocketIO on gunicorn + eventlet) and asgi.py
+(python-socketio's asyncio server on uvicorn). A mode passes how its components send and
+wait: emit(event, data, to=...) sends a Socket.IO event, spawn(target) starts background
+work, sleep(seconds) and event() are what that work waits with. Under eventlet these are
+socketio's green-thread versions; under asyncio the defaults (OS threads) are used.
+
+What the Socket.IO events do (connect, disconnect, message, ...) is here too, so both
+modes behave the same; their handlers only deal with the transport: the session, the
+connection's Socket.IO room and accepting or refusing it.
+'''
+
+import logging
+import os
+import signal
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from roomstore import create_store
+from lifecycle import RoomLifecycle
+from broadcast import RoomBroadcaster
+from keyrotation import KeyRotator
+from limits import OutboundLimit, RateLimits, TokenBuckets, client_address, parse_limit
+from metrics import LoopLagMonitor, Registry
+from qkd import generate_key, get_amplifier, get_backend, warm_up, xor_decrypt, AerBatcher, ChannelTooNoisy, KeyPool, QKDBusy, QKDExecutor
+from qkd.backends import BIT_FLIP_RATE, PHASE_FLIP_RATE
+from qkd.bb84 import N_QUBITS
+from qkd.threads import spawn_thread
+
+server_log = logging.getLogger("server")
+qkd_log = logging.getLogger("qkd")
+rooms_log = logging.getLogger("rooms")
+messages_log = logging.getLogger("messages")
+
+class Services:
+    ''' Everything the Socket.IO handlers and pages of a server process use. Nothing runs
+        until start() (warm-up, key pool, room reaper); the loop lag probe is started by
+        the server mode, on its own loop.
+    '''
+
+    def __init__(self, emit, spawn=None, sleep=time.sleep, event=threading.Event):
+        self.boot_started = time.perf_counter()
+        self.emit = emit
+        self.spawn = spawn or spawn_thread
+
+        # With REDIS_URL set, rooms live in Redis and emits go through its pub/sub, so several
+        # workers (gunicorn -w N, or several hosts) can serve the same rooms; without it
+        # everything stays in this process (one worker only):
+        self.redis_url = os.environ.get('REDIS_URL') or None
+
+        # Prometheus metrics (GET /metrics), see metrics.py. Values the components already keep are
+        # collected when /metrics is scraped (room_metrics, delivery_metrics); these are updated as things happen:
+        self.metrics = metrics = Registry()
+        self.qkd_connect_seconds = metrics.histogram("qkd_connect_seconds", "Time a connection waited for its QKD key, by where the key came from", ["source"])
+        self.qkd_stage_seconds = metrics.histogram("qkd_stage_seconds", "BB84 time per protocol stage for one key, summed over its chunks", ["stage"])
+        self.qkd_keys = metrics.counter("qkd_keys_total", "BB84 keys generated")
+        self.qkd_chunks = metrics.counter("qkd_chunks_total", "BB84 chunks run")
+        self.qkd_aborts = metrics.counter("qkd_aborts_total", "BB84 chunks aborted and re-run: QBER at or above the threshold (qber), errors left after reconciliation (residual_errors) or too few sifted bits to estimate it (sifted_bits)", ["reason"])
+        self.qkd_cascade_passes = metrics.counter("qkd_cascade_passes_total", "Cascade passes run")
+        self.messages_received = metrics.counter("chat_messages_received_total", "Chat messages received from clients")
+        self.messages_dropped = metrics.counter("chat_messages_dropped_total", "Chat messages that could not be decrypted and were dropped: malformed (invalid-payload) or for a retired key (unknown-key-epoch)", ["reason"])
+        self.socketio_emits = metrics.counter("socketio_emits_total", "Socket.IO events emitted by this worker", ["event"]) # See metrics.count_emits
+
+        # Event loop lag, sampled every METRICS_LAG_INTERVAL_MS (0 turns the probe off):
+        self.loop_lag = LoopLagMonitor(
+            metrics.histogram("event_loop_lag_seconds", "How much later than asked a sleeping task woke up"),
+            metrics.gauge("event_loop_lag_last_seconds", "Latest event loop lag sample"),
+            interval=float(os.environ.get('METRICS_LAG_INTERVAL_MS', 500)) / 1000,
+            spawn=spawn,
+            sleep=sleep,
+        )
+
+        # Message history kept per room (a ring buffer, oldest messages are dropped first),
+        # how much of it the room page renders and how much a "requestHistory" page returns:
+        self.history_size = int(os.environ.get('HISTORY_SIZE', 500))
+        self.history_initial = int(os.environ.get('HISTORY_INITIAL', 50))
+        self.history_page_size = int(os.environ.get('HISTORY_PAGE_SIZE', 50))
+
+        # Stores information about existing rooms (codes, users, creator and message history), see roomstore.py:
+        self.room_store = create_store(self.redis_url, history_size=self.history_size)
+
+        # Chat messages to rooms, coalesced into one "messages" emit per room every ROOM_COALESCE_MS
+        # (or every ROOM_COALESCE_MAX messages) when set; 0 sends each message on its own:
+        self.broadcaster = RoomBroadcaster(
+            emit=emit,
+            window=float(os.environ.get('ROOM_COALESCE_MS', 0)) / 1000,
+            max_batch_size=int(os.environ.get('ROOM_COALESCE_MAX', 32)),
+            spawn=spawn,
+            sleep=sleep,
+        )
+
+        # Room codes (allocated from a shuffled pool in O(1) and recycled on deletion) and reaping of rooms left
+        # without members for ROOM_EMPTY_TTL seconds, or with no activity for ROOM_IDLE_TTL seconds, see lifecycle.py:
+        self.room_lifecycle = RoomLifecycle(
+            self.room_store,
+            empty_ttl=float(os.environ.get('ROOM_EMPTY_TTL', 600)),
+            idle_ttl=float(os.environ.get('ROOM_IDLE_TTL', 0)),
+            interval=float(os.environ.get('ROOM_REAP_INTERVAL', 30)),
+            on_reap=self.room_reaped,
+            spawn=spawn,
+            sleep=sleep,
+        )
+
+        # Workers don't share Engine.IO sessions, so without sticky sessions the long-polling
+        # requests of one client could land on different workers; clients go straight to websockets:
+        self.socketio_options = {"transports": ["websocket"]} if self.redis_url else {}
+
+        # Batches concurrent users' circuits into shared Aer jobs when the "qiskit-batched" backend is used:
+        self.aer_batcher = AerBatcher(
+            max_batch_size=int(os.environ.get('QKD_BATCH_SIZE', 16)),
+            window=float(os.environ.get('QKD_BATCH_WINDOW_MS', 20)) / 1000,
+            spawn=spawn,
+            sleep=sleep,
+            event=event,
+        ).register("qiskit-batched")
+
+        # Simulation backend for distributing quantum states ("qiskit" reference, "qiskit-batched" or vectorized "numpy"):
+        self.qkd_backend = os.environ.get('QKD_BACKEND', 'qiskit')
+        get_backend(self.qkd_backend) # Fail fast on unknown backends
+
+        # Key length, chunk size, privacy amplification mode (None keeps the single-chunk, hash-stretched 256-bit key) and channel noise:
+        self.qkd_options = {
+            "backend": self.qkd_backend,
+            "key_length": int(os.environ['QKD_KEY_BITS']) if 'QKD_KEY_BITS' in os.environ else None,
+            "chunk_qubits": int(os.environ.get('QKD_CHUNK_QUBITS', N_QUBITS)),
+            "amplification": os.environ.get('QKD_AMPLIFICATION', 'hash'),
+            "bit_flip_rate": float(os.environ.get('QKD_BIT_FLIP_RATE', BIT_FLIP_RATE)),
+            "phase_flip_rate": float(os.environ.get('QKD_PHASE_FLIP_RATE', PHASE_FLIP_RATE)),
+        }
+        get_amplifier(self.qkd_options["amplification"]) # Fail fast on unknown modes
+
+        # Worker processes that run BB84 off the event loop (0 runs the protocol inside the server process):
+        qkd_processes = int(os.environ.get('QKD_PROCESSES', 1))
+        if qkd_processes > 0:
+            if self.qkd_backend == "qiskit-batched":
+                raise ValueError("The qiskit-batched backend batches circuits inside the server process, set QKD_PROCESSES=0 to use it")
+            self.qkd_executor = QKDExecutor(
+                processes=qkd_processes,
+                max_pending=int(os.environ.get('QKD_QUEUE_SIZE', 32)),
+                timeout=float(os.environ.get('QKD_TIMEOUT', 30)),
+                sleep=sleep,
+            )
+            self.qkd_run = partial(self.qkd_executor.generate, **self.qkd_options)
+        else:
+            self.qkd_executor = None
+            self.qkd_run = partial(generate_key, **self.qkd_options)
+
+        # Pool of pre-generated QKD keys, refilled in the background so connect doesn't run BB84 inline:
+        self.key_pool = KeyPool(
+            size=int(os.environ.get('QKD_POOL_SIZE', 8)), # 0 disables the pool
+            low_watermark=int(os.environ['QKD_POOL_LOW_WATERMARK']) if 'QKD_POOL_LOW_WATERMARK' in os.environ else None,
+            workers=int(os.environ.get('QKD_POOL_WORKERS', 1)),
+            generator=self.qkd_generate,
+            spawn=spawn,
+            sleep=sleep,
+        )
+
+        # In-session rekeying: a connection's key is replaced in the background after KEY_ROTATE_MESSAGES
+        # messages or once it is KEY_ROTATE_SECONDS old (0 turns either trigger off), see keyrotation.py:
+        self.key_rotator = KeyRotator(
+            generate=self.rotation_key,
+            emit=emit,
+            every_messages=int(os.environ.get('KEY_ROTATE_MESSAGES', 0)),
+            every_seconds=float(os.environ.get('KEY_ROTATE_SECONDS', 0)),
+            spawn=spawn,
+        )
+
+        # Token bucket rate limits ("rate,burst" per second, 0 turns one off) per connection, room and client
+        # address on the events clients send; RATE_LIMITS=0 turns them all off, see limits.py:
+        limits_on = os.environ.get('RATE_LIMITS', '1') != '0'
+        def limit(name, default):
+            return parse_limit(os.environ.get(name, default)) if limits_on else None
+        self.rate_limits = RateLimits({
+            "message": {"sid": limit('RATE_LIMIT_MESSAGE', '5,20'), "room": limit('RATE_LIMIT_MESSAGE_ROOM', '50,100')},
+            "requestUserList": {"sid": limit('RATE_LIMIT_USER_LIST', '2,10'), "room": limit('RATE_LIMIT_USER_LIST_ROOM', '20,50')},
+            "connect": {"room": limit('RATE_LIMIT_CONNECT_ROOM', '5,30'), "address": limit('RATE_LIMIT_CONNECT', '2,20')},
+        })
+        self.limit_notices = TokenBuckets(rate=0.2, burst=1) # A flooding client hears about it every 5 s at most
+        # Proxies of ours in front of the server; X-Forwarded-For is ignored without any (clients can forge it).
+        # The Procfile sets 1 for the platform's router; run directly the default is 0:
+        self.trusted_proxies = int(os.environ.get('TRUSTED_PROXIES', 0))
+        self._proxy_warned = False
+
+        # Packets queued for a client that reads too slowly: past OUTBOUND_QUEUE_MAX its chat messages are
+        # dropped or it is disconnected (OUTBOUND_POLICY); the server mode installs it on its Socket.IO server:
+        self.outbound = OutboundLimit(
+            max_queue=int(os.environ.get('OUTBOUND_QUEUE_MAX', 500)),
+            policy=os.environ.get('OUTBOUND_POLICY', 'drop'),
+            spawn=spawn,
+        )
+
+        # Readiness: stays false until the quantum stack has been imported and warmed up
+        self.readiness = {"ready": False}
+
+        metrics.collector(self.room_metrics)
+        metrics.collector(self.delivery_metrics)
+        metrics.collector(self.limit_metrics)
+
+    def start(self):
+        # Fills the room code pool, starts the reaper and warms up QKD (then fills the key pool)
+        self.room_lifecycle.start()
+        if os.environ.get('QKD_WARMUP', '1') != '0':
+            self.spawn(self.warm_up_qkd)
+        else:
+            self.mark_ready() # Skip warm-up (fast dev restarts)
+        return self
+
+    def room_reaped(self, code, reason):
+        # Members still connected to a reaped (idle) room are sent home as if it was terminated
+        self.broadcaster.flush(code)
+        self.emit("roomTerminated", {"code": code}, to=code)
+
+    def qkd_generate(self, stats=None, **options):
+        # Runs the protocol (for connect, the key pool or a rotation) and records it in the metrics
+        stats = {} if stats is None else stats
+        key = self.qkd_run(stats=stats, **options)
+        self.qkd_keys.inc()
+        self.qkd_chunks.inc(stats.get("chunks", 0))
+        self.qkd_aborts.inc(stats.get("qber_aborts", 0), reason="qber")
+        self.qkd_aborts.inc(stats.get("residual_aborts", 0), reason="residual_errors")
+        self.qkd_aborts.inc(stats.get("aborted", 0) - stats.get("qber_aborts", 0) - stats.get("residual_aborts", 0), reason="sifted_bits")
+        self.qkd_cascade_passes.inc(stats.get("cascade_passes", 0))
+        for stage, ms in stats.get("stage_ms", {}).items():
+            self.qkd_stage_seconds.observe(ms / 1000, stage=stage)
+        return key
+
+    def rotation_key(self):
+        # A rotated key comes from the pool when it has one, else from a fresh exchange
+        entry = self.key_pool.get()
+        return entry[0] if entry is not None else self.qkd_generate()
+
+    def client_address(self, environ):
+        # The address connects are rate-limited by (see limits.client_address)
+        if not self.trusted_proxies and not self._proxy_warned and environ.get("HTTP_X_FORWARDED_FOR"):
+            # Behind a proxy every client would share its address, and its connect limit
+            self._proxy_warned = True
+            server_log.warning("X-Forwarded-For received with TRUSTED_PROXIES=0: connects are rate-limited per peer "
+                               "address, which behind a proxy is the proxy's; set TRUSTED_PROXIES to the number of proxies")
+        return client_address(environ, self.trusted_proxies)
+
+    def rate_limited(self, event, sid=None, room=None, address=None):
+        # The scope (sid, room, address) whose limit the event went over, None if it may go ahead;
+        # the sender of a dropped message is told with "rateLimited"
+        scope = self.rate_limits.allow(event, sid=sid, room=room, address=address)
+        if scope is not None:
+            server_log.debug("rate limited event=%s scope=%s sid=%s room=%s", event, scope, sid, room)
+            if event == "message" and self.limit_notices.take(sid):
+                self.emit("rateLimited", {"event": event, "scope": scope}, to=sid)
+        return scope
+
+    def mark_ready(self, **timings):
+        self.readiness.update(timings, ready=True, time_to_ready_ms=round(1000 * (time.perf_counter() - self.boot_started), 1))
+        server_log.info("ready time_to_ready_ms=%s", self.readiness['time_to_ready_ms'])
+        self.key_pool.start()
+
+    def warm_up_qkd(self):
+        # With worker processes the protocol never runs here, so only the workers need warming
+        server_log.info("warming up the quantum stack backend=%s", self.qkd_backend)
+        try:
+            if self.qkd_executor is not None:
+                timings = self.qkd_executor.warm_up(self.qkd_backend)
+            else:
+                timings = warm_up(self.qkd_backend)
+        except Exception as error:
+            # A worker that can't run the protocol would otherwise answer 503 on /ready for good without
+            # saying why: log it and stop the worker (gracefully, so the log is written), which gunicorn
+            # replaces and uvicorn exits on
+            self.readiness["error"] = f"{type(error).__name__}: {error}"
+            server_log.exception("warm-up failed, stopping the worker backend=%s", self.qkd_backend)
+            os.kill(os.getpid(), signal.SIGTERM)
+            return
+        self.mark_ready(**timings)
+
+    # Socket.IO events. These may block on the room store and on QKD: asgi.py calls them off the loop.
+
+    def qkd_summary(self, sid, source, transcript, stats, elapsed, error=None):
+        # Sends the client one summary of its key exchange: the protocol log, per-stage timings and totals
+        self.emit("qkd_summary", {
+            "source": source, # "pool" (pre-generated) or "inline"
+            "ms": round(1000 * elapsed, 1),
+            "stage_ms": stats.get("stage_ms", {}),
+            "chunks": stats.get("chunks"),
+            "aborted": stats.get("aborted"),
+            "reconciled_bits": stats.get("reconciled_bits"),
+            "log": [{"message": message, "type": msg_type} for message, msg_type in transcript],
+            "error": error,
+        }, to=sid)
+
+    def admit(self, sid, room, name, is_new_room, address):
+        # Whether a connect may go on to its key exchange: it has a room and a name, is within the
+        # connect rate limits and its room exists (a new room is created here)
+        rooms_log.debug("connect sid=%s name=%s room=%s", sid, name, room)
+        if not room or not name:
+            rooms_log.info("connect rejected sid=%s reason=missing-room-or-name", sid)
+            return False
+
+        # Connect floods and reconnect loops are refused before any QKD runs (see limits.py):
+        if self.rate_limited("connect", room=room, address=address):
+            rooms_log.info("connect rejected sid=%s room=%s reason=rate-limited", sid, room)
+            return False
+
+        if not self.room_store.exists(room) and not is_new_room:
+            rooms_log.info("connect rejected sid=%s room=%s reason=unknown-room", sid, room)
+            return False
+
+        # Create the room if it's new and doesn't exist yet
+        if is_new_room and self.room_store.create(room, name):
+            rooms_log.info("room created room=%s creator=%s", room, name)
+        return True
+
+    def connect_key(self, sid, room, auth=None):
+        # The connection's BB84 key (see qkd/bb84.py), None if the key exchange failed. A pre-generated key comes
+        # from the pool (its protocol log was recorded when it was made), else the protocol runs now.
+        # QKD debug stream: opted into by the client (auth {"qkd_debug": true}) or for the whole room by
+        # its creator; the protocol log is then collected and sent as one "qkd_summary" event
+        debug_stream = (isinstance(auth, dict) and auth.get("qkd_debug") is True) or self.room_store.qkd_debug(room)
+        transcript = []
+        stats = {}
+
+        started = time.perf_counter()
+        entry = self.key_pool.get()
+        if entry is not None:
+            key, transcript, stats = entry
+            source = "pool"
+        else:
+            source = "inline"
+            qkd_log.debug("key pool empty, running BB84 inline sid=%s", sid)
+            record = {"debug": lambda message, msg_type='info': transcript.append((message, msg_type))} if debug_stream else {}
+            try:
+                key = self.qkd_generate(stats=stats, **record)
+            except (QKDBusy, TimeoutError, BrokenProcessPool, ChannelTooNoisy) as error:
+                qkd_log.warning("key exchange failed sid=%s room=%s error=%s", sid, room, type(error).__name__)
+                if debug_stream:
+                    self.qkd_summary(sid, source, transcript, stats, time.perf_counter() - started, error=f"Key exchange unavailable: {error}")
+                return None
+
+        elapsed = time.perf_counter() - started
+        self.qkd_connect_seconds.observe(elapsed, source=source)
+        qkd_log.info("key exchanged sid=%s source=%s bits=%d ms=%.1f", sid, source, len(key), 1000 * elapsed)
+        if debug_stream:
+            self.qkd_summary(sid, source, transcript, stats, elapsed)
+        return key
+
+    def join(self, sid, room, name, key):
+        # Adds the connection to its room: the member count and creator, None if the room is gone by now
+        # (terminated or reaped while the key was made; the connect is then refused with room_gone(room))
+        info = self.room_store.join(room, name, sid)
+        if info is None:
+            rooms_log.info("connect rejected sid=%s room=%s reason=room-gone", sid, room)
+            return None
+        self.key_rotator.add(sid, key) # This connection's messages are decrypted with it (and its rotated successors)
+        return info
+
+    @staticmethod
+    def room_gone(room):
+        # The ConnectionRefusedError arguments for a connect whose room is gone: the client's
+        # connect_error has the message and {"reason": "roomGone", "code": room} as data
+        return "The room no longer exists", {"reason": "roomGone", "code": room}
+
+    def joined(self, sid, room, name, key, info):
+        # The connection is in the room's Socket.IO room: it gets its key and name, the room the news
+        self.emit("key", key, to=sid)
+        self.emit("setUserName", {"name": name}, to=sid)
+        self.broadcaster.send(room, {"name": name, "message": "has entered the room."})
+        # Others get the change only; the joining page asks for the full list ("requestUserList")
+        self.emit("userJoined", {"name": name, "creator": info["creator"], "members": info["members"]}, to=room, skip_sid=sid)
+        rooms_log.info("joined room=%s name=%s sid=%s members=%d", room, name, sid, info["members"])
+
+    def leave(self, sid, room, name):
+        # The connection is gone: its keys are dropped and it is removed from its room (once the creator
+        # has no connection left, the next user becomes the creator; an empty room is deleted)
+        self.key_rotator.remove(sid)
+        if not room or not name:
+            rooms_log.debug("disconnect sid=%s without room or name", sid)
+            return
+
+        info = self.room_store.leave(room, name, sid)
+        if info is None: # The room is gone, or the connection never made it into the room
+            return
+        if info["creator_changed"]:
+            rooms_log.info("creator changed room=%s creator=%s", room, info["creator"])
+        rooms_log.info("left room=%s name=%s sid=%s members=%d", room, name, sid, info["members"])
+        if info["members"] <= 0:
+            rooms_log.info("room deleted room=%s reason=empty", room)
+            self.room_lifecycle.delete(room, "empty")
+        else:
+            self.emit("userLeft", {"name": name, "creator": info["creator"], "members": info["members"]}, to=room)
+        self.broadcaster.send(room, {"name": name, "message": "has left the room"})
+
+    def user_list(self, sid, room):
+        # Full user list on demand (page load, or when a client's list got out of step with the deltas)
+        if not room or self.rate_limited("requestUserList", sid=sid, room=room):
+            return
+        info = self.room_store.info(room)
+        if info is not None:
+            self.emit("updateUserList", {"users": info["users"], "creator": info["creator"]}, to=sid)
+
+    def message(self, sid, room, name, data):
+        # A chat message: decrypted with the sender's key, added to the history and sent to the room
+        # Over its rate limits (see limits.py) the message is dropped before it costs a decrypt, a store write and a broadcast
+        if not room or self.rate_limited("message", sid=sid, room=room) or not self.room_store.exists(room):
+            return
+        self.messages_received.inc()
+
+        # Anything but {"message": Base64 text, "epoch": n} is dropped (like a malformed rekeyAck)
+        if not isinstance(data, dict) or not isinstance(data.get("message"), str):
+            messages_log.warning("message dropped room=%s sid=%s reason=invalid-payload", room, sid)
+            self.messages_dropped.inc(reason="invalid-payload")
+            return
+
+        # ASCII key bytes of the epoch the client encrypted with (see keyrotation.py)
+        epoch = data.get("epoch")
+        key = self.key_rotator.key(sid, epoch if isinstance(epoch, int) else None)
+        if key is None:
+            messages_log.warning("message dropped room=%s sid=%s reason=unknown-key-epoch epoch=%s", room, sid, epoch)
+            self.messages_dropped.inc(reason="unknown-key-epoch")
+            return
+
+        try:
+            original_text = xor_decrypt(data["message"], key) # Base64 encoded by the client, XORed with the key
+        except ValueError: # Not Base64
+            messages_log.warning("message dropped room=%s sid=%s reason=invalid-payload", room, sid)
+            self.messages_dropped.inc(reason="invalid-payload")
+            return
+
+        content = {
+            "name": name,
+            "message": original_text
+        }
+        self.room_store.append_message(room, content) # Adds the message's id (history cursor) and time
+        self.broadcaster.send(room, content)
+        messages_log.info("message room=%s name=%s chars=%d", room, name, len(original_text)) # Never the text itself
+        self.key_rotator.message_sent(sid) # May start a background rekey
+
+    def rekey_ack(self, sid, data):
+        # The client has switched to a rotated key ({"epoch": n}); the previous key is retired
+        epoch = data.get("epoch") if isinstance(data, dict) else None
+        if isinstance(epoch, int):
+            self.key_rotator.acknowledge(sid, epoch)
+
+    def history_page(self, sid, room, data):
+        # Page back through the room's history: {"before": cursor} -> "history" event with up to
+        # history_page_size older messages and the cursor for the page before them (None at the start)
+        if not room or not self.room_store.exists(room):
+            return
+        try:
+            cursor = int(data["before"])
+            limit = min(int(data.get("limit", self.history_page_size)), self.history_page_size)
+        except (KeyError, TypeError, ValueError):
+            return
+        page, older = self.room_store.messages_before(room, cursor, limit)
+        self.emit("history", {"messages": page, "cursor": older}, to=sid)
+
+    def terminate(self, sid, room, name):
+        # The room's creator closes it: its members are sent home (after any messages still held for it)
+        info = self.room_store.info(room) if room else None
+        if info is not None and info["creator"] == name:
+            self.broadcaster.flush(room)
+            self.emit("roomTerminated", {"code": room}, to=room)
+            self.room_lifecycle.delete(room, "terminated")
+            rooms_log.info("room terminated room=%s by=%s", room, name)
+
+    def room_metrics(self):
+        rooms = self.room_lifecycle.stats()
+        history = self.room_store.history_totals()
+        families = [
+            ("chat_rooms", "gauge", "Rooms with members (live) and without (empty); leaked rooms are empty ones past the grace period",
+             [({"state": state}, rooms[state]) for state in ("live", "empty", "leaked")]),
+            ("chat_room_members", "gauge", "Connections in rooms", rooms["members"]),
+            ("chat_room_codes_free", "gauge", "Room codes left to allocate", rooms["free_codes"]),
+            ("chat_rooms_created_total", "counter", "Rooms created by this worker", rooms["created"]),
+            ("chat_rooms_deleted_total", "counter", "Rooms deleted by this worker, by reason",
+             [({"reason": reason}, count) for reason, count in rooms["deleted"].items()]),
+            ("chat_rooms_reaped_total", "counter", "Rooms reaped by this worker, by reason",
+             [({"reason": reason}, count) for reason, count in rooms["reaped"].items()]),
+            ("chat_history_messages", "gauge", "Messages held in room histories", history["messages"]),
+        ]
+        if history["bytes"] is not None:
+            families.append(("chat_history_bytes", "gauge", "Approximate memory of the messages held in room histories", history["bytes"]))
+        return families
+
+    def delivery_metrics(self):
+        broadcast = self.broadcaster.stats()
+        return [
+            ("chat_broadcast_messages_total", "counter", "Chat messages sent to rooms", broadcast["messages"]),
+            ("chat_broadcast_frames_total", "counter", "Emits the chat messages went out in (fewer than messages when coalescing)", broadcast["frames"]),
+            ("qkd_pool_keys", "gauge", "Pre-generated QKD keys ready for new connections", self.key_pool.stats()["size"]),
+        ]
+
+    def limit_metrics(self):
+        limits = self.rate_limits.stats()
+        outbound = self.outbound.stats()
+        return [
+            ("chat_rate_limited_total", "counter", "Client events rejected by a rate limit, by event and scope (sid, room, address)",
+             [({"event": name.split(".")[0], "scope": name.split(".")[1]}, count) for name, count in limits["rejected"].items()]),
+            ("socketio_outbound_queue_deepest", "gauge", "Packets queued for the slowest client", outbound["deepest_queue"]),
+            ("socketio_outbound_dropped_total", "counter", "Packets not queued for clients with a full outbound queue", outbound["dropped"]),
+            ("socketio_outbound_disconnects_total", "counter", "Clients disconnected for a full outbound queue", outbound["disconnects"]),
+        ]
@@ -0,0 +1,86 @@
+'''
+Privacy amplification (qkd/amplification.py): the FFT-based toeplitz_hash must equal the
+matrix product T x mod 2 it stands in for, both amplifiers must give keys of exactly the
+requested length whatever the chunking, and secure_length must follow the BB84 bound.
+'''
+
+from math import log2
+
+import numpy as np
+import pytest
+
+from qkd.amplification import HashAmplifier, ToeplitzAmplifier, binary_entropy, secure_length, toeplitz_hash
+
+def toeplitz_reference(bits, seed, length):
+    # Dense T[i][j] = seed[i - j + n - 1], multiplied out mod 2
+    n = len(bits)
+    rows = np.arange(length)[:, None] - np.arange(n)[None, :] + n - 1
+    return (seed[rows].astype(np.int64) @ bits.astype(np.int64) % 2).astype(np.uint8)
+
+@pytest.mark.parametrize("n, length", [(1, 1), (8, 3), (64, 64), (257, 100), (1000, 1000), (3000, 1234)])
+@pytest.mark.parametrize("seed", range(3))
+def test_toeplitz_hash_matches_matrix_product(n, length, seed):
+    rng = np.random.default_rng(seed)
+    bits = rng.integers(0, 2, n, dtype=np.uint8)
+    toeplitz_seed = rng.integers(0, 2, length + n - 1, dtype=np.uint8)
+    got = toeplitz_hash(bits, toeplitz_seed, length)
+    assert got.dtype == np.uint8
+    assert np.array_equal(got, toeplitz_reference(bits, toeplitz_seed, length))
+
+def test_toeplitz_hash_is_linear():
+    rng = np.random.default_rng(0)
+    x, y = rng.integers(0, 2, (2, 500), dtype=np.uint8)
+    seed = rng.integers(0, 2, 200 + 500 - 1, dtype=np.uint8)
+    assert np.array_equal(toeplitz_hash(x ^ y, seed, 200), toeplitz_hash(x, seed, 200) ^ toeplitz_hash(y, seed, 200))
+
+@pytest.mark.parametrize("chunks", [[1000], [1, 999], [300, 300, 400], [7] * 143])
+def test_toeplitz_amplifier_chunking(chunks):
+    # Same key and seed stream whatever the chunk sizes: same output
+    bits = np.random.default_rng(1).integers(0, 2, sum(chunks), dtype=np.uint8)
+    whole = ToeplitzAmplifier(np.random.default_rng(2))
+    whole.update(bits)
+    chunked = ToeplitzAmplifier(np.random.default_rng(2))
+    start = 0
+    for size in chunks:
+        chunked.update(bits[start:start + size])
+        start += size
+    assert chunked.n == len(bits)
+    key = chunked.bits(600)
+    assert len(key) == 600 and set(key) <= {"0", "1"}
+    assert key == whole.bits(600)
+
+def test_toeplitz_amplifier_refuses_longer_output():
+    amplifier = ToeplitzAmplifier(np.random.default_rng(0))
+    amplifier.update([1, 0, 1])
+    with pytest.raises(ValueError):
+        amplifier.bits(4)
+
+@pytest.mark.parametrize("length", [1, 255, 256, 257, 1000])
+@pytest.mark.parametrize("first_bit, name", [(1, "SHA-256"), (0, "SHA3-256")])
+def test_hash_amplifier(length, first_bit, name):
+    amplifier = HashAmplifier(np.random.default_rng(0))
+    amplifier.update([first_bit] + [1, 0] * 50)
+    amplifier.update([0, 1] * 50)
+    key = amplifier.bits(length)
+    assert amplifier.name == name
+    assert len(key) == length and set(key) <= {"0", "1"}
+    assert amplifier.bits(length) == key, "reading the key out must not change the hash state"
+
+@pytest.mark.parametrize("p", [0.01, 0.03, 0.11, 0.5])
+def test_binary_entropy(p):
+    assert binary_entropy(p) == pytest.approx(-p * log2(p) - (1 - p) * log2(1 - p))
+    assert binary_entropy(p) == pytest.approx(binary_entropy(1 - p))
+
+@pytest.mark.parametrize("p", [0, 1, -0.1, 1.5])
+def test_binary_entropy_edges(p):
+    assert binary_entropy(p) == 0.0
+
+@pytest.mark.parametrize("reconciled, leaked, qber, expected", [
+    (1000, 0, 0.0, 1000),
+    (1000, 100, 0.0, 900),
+    (1000, 100, 0.03, int(1000 * (1 - binary_entropy(0.03)) - 100)),
+    (1000, 0, 0.5, 0), # A coin flip per bit: nothing is secret
+    (1000, 2000, 0.01, 0),
+])
+def test_secure_length(reconciled, leaked, qber, expected):
+    assert secure_length(reconciled, leaked, qber) == expected
@@ -0,0 +1,68 @@
+'''
+The "qiskit" and "numpy" distribution backends must be statistically equivalent: over a
+few hundred seeded runs each, the fraction of matching bases, the error rate on matching
+bases and the fraction of 1s Bob receives agree between them and with the channel's
+expected values (benchmarks/bb84_backends.py runs the same check at scale, with timings).
+'''
+
+import math
+import random
+
+import numpy as np
+import pytest
+
+from qkd import backends
+from qkd.backends import BIT_FLIP_RATE, numpy_distribute, qiskit_distribute
+
+RUNS = 300
+QUBITS = 24 # Per run; the statistics are pooled over the runs
+Z_LIMIT = 4.0
+
+class SeededSimulator:
+    # Gives every Aer run its own seed from rng, so the channel noise is reproducible but not repeated
+    def __init__(self, simulator, rng):
+        self.simulator = simulator
+        self.rng = rng
+
+    def run(self, circuit, **options):
+        return self.simulator.run(circuit, seed_simulator=self.rng.randrange(2**31), **options)
+
+def collect(distribute, runs=RUNS):
+    matched = errors = ones = 0
+    for _ in range(runs):
+        send_list, alice_basis, bob_basis, received = distribute(QUBITS)
+        same = np.array(alice_basis) == np.array(bob_basis)
+        flipped = np.array(send_list) != np.array(received)
+        matched += int(same.sum())
+        errors += int((flipped & same).sum())
+        ones += sum(received)
+    total = runs * QUBITS
+    return {"matched": (matched, total), "error_rate": (errors, matched), "ones": (ones, total)}
+
+def z_score(a, b):
+    (x1, n1), (x2, n2) = a, b
+    pooled = (x1 + x2) / (n1 + n2)
+    return (x1/n1 - x2/n2) / math.sqrt(pooled * (1 - pooled) * (1/n1 + 1/n2))
+
+@pytest.fixture(scope="module")
+def stats():
+    random.seed(7) # Alice's bits and both parties' bases in the qiskit backend
+    seeded = SeededSimulator(backends.simulator(), random.Random(11))
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(backends, "simulator", lambda *rates: seeded)
+        qiskit = collect(qiskit_distribute)
+    rng = np.random.default_rng(7)
+    numpy = collect(lambda n_qubits: numpy_distribute(n_qubits, rng=rng))
+    return {"qiskit": qiskit, "numpy": numpy}
+
+@pytest.mark.parametrize("stat", ["matched", "error_rate", "ones"])
+def test_backends_agree(stats, stat):
+    z = z_score(stats["qiskit"][stat], stats["numpy"][stat])
+    assert abs(z) < Z_LIMIT, f"{stat}: qiskit {stats['qiskit'][stat]} vs numpy {stats['numpy'][stat]} (z = {z:+.2f})"
+
+@pytest.mark.parametrize("backend", ["qiskit", "numpy"])
+@pytest.mark.parametrize("stat, expected", [("matched", 0.5), ("error_rate", BIT_FLIP_RATE), ("ones", 0.5)])
+def test_backend_matches_channel(stats, backend, stat, expected):
+    x, n = stats[backend][stat]
+    z = (x/n - expected) / math.sqrt(expected * (1 - expected) / n)
+    assert abs(z) < Z_LIMIT, f"{backend} {stat}: {x/n:.4f}, expected {expected:.4f} (z = {z:+.2f})"
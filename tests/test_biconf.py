@@ -0,0 +1,98 @@
+'''
+BICONF (qkd/biconf.py) against the list-based version it replaced: given the same random
+subsets, both must flip the same bits in the same rounds. Also checks the subsets drawn in
+each of random_subsets' regimes and the parity bits the rounds disclose.
+'''
+
+import sys
+
+import numpy as np
+import pytest
+
+from qkd.biconf import biconf, default_subset_size, random_subsets
+
+ROUNDS = 8
+SEEDS = range(5)
+
+def legacy_rounds(kFinalA, kFinalB, subsets):
+    # The list-based BICONF loop, with random.sample(...) replaced by the given subsets
+    corrections = []
+    pairs = list(enumerate(zip(kFinalA, kFinalB)))
+    for round_number, subset in enumerate(subsets, 1):
+        randomBlock = [pairs[i] for i in subset]
+        if sum(pair[1][0] for pair in randomBlock) % 2 != sum(pair[1][1] for pair in randomBlock) % 2:
+            while len(randomBlock) > 1:
+                half = len(randomBlock) // 2 + len(randomBlock) % 2
+                for block in (randomBlock[:half], randomBlock[half:]):
+                    if sum(pair[1][0] for pair in block) % 2 != sum(pair[1][1] for pair in block) % 2:
+                        randomBlock = block
+            errorIndex = randomBlock[0][0]
+            kFinalB[errorIndex] = 1 - kFinalB[errorIndex]
+            pairs[errorIndex] = (errorIndex, (kFinalA[errorIndex], kFinalB[errorIndex]))
+            corrections.append((round_number, errorIndex))
+    return kFinalB, corrections
+
+@pytest.fixture
+def recorded(monkeypatch):
+    # The subsets biconf draws, in order
+    drawn = []
+    def record(*args):
+        subsets = random_subsets(*args)
+        drawn.append(subsets.copy())
+        return subsets
+    monkeypatch.setattr(sys.modules["qkd.biconf"], "random_subsets", record)
+    return drawn
+
+@pytest.mark.parametrize("n, size", [(10, 10), (100, 40), (10000, 600), (10000, 30)])
+def test_random_subsets(n, size):
+    # Covers the whole-key, dense, without-replacement and redraw regimes
+    subsets = random_subsets(np.random.default_rng(n + size), n, ROUNDS, size)
+    assert subsets.shape == (ROUNDS, size)
+    assert subsets.min() >= 0 and subsets.max() < n
+    for row in subsets:
+        assert len(set(row.tolist())) == size, "a subset repeats an index"
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("n, qber", [(200, 0.01), (2000, 0.005), (10000, 0.002)])
+def test_matches_legacy(recorded, n, qber, seed):
+    rng = np.random.default_rng(seed)
+    alice = rng.integers(0, 2, n, dtype=np.uint8)
+    bob = alice ^ (rng.random(n) < qber).astype(np.uint8)
+    corrected, info = biconf(alice, bob, qber, ROUNDS, rng=rng)
+    legacy_bob, legacy_corrections = legacy_rounds(alice.tolist(), bob.tolist(), recorded[0].tolist())
+    assert info["corrections"] == legacy_corrections
+    assert corrected.tolist() == legacy_bob
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_corrections_and_leakage(recorded, seed):
+    n, qber = 2000, 0.005
+    rng = np.random.default_rng(seed)
+    alice = rng.integers(0, 2, n, dtype=np.uint8)
+    bob = alice ^ (rng.random(n) < qber).astype(np.uint8)
+    corrected, info = biconf(alice, bob, qber, ROUNDS, rng=rng)
+    size = default_subset_size(qber, n)
+    assert info["subset_size"] == size
+    # Every correction fixes a real error ...
+    fixed = [index for _, index in info["corrections"]]
+    assert len(set(fixed)) == len(fixed)
+    assert all(alice[i] != bob[i] for i in fixed)
+    assert int((corrected != alice).sum()) == int((bob != alice).sum()) - len(fixed)
+    # ... and discloses one parity per round plus one per bisection step
+    low, high = int(np.floor(np.log2(size))), int(np.ceil(np.log2(size)))
+    assert ROUNDS + low * len(fixed) <= info["leaked_bits"] <= ROUNDS + high * len(fixed)
+
+def test_single_error_found():
+    n = 64
+    alice = np.zeros(n, dtype=np.uint8)
+    bob = alice.copy()
+    bob[37] = 1
+    corrected, info = biconf(alice, bob, 0.0, rounds=1, subset_size=n, rng=np.random.default_rng(0))
+    assert info["corrections"] == [(1, 37)]
+    assert info["leaked_bits"] == 1 + 6
+    assert not corrected.any()
+
+@pytest.mark.parametrize("alice, rounds", [([], ROUNDS), ([0, 1, 1], 0)])
+def test_nothing_to_do(alice, rounds):
+    corrected, info = biconf(alice, list(alice), 0.01, rounds)
+    assert corrected.tolist() == list(alice)
+    assert info["corrections"] == [] and info["leaked_bits"] == 0
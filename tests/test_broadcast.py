@@ -0,0 +1,63 @@
+'''
+Coalescing of outbound room messages (broadcast.py): held messages go out as one
+"messages" emit when the window ends, the batch fills or the room is flushed, in the
+order they were sent; a single message still goes out as a plain "message". Flush timers
+are collected and fired by hand.
+'''
+
+import pytest
+
+from broadcast import RoomBroadcaster
+
+@pytest.fixture
+def emitted():
+    return []
+
+@pytest.fixture
+def timers():
+    return []
+
+def broadcaster(emitted, timers, window=0.05, max_batch_size=4):
+    return RoomBroadcaster(lambda event, data, to: emitted.append((event, data, to)), window=window,
+                           max_batch_size=max_batch_size, spawn=timers.append, sleep=lambda seconds: None)
+
+def fire(timers):
+    while timers:
+        timers.pop(0)()
+
+def test_without_window_every_message_goes_out(emitted, timers):
+    rooms = broadcaster(emitted, timers, window=0)
+    rooms.send("R", {"n": 1})
+    rooms.send("R", {"n": 2})
+    assert emitted == [("message", {"n": 1}, "R"), ("message", {"n": 2}, "R")]
+    assert timers == []
+
+def test_window_coalesces_in_order(emitted, timers):
+    rooms = broadcaster(emitted, timers)
+    for n in range(3):
+        rooms.send("R", {"n": n})
+    rooms.send("S", {"n": 9})
+    assert emitted == [] and len(timers) == 2, "one timer per room"
+    fire(timers)
+    assert emitted == [("messages", [{"n": 0}, {"n": 1}, {"n": 2}], "R"), ("message", {"n": 9}, "S")]
+    stats = rooms.stats()
+    assert (stats["messages"], stats["frames"], stats["flushes"]["window"]) == (4, 2, 2)
+
+def test_full_batch_goes_out_at_once(emitted, timers):
+    rooms = broadcaster(emitted, timers, max_batch_size=4)
+    for n in range(6):
+        rooms.send("R", {"n": n})
+    assert emitted == [("messages", [{"n": n} for n in range(4)], "R")]
+    fire(timers)
+    assert emitted[1:] == [("messages", [{"n": 4}, {"n": 5}], "R")]
+    assert rooms.stats()["flushes"] == {"window": 1, "size": 1, "explicit": 0}
+
+def test_flush_sends_held_messages(emitted, timers):
+    rooms = broadcaster(emitted, timers)
+    rooms.send("R", {"n": 1})
+    rooms.flush("R")
+    assert emitted == [("message", {"n": 1}, "R")]
+    fire(timers)
+    assert len(emitted) == 1, "nothing is left for the timer to send"
+    rooms.flush("R")
+    assert rooms.stats()["flushes"]["explicit"] == 1
@@ -0,0 +1,130 @@
+'''
+Cascade (qkd/cascade.py) against a plain reference: the same passes, permutations and
+queue order, but every block parity recomputed from the error vector instead of read
+from the Fenwick trees. Both must fix the same bits and disclose the same number of
+parities; on top of that, every correction must remove a real error and a run at a
+typical error rate must leave none.
+'''
+
+import numpy as np
+import pytest
+
+from qkd.cascade import DEFAULT_PASSES, _fenwick, _Pass, cascade, initial_block_size
+
+LENGTHS = [1, 7, 500, 4096]
+QBERS = [0.01, 0.03, 0.08]
+SEEDS = range(5)
+
+def noisy_keys(rng, n, qber):
+    alice = rng.integers(0, 2, n, dtype=np.uint8)
+    return alice, alice ^ (rng.random(n) < qber).astype(np.uint8)
+
+def reference_cascade(alice, bob, qber, passes=DEFAULT_PASSES, rng=None):
+    # Cascade with every parity summed over the block's bits (O(n) per parity)
+    errors = np.asarray(alice, dtype=np.uint8) ^ np.asarray(bob, dtype=np.uint8)
+    n = len(errors)
+    block_size = initial_block_size(qber, n)
+    done = [] # (permutation, position, block size)
+    corrections = leaked = 0
+
+    def parity(permutation, start, end):
+        return int(errors[permutation[start:end]].sum()) & 1
+
+    for pass_number in range(passes if n else 0):
+        permutation = np.arange(n) if pass_number == 0 else rng.permutation(n)
+        done.append((permutation, np.argsort(permutation), block_size))
+        starts = range(0, n, block_size)
+        leaked += len(starts)
+        queue = [(pass_number, block) for block, start in enumerate(starts)
+                 if parity(permutation, start, start + block_size)]
+
+        while queue:
+            number, block = queue.pop()
+            permutation, _, size = done[number]
+            start, end = block * size, min(block * size + size, n)
+            if not parity(permutation, start, end):
+                continue
+            while end - start > 1:
+                middle = (start + end) // 2
+                leaked += 1
+                if parity(permutation, start, middle):
+                    end = middle
+                else:
+                    start = middle
+            index = permutation[start]
+            errors[index] ^= 1
+            corrections += 1
+            for other, (other_permutation, position, size) in enumerate(done):
+                if other != number:
+                    other_block = position[index] // size
+                    if parity(other_permutation, other_block * size, other_block * size + size):
+                        queue.append((other, other_block))
+
+        block_size = min(2 * block_size, n)
+
+    return corrections, leaked, int(errors.sum())
+
+@pytest.mark.parametrize("n", LENGTHS)
+def test_fenwick_prefix_parity(n):
+    rng = np.random.default_rng(n)
+    bits = rng.integers(0, 2, n, dtype=np.uint8)
+    tree = _Pass(bits, np.arange(n), max(n, 1))
+    assert tree.tree == _fenwick(bits)
+    prefix = np.concatenate([[0], np.bitwise_xor.accumulate(bits)])
+    assert [tree.prefix_parity(i) for i in range(n + 1)] == prefix.tolist()
+
+    flipped = rng.choice(n, min(n, 5), replace=False)
+    for index in flipped:
+        tree.flip(index)
+        bits[index] ^= 1
+    prefix = np.concatenate([[0], np.bitwise_xor.accumulate(bits)])
+    assert [tree.prefix_parity(i) for i in range(n + 1)] == prefix.tolist(), "parities after flips"
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("qber", QBERS)
+@pytest.mark.parametrize("n", LENGTHS)
+def test_matches_reference(n, qber, seed):
+    alice, bob = noisy_keys(np.random.default_rng(seed), n, qber)
+    corrected, info = cascade(alice, bob, qber, rng=np.random.default_rng(seed))
+    expected = reference_cascade(alice, bob, qber, rng=np.random.default_rng(seed))
+    got = (info["corrections"], info["leaked_bits"], info["residual_errors"])
+    assert got == expected, f"(corrections, leaked, residual) {got}, reference {expected}"
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("qber", QBERS)
+def test_corrections_remove_errors(qber, seed):
+    alice, bob = noisy_keys(np.random.default_rng(seed), 4096, qber)
+    errors = int((alice != bob).sum())
+    corrected, info = cascade(alice, bob, qber, rng=np.random.default_rng(seed))
+    residual = int((corrected != alice).sum())
+    assert info["residual_errors"] == residual
+    assert info["corrections"] == errors - residual, "every flipped bit must have been an error"
+    assert info["passes"] == DEFAULT_PASSES
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_corrects_typical_error_rate(seed):
+    alice, bob = noisy_keys(np.random.default_rng(seed), 4096, 0.03)
+    corrected, info = cascade(alice, bob, 0.03, rng=np.random.default_rng(seed))
+    assert np.array_equal(corrected, alice), f"{info['residual_errors']} errors left"
+
+def test_leaks_one_parity_per_block_without_errors():
+    n, qber = 1000, 0.03
+    alice = np.random.default_rng(0).integers(0, 2, n, dtype=np.uint8)
+    corrected, info = cascade(alice, alice.copy(), qber, rng=np.random.default_rng(0))
+    size, blocks = initial_block_size(qber, n), 0
+    for _ in range(DEFAULT_PASSES):
+        blocks += -(-n // size)
+        size = min(2 * size, n)
+    assert np.array_equal(corrected, alice)
+    assert info == {"passes": DEFAULT_PASSES, "corrections": 0, "leaked_bits": blocks, "residual_errors": 0}
+
+def test_empty_key():
+    corrected, info = cascade([], [], 0.03)
+    assert len(corrected) == 0
+    assert info == {"passes": 0, "corrections": 0, "leaked_bits": 0, "residual_errors": 0}
+
+def test_does_not_modify_inputs():
+    alice, bob = noisy_keys(np.random.default_rng(1), 500, 0.05)
+    before = bob.copy()
+    cascade(alice, bob, 0.05, rng=np.random.default_rng(1))
+    assert np.array_equal(bob, before)
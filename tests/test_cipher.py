@@ -0,0 +1,58 @@
+'''
+The message cipher (qkd/cipher.py) must decrypt exactly what the browser encrypts
+(xorEncrypt in templates/room.html, mirrored below) and agree with the per-character
+decryption it replaced, for messages shorter than, as long as and longer than the key.
+'''
+
+import base64
+import random
+
+import pytest
+
+from qkd.cipher import key_bytes, xor_bytes, xor_decrypt
+
+KEY_BITS = 256
+SIZES = [0, 1, 31, 32, 33, 100, 10000]
+
+def legacy_decrypt(encrypted_message, binary_key):
+    # The per-message key derivation and chr() loop xor_decrypt replaced
+    key = ''.join([chr(int(binary_key[i:i+8], 2)) for i in range(0, len(binary_key), 8)])
+    decoded_message = base64.b64decode(encrypted_message)
+    return ''.join(chr(decoded_message[i] ^ ord(key[i % len(key)])) for i in range(len(decoded_message)))
+
+def browser_encrypt(message, binary_key):
+    # binaryToAscii + xorEncrypt from room.html
+    key = ''.join(chr(int(binary_key[i:i+8], 2)) for i in range(0, len(binary_key), 8))
+    result = ''.join(chr(ord(c) ^ ord(key[i % len(key)])) for i, c in enumerate(message))
+    return base64.b64encode(result.encode('latin-1')).decode()
+
+@pytest.fixture
+def binary_key():
+    rng = random.Random(KEY_BITS)
+    return ''.join(rng.choice('01') for _ in range(KEY_BITS))
+
+def test_key_bytes(binary_key):
+    key = key_bytes(binary_key)
+    assert len(key) == KEY_BITS // 8
+    assert ''.join(format(byte, '08b') for byte in key) == binary_key
+
+@pytest.mark.parametrize("size", SIZES)
+def test_round_trip(binary_key, size):
+    rng = random.Random(size)
+    message = ''.join(chr(rng.randrange(32, 256)) for _ in range(size))
+    encrypted = browser_encrypt(message, binary_key)
+    assert xor_decrypt(encrypted, key_bytes(binary_key)) == message
+    assert xor_decrypt(encrypted, key_bytes(binary_key)) == legacy_decrypt(encrypted, binary_key)
+
+@pytest.mark.parametrize("size", SIZES)
+def test_matches_legacy_on_arbitrary_bytes(binary_key, size):
+    data = random.Random(size).randbytes(size)
+    encrypted = base64.b64encode(data)
+    assert xor_decrypt(encrypted, key_bytes(binary_key)) == legacy_decrypt(encrypted, binary_key)
+
+@pytest.mark.parametrize("data", [b'', bytearray(b'abc'), memoryview(b'hello world')])
+def test_xor_bytes_is_an_involution(data):
+    key = b'\x01\xff\x10'
+    once = xor_bytes(data, key)
+    assert len(once) == len(data)
+    assert xor_bytes(once, key) == bytes(data)
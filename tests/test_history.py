@@ -0,0 +1,74 @@
+'''
+The per-room ring buffer (history.py): it keeps the last capacity messages in order, pages
+back through them with cursors until the oldest one still held, and its memory estimate
+follows what it holds.
+'''
+
+import pytest
+
+from history import MessageHistory
+
+CAPACITY = 10
+
+def filled(count, capacity=CAPACITY):
+    history = MessageHistory(capacity)
+    for i in range(count):
+        history.append({"name": "ann", "message": f"m{i}"})
+    return history
+
+def texts(messages):
+    return [message["message"] for message in messages]
+
+@pytest.mark.parametrize("count", [0, 1, CAPACITY - 1, CAPACITY, CAPACITY + 1, 3 * CAPACITY + 4])
+def test_keeps_the_last_messages(count):
+    history = filled(count)
+    kept = min(count, CAPACITY)
+    assert len(history) == kept
+    assert history.first_id == count - kept
+    assert texts(history.latest(CAPACITY)) == [f"m{i}" for i in range(count - kept, count)]
+    assert [m["id"] for m in history.latest(3)] == list(range(max(count - kept, count - 3), count))
+    assert history.stats()["total_messages"] == count
+
+def test_append_stamps_messages():
+    message = MessageHistory(CAPACITY).append({"name": "ann", "message": "hi"})
+    assert message["id"] == 0
+    assert isinstance(message["time"], int)
+
+@pytest.mark.parametrize("count, page", [(7, 3), (CAPACITY, 4), (25, 3), (25, CAPACITY)])
+def test_paging_reaches_the_oldest_message(count, page):
+    history = filled(count)
+    messages = history.latest(page)
+    pages = [texts(messages)]
+    cursor = history.cursor(messages)
+    while cursor is not None:
+        messages, cursor = history.before(cursor, page)
+        assert 0 < len(messages) <= page
+        pages.insert(0, texts(messages))
+    assert sum(pages, []) == [f"m{i}" for i in range(history.first_id, count)], "pages must tile the history"
+
+def test_stale_cursor_is_clamped():
+    # Nothing is older than the oldest message kept: a cursor from before it (its messages were
+    # overwritten) gets an empty last page, and a page running into it stops there
+    history = filled(25)
+    messages, cursor = history.before(2, 3)
+    assert messages == [] and cursor is None
+    messages, cursor = history.before(history.first_id + 2, 5)
+    assert texts(messages) == ["m15", "m16"] and cursor is None
+
+def test_cursor_at_the_start():
+    history = filled(5)
+    assert history.cursor(history.latest(CAPACITY)) is None
+    assert history.cursor([]) is None
+    assert history.cursor(history.latest(2)) == 3
+
+def test_memory_estimate_follows_contents():
+    history = filled(CAPACITY)
+    full = history.bytes
+    assert full > 0
+    for i in range(CAPACITY):
+        history.append({"name": "ann", "message": f"x{i}"})
+    assert history.bytes == pytest.approx(full, rel=0.1), "overwritten messages must be subtracted"
+
+def test_zero_capacity_keeps_nothing():
+    history = filled(5, capacity=0)
+    assert len(history) == 0 and history.latest(10) == [] and history.bytes == 0
@@ -0,0 +1,100 @@
+'''
+Key rotation by epoch (keyrotation.py): a rotation starts after every_messages messages
+or every_seconds of key age, the new key is offered next to the old one, and the old one
+is retired only when the client acknowledges the new epoch. Background tasks run inline.
+'''
+
+import pytest
+
+from keyrotation import KeyRotator
+from qkd import key_bytes
+
+KEYS = ["01000001" * 4, "01000010" * 4, "01000011" * 4]
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+@pytest.fixture
+def emitted():
+    return []
+
+def rotator(emitted, clock, every_messages=0, every_seconds=0.0, generate=None):
+    keys = iter(KEYS[1:])
+    rotator = KeyRotator(generate or (lambda: next(keys)), lambda event, data, to: emitted.append((event, data, to)),
+                         every_messages=every_messages, every_seconds=every_seconds, spawn=lambda task: task(), clock=clock)
+    rotator.add("sid", KEYS[0])
+    return rotator
+
+def test_rotates_after_every_messages(emitted, clock):
+    keys = rotator(emitted, clock, every_messages=3)
+    assert [keys.message_sent("sid") for _ in range(3)] == [False, False, True]
+    assert emitted == [("rekey", {"key": KEYS[1], "epoch": 1}, "sid")]
+
+    # Both keys work until the client switches over; the latest acknowledged is the default
+    assert keys.key("sid", 0) == key_bytes(KEYS[0])
+    assert keys.key("sid", 1) == key_bytes(KEYS[1])
+    assert keys.key("sid") == key_bytes(KEYS[0])
+    assert not keys.message_sent("sid"), "no second rotation while one is unacknowledged"
+
+    assert keys.acknowledge("sid", 1)
+    assert keys.key("sid") == key_bytes(KEYS[1])
+    assert keys.key("sid", 0) is None, "the old epoch is retired on the acknowledgement"
+    assert keys.stats()["stale_messages"] == 1
+
+def test_rotates_on_key_age(emitted, clock):
+    keys = rotator(emitted, clock, every_seconds=60)
+    assert not keys.message_sent("sid")
+    clock.now += 61
+    assert keys.message_sent("sid")
+    assert emitted[-1][1]["epoch"] == 1
+
+def test_idle_connections_are_not_rotated(emitted, clock):
+    keys = rotator(emitted, clock, every_seconds=60)
+    clock.now += 3600
+    assert emitted == [], "age is only checked when a message is sent"
+
+def test_epochs_count_up(emitted, clock):
+    keys = rotator(emitted, clock, every_messages=1)
+    for epoch in (1, 2):
+        assert keys.message_sent("sid")
+        assert emitted[-1][1]["epoch"] == epoch
+        assert keys.acknowledge("sid", epoch)
+    assert keys.key("sid") == key_bytes(KEYS[2])
+    stats = keys.stats()
+    assert (stats["started"], stats["offered"], stats["acknowledged"]) == (2, 2, 2)
+
+@pytest.mark.parametrize("epoch", [0, 2, -1])
+def test_bad_acknowledgements_are_ignored(emitted, clock, epoch):
+    keys = rotator(emitted, clock, every_messages=1)
+    keys.message_sent("sid")
+    assert not keys.acknowledge("sid", epoch)
+    assert keys.key("sid", 1) is not None and keys.key("sid", 0) is not None
+    assert not keys.acknowledge("gone", 1)
+
+def test_failed_generation_is_retried(emitted, clock):
+    attempts = []
+    def generate():
+        attempts.append(None)
+        if len(attempts) == 1:
+            raise RuntimeError("channel too noisy")
+        return KEYS[1]
+    keys = rotator(emitted, clock, every_messages=1, generate=generate)
+    assert keys.message_sent("sid")
+    assert emitted == [] and keys.stats()["failures"] == 1
+    assert keys.key("sid") == key_bytes(KEYS[0]), "the old key stays in use"
+    assert keys.message_sent("sid")
+    assert emitted[-1][1] == {"key": KEYS[1], "epoch": 1}
+
+def test_disabled_and_removed(emitted, clock):
+    keys = rotator(emitted, clock)
+    assert not keys.enabled and not keys.message_sent("sid")
+    keys.remove("sid")
+    assert keys.key("sid") is None
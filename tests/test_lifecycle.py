@@ -0,0 +1,73 @@
+'''
+Room codes and the reaper (lifecycle.py): the pool hands out every code exactly once
+before reusing the ones given back (oldest first), and the reaper deletes unjoined,
+empty and idle rooms after their TTLs, returning their codes to the pool.
+'''
+
+import time
+
+import numpy as np
+import pytest
+
+from lifecycle import CodePool, RoomLifecycle, code_from_index, codes_from_indexes
+from roomstore import MemoryRoomStore
+
+@pytest.mark.parametrize("index, code", [(0, "AAAA"), (1, "AAAB"), (26, "AABA"), (26 ** 4 - 1, "ZZZZ")])
+def test_code_from_index(index, code):
+    assert code_from_index(index) == code
+
+def test_codes_from_indexes_matches():
+    indexes = np.random.default_rng(0).permutation(26 ** 4)[:1000]
+    assert [code.decode() for code in codes_from_indexes(indexes)] == [code_from_index(int(i)) for i in indexes]
+
+def test_pool_hands_out_every_code_once():
+    pool = CodePool(length=2, rng=np.random.default_rng(0))
+    codes = [pool.take() for _ in range(26 ** 2)]
+    assert len(set(codes)) == 26 ** 2 and all(len(code) == 2 for code in codes)
+    assert len(pool) == 0 and pool.take() is None
+
+    pool.give_back(codes[5])
+    pool.give_back(codes[1])
+    assert len(pool) == 2
+    assert [pool.take(), pool.take(), pool.take()] == [codes[5], codes[1], None], "oldest returned code first"
+
+def test_returned_codes_wait_for_fresh_ones():
+    pool = CodePool(length=2, rng=np.random.default_rng(0))
+    first = pool.take()
+    pool.give_back(first)
+    assert first not in [pool.take() for _ in range(26 ** 2 - 1)]
+    assert pool.take() == first
+
+@pytest.fixture
+def rooms():
+    offset = [0.0]
+    store = MemoryRoomStore(history_size=10)
+    lifecycle = RoomLifecycle(store, empty_ttl=60, idle_ttl=600, clock=lambda: time.time() + offset[0])
+    return store, lifecycle, offset
+
+def test_reaps_by_reason(rooms):
+    store, lifecycle, offset = rooms
+    unjoined = lifecycle.create("ann")
+    emptied = lifecycle.create("bob")
+    idle = lifecycle.create("cat")
+    store.join(emptied, "bob", "sid-b")
+    store.leave(emptied, "bob", "sid-b")
+    store.join(idle, "cat", "sid-c")
+
+    assert lifecycle.reap() == []
+    offset[0] = 61
+    assert sorted(lifecycle.reap()) == sorted([(unjoined, "unjoined"), (emptied, "empty")])
+    assert store.exists(idle), "a room with members is only reaped once idle"
+    offset[0] = 601
+    assert lifecycle.reap() == [(idle, "idle")]
+    assert store.count() == 0
+    assert lifecycle.reaped == {"unjoined": 1, "empty": 1, "idle": 1}
+
+def test_deleted_codes_go_back_to_the_pool(rooms):
+    store, lifecycle, _ = rooms
+    code = lifecycle.create("ann")
+    free = len(store.codes)
+    assert lifecycle.delete(code, "terminated")
+    assert not lifecycle.delete(code, "terminated"), "already gone"
+    assert len(store.codes) == free + 1
+    assert lifecycle.deleted == {"terminated": 1}
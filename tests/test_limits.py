@@ -0,0 +1,90 @@
+'''
+Token buckets and rate limits (limits.py) on a fake clock: a bucket lets a burst through,
+refills at its rate, and buckets that have refilled are pruned. Also checks which
+X-Forwarded-For entry is taken as the client address.
+'''
+
+import pytest
+
+from limits import RateLimits, TokenBuckets, client_address, parse_limit
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+def takes(buckets, key, count):
+    return sum(buckets.take(key) for _ in range(count))
+
+def test_burst_then_refill(clock):
+    buckets = TokenBuckets(rate=2, burst=5, clock=clock)
+    assert takes(buckets, "sid", 10) == 5, "a full bucket lets burst events through"
+    clock.now += 1
+    assert takes(buckets, "sid", 10) == 2, "then rate events per second"
+    clock.now += 0.25
+    assert not buckets.take("sid"), "half a token isn't enough"
+    clock.now += 0.25
+    assert buckets.take("sid")
+    clock.now += 3600
+    assert takes(buckets, "sid", 10) == 5, "refills up to burst, not beyond"
+
+def test_rejected_events_do_not_spend(clock):
+    buckets = TokenBuckets(rate=1, burst=1, clock=clock)
+    assert buckets.take("sid")
+    for _ in range(100):
+        assert not buckets.take("sid")
+    clock.now += 1
+    assert buckets.take("sid"), "rejections mustn't push the next token further away"
+
+def test_keys_are_independent(clock):
+    buckets = TokenBuckets(rate=1, burst=2, clock=clock)
+    assert takes(buckets, "a", 5) == 2
+    assert takes(buckets, "b", 5) == 2
+
+def test_full_buckets_are_pruned(clock):
+    buckets = TokenBuckets(rate=1, burst=2, clock=clock)
+    for key in range(1023):
+        buckets.take(key)
+    assert len(buckets) == 1023
+    clock.now += 10 # Every bucket has refilled
+    buckets.take("recent")
+    assert len(buckets) == 1, "only the bucket just taken from is kept"
+
+def test_rate_limits_scopes(clock):
+    limits = RateLimits({"message": {"sid": (1, 2), "room": (1, 3), "address": None}}, clock=clock)
+    results = [limits.allow("message", sid=f"s{i % 2}", room="r", address="1.2.3.4") for i in range(5)]
+    assert results == [None, None, None, "room", "sid"]
+    assert limits.allow("connect", address="1.2.3.4") is None, "events without limits always pass"
+    stats = limits.stats()
+    assert stats["allowed"] == {"message": 3, "connect": 1}
+    assert stats["rejected"] == {"message.room": 1, "message.sid": 1}
+
+@pytest.mark.parametrize("value, expected", [
+    ("5,10", (5.0, 10.0)),
+    ("5", (5.0, 5.0)),
+    ("0.5", (0.5, 1.0)),
+    ("0", None),
+    ("", None),
+])
+def test_parse_limit(value, expected):
+    assert parse_limit(value) == expected
+
+@pytest.mark.parametrize("forwarded, trusted, expected", [
+    (None, 0, "10.0.0.1"),
+    ("6.6.6.6", 0, "10.0.0.1"), # Not behind a proxy: the header is the client's own
+    ("1.1.1.1", 1, "1.1.1.1"),
+    ("6.6.6.6, 1.1.1.1", 1, "1.1.1.1"), # The client prepended a fake entry
+    ("6.6.6.6, 1.1.1.1, 2.2.2.2", 2, "1.1.1.1"),
+    ("1.1.1.1", 2, "10.0.0.1"), # Fewer entries than proxies
+])
+def test_client_address(forwarded, trusted, expected):
+    environ = {"REMOTE_ADDR": "10.0.0.1"}
+    if forwarded is not None:
+        environ["HTTP_X_FORWARDED_FOR"] = forwarded
+    assert client_address(environ, trusted) == expected